@@ -1,6 +1,10 @@
 import pandas as pd
 import psycopg2
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 import os
+import tempfile
 import yaml
 
 pg_host = os.getenv('DB_HOST', 'postgres')
@@ -28,6 +32,48 @@ default_parquet_path = os.path.join(
 )
 os.makedirs(default_parquet_path, exist_ok=True)
 
+# Arrow types of the PostgreSQL type OIDs, other types are read as strings
+PG_ARROW_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(),
+    21: pa.int16(),
+    23: pa.int32(),
+    700: pa.float32(),
+    701: pa.float64(),
+    1700: pa.float64(),
+    1082: pa.date32(),
+    1114: pa.timestamp('us'),
+    1184: pa.timestamp('us', tz='UTC')
+}
+
+
+def query_schema(conn, query):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT * FROM ({query}) AS result LIMIT 0")
+        return pa.schema([(col.name, PG_ARROW_TYPES.get(col.type_code, pa.string())) for col in cur.description])
+
+
+def copy_to_arrow(conn, query):
+    # COPY TO STDOUT in CSV, parsed by Arrow's native reader: NULL is an unquoted empty field, '' a quoted one
+    schema = query_schema(conn, query)
+    with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as buffer:
+        with conn.cursor() as cur:
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", buffer)
+        buffer.seek(0)
+        return pa_csv.read_csv(
+            buffer,
+            convert_options=pa_csv.ConvertOptions(
+                column_types=schema,
+                include_columns=schema.names,
+                null_values=[''],
+                strings_can_be_null=True,
+                quoted_strings_can_be_null=False,
+                true_values=['t'],
+                false_values=['f']
+            )
+        )
+
+
 def generate_parquet():
     conn = psycopg2.connect(
         host=pg_host,
@@ -48,11 +94,11 @@ def generate_parquet():
     ]
 
     for table in tables:
-        query = f"SELECT * FROM {table};"
+        query = f"SELECT * FROM {table}"
         print(f"Processing table: {table}")
-        df = pd.read_sql(query, conn)
+        arrow_table = copy_to_arrow(conn, query)
         file_path = os.path.join(default_parquet_path, f"{table}.parquet")
-        df.to_parquet(file_path)
+        pq.write_table(arrow_table, file_path)
         print(f"✅ Saved {table} to {file_path}")
 
     conn.close()
@@ -0,0 +1,137 @@
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from data_dev.config import parquet_storage_config, parquet_writer_profiles
+from data_dev.src.data.parquet_loader import LoadParquet, MARTS, MART_PARTITIONING
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def read_mart(mart):
+    """
+    Reads an exported mart from its configured storage path, without its partition column.
+
+    Args:
+        mart (str): The name of the mart.
+
+    Returns:
+        pa.Table: The rows of the mart.
+    """
+    storage_path = getattr(parquet_storage_config, f"storage_path_{mart}")
+    table = ds.dataset(storage_path, format='parquet', partitioning='hive').to_table()
+    return table.drop_columns([MART_PARTITIONING[mart][0]])
+
+
+def mart_filter(table):
+    """
+    Builds a selective filter on a sort column of a mart: one week of visit dates in the middle of the visit date
+    range, or a single facility type for marts without visit dates.
+
+    Args:
+        table (pa.Table): The rows of the mart.
+
+    Returns:
+        ds.Expression: The filter expression.
+    """
+    if 'visit_date' in table.column_names:
+        first, last = pc.min_max(table.column('visit_date')).values()
+        start = first.as_py() + (last.as_py() - first.as_py()) / 2
+        return (ds.field('visit_date') >= start) & (ds.field('visit_date') < start + timedelta(days=7))
+    return ds.field('facility_type') == table.column('facility_type')[0].as_py()
+
+
+def dataset_size(path):
+    """
+    Sums the sizes of the Parquet files of a dataset.
+
+    Args:
+        path (str): The path of the dataset.
+
+    Returns:
+        Tuple[int, int]: The number of files and their total size in bytes.
+    """
+    sizes = [os.path.getsize(os.path.join(root, name))
+             for root, _, names in os.walk(path) for name in names if name.endswith('.parquet')]
+    return len(sizes), sum(sizes)
+
+
+def benchmark_profile(loader, mart, table, output_path, repeat):
+    """
+    Writes a mart with the loader's writer profile and reads it back with a selective filter.
+
+    Args:
+        loader (LoadParquet): The loader whose writer profile is benchmarked.
+        mart (str): The name of the mart.
+        table (pa.Table): The rows of the mart.
+        output_path (str): The path the mart is written to.
+        repeat (int): The number of filtered reads; the fastest one is reported.
+
+    Returns:
+        dict: The file count, size, write time, filtered-read time and number of rows read.
+    """
+    partition_column, partition_values = MART_PARTITIONING[mart]
+    started = time.perf_counter()
+    sort_columns = loader.sort_columns(table.schema)
+    if sort_columns:
+        table = table.sort_by([(column, 'ascending') for column in sort_columns])
+    loader.write_batches(table.to_batches(max_chunksize=loader.stream_batch_size), table.schema, output_path,
+                         partition_column, partition_values)
+    write_time = time.perf_counter() - started
+    num_files, num_bytes = dataset_size(output_path)
+
+    read_filter = mart_filter(table)
+    read_times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows_read = ds.dataset(output_path, format='parquet', partitioning='hive').to_table(filter=read_filter).num_rows
+        read_times.append(time.perf_counter() - started)
+
+    return {
+        'files': num_files,
+        'size_mb': num_bytes / 1024 ** 2,
+        'write_s': write_time,
+        'filtered_read_s': min(read_times),
+        'rows_read': rows_read
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Parquet writer profiles on the exported marts.')
+    parser.add_argument('--profiles', nargs='+', choices=sorted(parquet_writer_profiles),
+                        default=sorted(parquet_writer_profiles), help='The writer profiles to benchmark.')
+    parser.add_argument('--marts', nargs='+', choices=MARTS, default=MARTS, help='The marts to rewrite.')
+    parser.add_argument('--output', help='Write the rewritten marts into this directory and keep them.')
+    parser.add_argument('--repeat', type=int, default=3, help='The number of filtered reads per profile.')
+    args = parser.parse_args()
+
+    output_dir = args.output or tempfile.mkdtemp(prefix='parquet_writer_benchmark_')
+    results = []
+    try:
+        for mart in args.marts:
+            table = read_mart(mart)
+            logging.info(f"Read {table.num_rows:,} rows of {mart}")
+            for profile_name in args.profiles:
+                loader = LoadParquet(connection_object=None)
+                loader.writer_profile = parquet_writer_profiles[profile_name]
+                output_path = os.path.join(output_dir, profile_name, mart)
+                shutil.rmtree(output_path, ignore_errors=True)
+                result = benchmark_profile(loader, mart, table, output_path, args.repeat)
+                results.append({'mart': mart, 'profile': profile_name, **result})
+    finally:
+        if args.output is None:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    print(pd.DataFrame(results).to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
-from dataclasses import dataclass
-from typing import List, Tuple
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
 
@@ -22,6 +22,26 @@ class PostgresConfig:
     host: str
 
 
+@dataclass
+class PostgresPoolConfig:
+    """
+    A dataclass to store the settings of the PostgreSQL connection pool shared by the pipeline stages.
+
+    Attributes:
+        min_size (int): The number of connections opened upfront.
+        max_size (int): The maximum number of connections open at the same time. The pipeline holds one connection
+                        for its sequential stages, so this has to exceed the largest worker count of a stage.
+        health_check (bool): Run a SELECT 1 on every checked out connection and replace connections that fail it,
+                             e.g. after a server restart or an idle timeout.
+        session_settings (Dict[str, str]): Run-time parameters set on every pooled connection when it is opened,
+                                           e.g. {'work_mem': '64MB', 'statement_timeout': '1h'}.
+    """
+    min_size: int = 1
+    max_size: int = 4
+    health_check: bool = True
+    session_settings: Dict[str, str] = field(default_factory=dict)
+
+
 @dataclass
 class DataGeneratorConfig:
     """
@@ -34,6 +54,19 @@ class DataGeneratorConfig:
         date_format (str): The format of the date strings (e.g., '%Y-%m-%d').
         facility_types (List[str]): A list of facility types (e.g., "Hospital", "Clinic").
         visits_per_day (Tuple[int, int]): A tuple specifying the range (min, max) of visits per day.
+        columnar (bool): Generate visits as NumPy column arrays instead of a list of dictionaries.
+        batch_size (Optional[int]): When set, visits are streamed to the loaders in batches of this size
+                                    instead of being materialized in memory at once.
+        seed (Optional[int]): The master seed. Every shard derives its own seed from it, so runs with the same
+                              seed produce identical data regardless of num_workers. None means unseeded.
+        shard_days (int): The number of days generated per visit shard.
+        patients_per_shard (int): The number of patients generated per patient shard.
+        num_workers (int): The number of processes generating shards in parallel.
+        value_pool_size (Optional[int]): When set, patient and facility attributes are sampled from a cached pool
+                                         of this many Faker values per attribute instead of calling Faker per row.
+        value_pool_cache_dir (str): The directory the Faker value pools are cached in.
+        num_facilities (Optional[int]): The number of facilities to generate. Facility types are assigned
+                                        round-robin. None means one facility per facility type.
     """
     num_patients: int
     start_date: str
@@ -41,6 +74,71 @@ class DataGeneratorConfig:
     date_format: str
     facility_types: List[str]
     visits_per_day: Tuple[int, int]
+    columnar: bool = False
+    batch_size: Optional[int] = None
+    seed: Optional[int] = None
+    shard_days: int = 31
+    patients_per_shard: int = 10_000
+    num_workers: int = 1
+    value_pool_size: Optional[int] = None
+    value_pool_cache_dir: str = '/data_generator_cache'
+    num_facilities: Optional[int] = None
+
+
+@dataclass
+class SrcLoaderConfig:
+    """
+    A dataclass to store settings for loading generated data into the src layer.
+
+    Attributes:
+        method (str): 'copy' streams rows with COPY FROM STDIN (falling back to batched multi-row inserts
+                      where COPY is unavailable), 'insert' executes one INSERT per row.
+        insert_page_size (int): The number of rows per multi-row INSERT statement of the COPY fallback.
+        incremental (bool): When the src tables are already loaded, append the visits of the incremental_days days
+                            following the recorded visit_timestamp watermark instead of doing nothing.
+        incremental_days (int): The number of days appended per incremental run.
+        parallel_workers (int): The number of pooled connections the tables and date slices of visits are loaded
+                                over concurrently. 1 loads everything through the loader's own connection.
+                                Values above 1 require two_phase_commit.
+        two_phase_commit (bool): Commit the parallel loads with PREPARE TRANSACTION / COMMIT PREPARED, so they and
+                                 the watermark become visible all at once or not at all. Requires
+                                 max_prepared_transactions >= parallel_workers on the server, which defaults to 0;
+                                 the Postgres of docker-compose.yml is started with max_prepared_transactions=10.
+        partition_visits (bool): Create src_generated_visits range-partitioned by month. Only takes effect when the
+                                 table is created, an existing unpartitioned table is kept as it is.
+        partition_premake_months (int): The number of monthly partitions created in advance after the loaded period.
+    """
+    method: str = 'copy'
+    insert_page_size: int = 1000
+    incremental: bool = False
+    incremental_days: int = 1
+    parallel_workers: int = 1
+    two_phase_commit: bool = False
+    partition_visits: bool = False
+    partition_premake_months: int = 3
+
+
+@dataclass
+class ParquetWriterProfile:
+    """
+    Layout settings of the Parquet files written by the export.
+
+    Attributes:
+        compression (str): The compression codec, e.g. 'snappy', 'zstd', 'gzip' or 'none'.
+        compression_level (Optional[int]): The codec level, e.g. 1-22 for zstd. None uses the codec default.
+        row_group_size (int): The number of rows per row group. Batches are buffered per partition until a row group
+                              is full, so memory grows with row_group_size times the number of open partitions.
+        use_dictionary (bool): Dictionary encode the columns. Pays off for repeated strings like facility_type.
+        write_statistics (bool): Write min/max statistics per row group, which filtered reads use to skip row groups.
+        sort_by (List[str]): The columns rows are sorted by within every partition, in order. Columns a mart does not
+                             have are ignored. Sorted rows give row groups narrow min/max ranges that filters can skip.
+    """
+    compression: str = 'snappy'
+    compression_level: Optional[int] = None
+    row_group_size: int = 1024 * 1024
+    use_dictionary: bool = True
+    write_statistics: bool = True
+    sort_by: List[str] = field(default_factory=list)
 
 
 @dataclass
@@ -55,10 +153,43 @@ class ParquetStorageConfig:
         The file system path where Parquet files for patient_sum_treatment_cost_per_facility_type will be stored.
         storage_path_facility_name_min_time_spent_per_visit_date (str):
         The file system path where Parquet files for facility_name_min_time_spent_per_visit_date will be stored.
+        streaming (bool):
+        Stream query results from a server-side cursor to the Parquet dataset in Arrow record batches instead of
+        reading each result into one DataFrame, so memory is bounded by stream_batch_size.
+        stream_batch_size (int):
+        The number of rows fetched from the server-side cursor and written per record batch.
+        incremental (bool):
+        Only rewrite the partition_date directories of the months that received new visits since the last export,
+        tracked per mart by the last exported visits.id. The patient mart is always rebuilt in full.
+        export_workers (int):
+        The number of marts exported concurrently over pooled connections, by LoadParquet.load_parquet() and by the
+        per-mart export stages of main.py. 1 exports them one after another.
+        engine (str):
+        'sql' runs one TRANSFORM_* query per mart. 'single_scan' streams the joined visit rows once and computes all
+        marts from that scan with vectorized group-bys, rewriting every mart in full.
+        writer_profile (ParquetWriterProfile):
+        The compression, row-group, encoding, statistics and sort settings of the written files.
+        extraction (str):
+        How streamed query results are read. 'cursor' fetches row tuples from a server-side cursor, 'copy' runs
+        COPY (query) TO STDOUT and parses the CSV output with Arrow's native reader into the declared schema.
+        compaction (bool):
+        After the export, merge the files of every partition directory into files of about compaction_target_file_mb.
+        compaction_target_file_mb (int):
+        The target size of the compacted files in megabytes. Partitions already in as few files as this allows
+        are left untouched.
     """
     storage_path_facility_type_avg_time_spent_per_visit_date: str
     storage_path_patient_sum_treatment_cost_per_facility_type: str
     storage_path_facility_name_min_time_spent_per_visit_date: str
+    streaming: bool = False
+    stream_batch_size: int = 50_000
+    incremental: bool = False
+    export_workers: int = 1
+    engine: str = 'sql'
+    writer_profile: ParquetWriterProfile = field(default_factory=ParquetWriterProfile)
+    extraction: str = 'cursor'
+    compaction: bool = False
+    compaction_target_file_mb: int = 128
 
 
 @dataclass
@@ -70,8 +201,25 @@ class LoadConfig:
         last_date (str): The last date for which data should be successfully loaded.
                          This is typically used to track the progress of incremental data loads.
                          The date should be in the format 'YYYY-MM-DD'.
+        incremental_merge (bool): Merge only source visits newer than the visit_timestamp watermark recorded in
+                                  nf3_load_state instead of the whole src_generated_visits history. Source visits
+                                  at or before the watermark that arrive later are not picked up.
+        partition_visits (bool): Create visits range-partitioned by month. Only takes effect when the table is
+                                 created, an existing unpartitioned table is kept as it is.
+        partition_premake_months (int): The number of monthly partitions created in advance after the merged period.
+        merge_window_months (Optional[int]): When set, visits are merged in windows of this many calendar months,
+                                             each committed separately. Completed windows are recorded in
+                                             nf3_merge_windows, so an interrupted load resumes at the next unfinished
+                                             window. None merges all visits in a single transaction.
+        merge_workers (int): The number of pooled connections the windows are merged over concurrently.
+                             1 merges the windows one after another over the loader's own connection.
     """
     date_scope: str
+    incremental_merge: bool = True
+    partition_visits: bool = False
+    partition_premake_months: int = 3
+    merge_window_months: Optional[int] = None
+    merge_workers: int = 1
 
 
 @dataclass
@@ -88,9 +236,57 @@ class ReportGeneratorConfig:
     parquet_files_path: str
 
 
+@dataclass
+class QueryMetricsConfig:
+    """
+    QueryMetricsConfig is a configuration class for the per-query instrumentation of the pipeline.
+
+    Attributes:
+        enabled (bool): Record wall time, rows and fetched bytes of every query the pipeline executes, per queries.py
+                        constant, and write them to a run metrics JSON file at the end of the run.
+        explain (bool): Also capture EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) of the first execution of every named
+                        statement. The statement is executed an additional time inside a savepoint that is rolled
+                        back, so this roughly doubles the run time.
+        output_dir (str): The directory the run_metrics_<timestamp>.json files are written to.
+    """
+    enabled: bool = False
+    explain: bool = False
+    output_dir: str = '/run_metrics'
+
+
+@dataclass
+class PipelineConfig:
+    """
+    PipelineConfig is a configuration class for the stage runner of main.py.
+
+    Attributes:
+        max_workers (int): The number of stages run concurrently once their inputs are ready.
+        skip_unchanged (bool): Skip stages whose input fingerprint equals the one recorded after their last
+                               successful run.
+        state_path (str): The JSON file the fingerprints of the successful stages are recorded in.
+    """
+    max_workers: int = 1
+    skip_unchanged: bool = False
+    state_path: str = '/pipeline_state/pipeline_state.json'
+
+
 # Instance of LoadConfig
 load_config = LoadConfig(
-    date_scope=datetime.now().date().strftime('%Y-%m-%d')  # Example: '2025-01-01'
+    date_scope=datetime.now().date().strftime('%Y-%m-%d'),  # Example: '2025-01-01'
+    merge_window_months=12,
+    merge_workers=4
+)
+
+# Instance of QueryMetricsConfig
+query_metrics_config = QueryMetricsConfig(
+    enabled=True,
+    explain=False
+)
+
+# Instance of PipelineConfig
+pipeline_config = PipelineConfig(
+    max_workers=3,
+    skip_unchanged=True
 )
 
 # Instance of PostgresConfig
@@ -102,6 +298,24 @@ postgres_config = PostgresConfig(
     host='postgres'  # localhost:localhost, podman_network:postgres
 )
 
+# Instance of PostgresPoolConfig
+postgres_pool_config = PostgresPoolConfig(
+    min_size=1,
+    max_size=5,
+    health_check=True,
+    session_settings={'work_mem': '64MB', 'statement_timeout': '1h'}
+)
+
+# Instance of SrcLoaderConfig
+src_loader_config = SrcLoaderConfig(
+    method='copy',
+    insert_page_size=1000,
+    incremental=False,
+    incremental_days=1,
+    parallel_workers=1,
+    two_phase_commit=False
+)
+
 # Instance of GeneratorConfig
 data_generator_config = DataGeneratorConfig(
     num_patients=30,
@@ -109,9 +323,61 @@ data_generator_config = DataGeneratorConfig(
     end_date='2030-01-01',
     date_format='%Y-%m-%d',
     facility_types=['Hospital', 'Clinic', 'Urgent Care', 'Specialty Center'],
-    visits_per_day=(7, 10)
+    visits_per_day=(7, 10),
+    columnar=True,
+    batch_size=50_000,
+    seed=42,
+    value_pool_size=10_000
 )
 
+
+def scale_factor_profile(scale_factor: int) -> DataGeneratorConfig:
+    """
+    Builds a benchmark data generation profile of the given scale factor.
+
+    SF1 generates 1,000 patients, 4 facilities and 7-10 visits per day over 2000-2030 (about 93k visits).
+    Patients, facilities and visits per day all grow linearly with the scale factor.
+
+    Args:
+        scale_factor (int): The scale factor, e.g. 1, 10 or 100.
+
+    Returns:
+        DataGeneratorConfig: The generation settings of the profile.
+    """
+    return replace(
+        data_generator_config,
+        num_patients=1_000 * scale_factor,
+        num_facilities=4 * scale_factor,
+        visits_per_day=(7 * scale_factor, 10 * scale_factor),
+        columnar=True,
+        batch_size=100_000
+    )
+
+
+# Named scale-factor profiles for benchmarking
+scale_factor_profiles = {
+    f'SF{scale_factor}': scale_factor_profile(scale_factor) for scale_factor in (1, 10, 100, 1000)
+}
+
+# Named Parquet writer profiles. 'default' matches the pyarrow defaults the export used before.
+parquet_writer_profiles = {
+    'default': ParquetWriterProfile(),
+    'sorted': ParquetWriterProfile(
+        row_group_size=128 * 1024,
+        sort_by=['visit_date', 'facility_type']
+    ),
+    'sorted_zstd': ParquetWriterProfile(
+        compression='zstd',
+        compression_level=3,
+        row_group_size=128 * 1024,
+        sort_by=['visit_date', 'facility_type']
+    ),
+    'uncompressed': ParquetWriterProfile(
+        compression='none',
+        use_dictionary=False
+    )
+}
+
 # Instance of ParquetStorageConfig
 parquet_storage_config = ParquetStorageConfig(
     storage_path_facility_type_avg_time_spent_per_visit_date='/parquet_data/'
@@ -119,7 +385,14 @@ parquet_storage_config = ParquetStorageConfig(
     storage_path_patient_sum_treatment_cost_per_facility_type='/parquet_data/'
                                                               'patient_sum_treatment_cost_per_facility_type',
     storage_path_facility_name_min_time_spent_per_visit_date='/parquet_data/'
-                                                             'facility_name_min_time_spent_per_visit_date'
+                                                             'facility_name_min_time_spent_per_visit_date',
+    streaming=True,
+    stream_batch_size=50_000,
+    incremental=True,
+    export_workers=3,
+    writer_profile=parquet_writer_profiles['sorted_zstd'],
+    extraction='copy',
+    compaction=True
 )
 
 # Instance of ReportGeneratorConfig
@@ -0,0 +1,108 @@
+import argparse
+import logging
+import os
+import time
+from dataclasses import replace
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from data_dev.config import scale_factor_profiles
+from data_dev.src.connectors.postgre_connector import PostgresConnectorContextManager
+from data_dev.src.data.data_generator import DataGenerator
+from data_dev.src.data.inject_generated_data_to_src import GeneratedDataLoader
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def log_throughput(name, num_rows, started):
+    """
+    Logs the number of rows produced and the resulting throughput.
+
+    Args:
+        name (str): The name of the produced dataset.
+        num_rows (int): The number of rows produced.
+        started (float): The perf_counter() value when production started.
+    """
+    elapsed = time.perf_counter() - started
+    logging.info(f"{name}: {num_rows:,} rows in {elapsed:.2f}s ({num_rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+def write_parquet(profile, output_dir):
+    """
+    Materializes a scale-factor profile as Parquet files, one per src_generated_* table.
+
+    Visits are streamed batch by batch, so memory use is bounded by the profile's batch size.
+
+    Args:
+        profile (DataGeneratorConfig): The generation settings of the profile.
+        output_dir (str): The directory the Parquet files are written to.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    dg = DataGenerator(profile)
+
+    started = time.perf_counter()
+    facilities = pa.Table.from_pylist(dg.generate_facilities())
+    pq.write_table(facilities, os.path.join(output_dir, 'src_generated_facilities.parquet'))
+    log_throughput('src_generated_facilities', facilities.num_rows, started)
+
+    started = time.perf_counter()
+    patients = dg.generate_patients()
+    patients = pa.table(patients) if isinstance(patients, dict) else pa.Table.from_pylist(patients)
+    pq.write_table(patients, os.path.join(output_dir, 'src_generated_patients.parquet'))
+    log_throughput('src_generated_patients', patients.num_rows, started)
+
+    started = time.perf_counter()
+    num_rows = 0
+    writer = None
+    try:
+        for batch in dg.iter_visit_batches(profile.batch_size):
+            table = pa.table(batch)
+            if writer is None:
+                writer = pq.ParquetWriter(os.path.join(output_dir, 'src_generated_visits.parquet'), table.schema)
+            writer.write_table(table)
+            num_rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    log_throughput('src_generated_visits', num_rows, started)
+
+
+def load_postgres(profile):
+    """
+    Materializes a scale-factor profile in the src_generated_* tables of the configured Postgres database.
+
+    Args:
+        profile (DataGeneratorConfig): The generation settings of the profile.
+    """
+    started = time.perf_counter()
+    with PostgresConnectorContextManager() as connection_object:
+        GeneratedDataLoader(connection_object.get_connection(), generator_config=profile).inject_data()
+    logging.info(f"Injection into Postgres completed in {time.perf_counter() - started:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a scale-factor benchmark dataset.')
+    parser.add_argument('profile', choices=sorted(scale_factor_profiles), help='The scale-factor profile.')
+    parser.add_argument('--output', help='Write the dataset as Parquet files into this directory.')
+    parser.add_argument('--load', action='store_true', help='Inject the dataset into the src_generated_* tables.')
+    parser.add_argument('--workers', type=int, help='The number of generator processes.')
+    parser.add_argument('--seed', type=int, help='The master seed (defaults to the configured seed).')
+    args = parser.parse_args()
+
+    profile = scale_factor_profiles[args.profile]
+    if args.workers is not None:
+        profile = replace(profile, num_workers=args.workers)
+    if args.seed is not None:
+        profile = replace(profile, seed=args.seed)
+
+    if not args.output and not args.load:
+        parser.error('nothing to do: pass --output and/or --load')
+    if args.output:
+        write_parquet(profile, args.output)
+    if args.load:
+        load_postgres(profile)
+
+
+if __name__ == '__main__':
+    main()
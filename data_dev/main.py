@@ -1,50 +1,209 @@
-from src.connectors.postgre_connector import PostgresConnectorContextManager
-from src.data.inject_generated_data_to_src import GeneratedDataLoader
-from src.data.nf3_loader import NF3Loader
-from src.data.parquet_loader import LoadParquet
-from src.reporting.report_generator import ReportGenerator
-
 import logging
-import warnings
+import os
+import sys
+import threading
+from dataclasses import asdict
+
+from data_dev.config import (load_config, parquet_storage_config, pipeline_config, postgres_pool_config,
+                             query_metrics_config, report_generator_config, src_loader_config)
+from data_dev.queries import SELECT_NF3_FINGERPRINT_QUERY, SELECT_SRC_FINGERPRINT_QUERY
+from data_dev.src.connectors.postgre_connector import PostgresConnectionPool, PostgresConnectorContextManager
+from data_dev.src.data.inject_generated_data_to_src import GeneratedDataLoader
+from data_dev.src.data.nf3_loader import NF3Loader
+from data_dev.src.data.parquet_compactor import ParquetCompactor
+from data_dev.src.data.parquet_loader import MART_PARTITIONING, MARTS, LoadParquet
+from data_dev.src.monitoring.query_metrics import run_metrics
+from data_dev.src.pipeline.fingerprints import files_fingerprint, query_fingerprint, rows_fingerprint
+from data_dev.src.pipeline.runner import FAILED, PipelineRunner, Stage
+from data_dev.src.reporting.report_generator import ReportGenerator
 
-warnings.filterwarnings("ignore")
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+def pool_size():
+    """
+    Returns the size of the pool shared by the stages: the configured max_size, raised if needed so that the stage
+    with the most workers can check out all of them next to its own connection, and every concurrently running stage
+    gets a connection.
+
+    Returns:
+        int: The maximum number of pooled connections.
+    """
+    max_workers = max(src_loader_config.parallel_workers, load_config.merge_workers,
+                      parquet_storage_config.export_workers)
+    return max(postgres_pool_config.max_size, max_workers + 1, pipeline_config.max_workers)
+
+
+def known(**parts):
+    """
+    Combines the parts of a fingerprint.
+
+    Args:
+        **parts: The parts by name.
+
+    Returns:
+        Optional[dict]: The parts, or None if any of them could not be determined.
+    """
+    return None if any(part is None for part in parts.values()) else parts
+
+
+def inject_src(pool):
+    """
+    Loads generated data into the src layer over a pooled connection.
+    """
+    with PostgresConnectorContextManager(pool=pool) as connection_object:
+        GeneratedDataLoader(connection_object.get_connection(), pool=pool).inject_data()
+
+
+def load_nf3(pool):
+    """
+    Merges the src layer into the 3NF tables over a pooled connection.
+    """
+    with PostgresConnectorContextManager(pool=pool) as connection_object:
+        NF3Loader(connection_object.get_connection(), pool=pool).load_data()
+
+
+def export_config(mart):
+    """
+    Collects the settings that shape the exported files of a mart.
+
+    Args:
+        mart (str): The mart name, see MARTS.
+
+    Returns:
+        dict: The settings by name.
+    """
+    return {
+        'engine': parquet_storage_config.engine,
+        'extraction': parquet_storage_config.extraction,
+        'streaming': parquet_storage_config.streaming,
+        'partition_column': MART_PARTITIONING[mart][0],
+        'writer_profile': asdict(parquet_storage_config.writer_profile)
+    }
+
+
+def export_mart(pool, mart, export_slots):
+    """
+    Exports one mart to Parquet over a pooled connection, once one of the export slots is free.
+    """
+    with export_slots:
+        with PostgresConnectorContextManager(pool=pool) as connection_object:
+            LoadParquet(connection_object, pool=pool).export_mart(mart)
+
+
+def export_marts_single_scan(pool):
+    """
+    Exports all marts to Parquet from a single scan over a pooled connection.
+    """
+    with PostgresConnectorContextManager(pool=pool) as connection_object:
+        LoadParquet(connection_object, pool=pool).load_parquet_single_scan()
+
+
+def build_stages(pool):
+    """
+    Declares the stages of the pipeline and the datasets they read and write.
+
+    src_tables -> nf3_tables -> one parquet_<mart> dataset per mart (exported concurrently, at most export_workers
+    at a time, or by a single stage with the 'single_scan' engine) -> compacted_marts, if compaction is enabled ->
+    report.
+
+    The fingerprints cover the inputs and outputs of every stage: row counts, watermarks and change counters of the
+    tables, the rows per partition and the export settings of the exported datasets, and the data files of the
+    datasets read. The exports are fingerprinted by rows rather than files, as the compaction rewrites their files.
+    With incremental src loading the injection appends new days on every run and has no fingerprint.
+
+    Args:
+        pool (PostgresConnectionPool): The pool the stages check their connections out of.
+
+    Returns:
+        List[Stage]: The stages.
+    """
+    def src_tables():
+        return query_fingerprint(SELECT_SRC_FINGERPRINT_QUERY, pool)
+
+    def nf3_tables():
+        return query_fingerprint(SELECT_NF3_FINGERPRINT_QUERY, pool)
+
+    def storage_path(mart):
+        return getattr(parquet_storage_config, f"storage_path_{mart}")
+
+    def exported(mart):
+        return {'rows': rows_fingerprint(storage_path(mart)), 'config': export_config(mart)}
+
+    export_slots = threading.BoundedSemaphore(parquet_storage_config.export_workers)
+
+    stages = [
+        Stage(
+            name='inject_src',
+            run=lambda: inject_src(pool),
+            outputs=['src_tables'],
+            fingerprint=None if src_loader_config.incremental else src_tables
+        ),
+        Stage(
+            name='load_nf3',
+            run=lambda: load_nf3(pool),
+            inputs=['src_tables'],
+            outputs=['nf3_tables'],
+            fingerprint=lambda: known(src=src_tables(), nf3=nf3_tables(), date_scope=load_config.date_scope)
+        )
+    ]
+
+    if parquet_storage_config.engine == 'single_scan':
+        stages.append(Stage(
+            name='export_marts',
+            run=lambda: export_marts_single_scan(pool),
+            inputs=['nf3_tables'],
+            outputs=[f"parquet_{mart}" for mart in MARTS],
+            fingerprint=lambda: known(nf3=nf3_tables(), exported={mart: exported(mart) for mart in MARTS})
+        ))
+    else:
+        for mart in MARTS:
+            stages.append(Stage(
+                name=f"export_{mart}",
+                run=lambda mart=mart: export_mart(pool, mart, export_slots),
+                inputs=['nf3_tables'],
+                outputs=[f"parquet_{mart}"],
+                fingerprint=lambda mart=mart: known(nf3=nf3_tables(), exported=exported(mart))
+            ))
+
+    report_inputs = ['parquet_facility_type_avg_time_spent_per_visit_date']
+    if parquet_storage_config.compaction:
+        # The compaction rewrites the exported datasets, so everything reading them waits for it
+        stages.append(Stage(
+            name='compact_marts',
+            run=lambda: ParquetCompactor().compact_marts(),
+            inputs=[f"parquet_{mart}" for mart in MARTS],
+            outputs=['compacted_marts'],
+            fingerprint=lambda: {mart: files_fingerprint(storage_path(mart)) for mart in MARTS}
+        ))
+        report_inputs.append('compacted_marts')
+
+    report_path = os.path.join(report_generator_config.storage_path, 'report.html')
+    stages.append(Stage(
+        name='generate_report',
+        run=lambda: ReportGenerator().generate_report(),
+        inputs=report_inputs,
+        outputs=['report'],
+        fingerprint=lambda: {'data': files_fingerprint(report_generator_config.parquet_files_path),
+                             'report': os.path.isfile(report_path)}
+    ))
+    return stages
+
+
 def main():
-    with PostgresConnectorContextManager() as connection_object:
-        # generate and load generated data into src layer
-        try:
-            logging.info(f"Starting data generation and injection into Postgres...")
-            gdi = GeneratedDataLoader(connection_object.get_connection())
-            gdi.inject_data()
-            logging.info(f"Data generation and injection into Postgres Completed!")
-        except Exception as e:
-            logging.exception(f"Data generation and injection into Postgres FAILED: {e}")
-        # load to nf3 layer
-        try:
-            logging.info(f"Starting transformation of injected data...")
-            l3nf = NF3Loader(connection_object.get_connection())
-            l3nf.load_data()
-            logging.info(f"Transformation of injected data completed!")
-        except Exception as e:
-            logging.exception(f"Transformation of injected data FAILED: {e}")
-        # load parquet files
-        try:
-            logging.info(f"Starting transformation of parquet files...")
-            ld = LoadParquet(connection_object)
-            ld.load_parquet()
-            logging.info(f"Transformation of parquet files completed!")
-        except Exception as e:
-            logging.exception(f"Transformation of parquet files FAILED: {e}")
-        try:
-            logging.info(f"Starting report generation...")
-            rp = ReportGenerator()
-            rp.generate_report()
-            logging.info(f"Report generation completed!")
-        except Exception as e:
-            logging.exception(f"Report generation FAILED: {e}")
+    """
+    Runs the pipeline stages over a shared connection pool, see build_stages() and PipelineRunner.
+
+    Returns:
+        int: The exit code, 1 if a stage failed.
+    """
+    with PostgresConnectionPool(max_size=pool_size()) as pool:
+        results = PipelineRunner(build_stages(pool)).run()
+    if query_metrics_config.enabled:
+        run_metrics.log_summary()
+        run_metrics.write()
+    return 1 if any(result.status == FAILED for result in results) else 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
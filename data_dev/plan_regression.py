@@ -0,0 +1,255 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import date, datetime
+
+import psycopg2
+
+from data_dev import queries
+from data_dev.config import load_config, postgres_config, scale_factor_profiles
+from data_dev.src.connectors.postgre_connector import PostgresConnectorContextManager
+from data_dev.src.data.partitions import add_months, month_start
+from data_dev.src.monitoring.query_metrics import EXPLAINABLE_STATEMENTS, PLACEHOLDER_PATTERN
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+EXPLAIN_QUERY_PREFIX = "EXPLAIN (FORMAT JSON) "
+RELATION_ROWS_QUERY = "SELECT relname, GREATEST(reltuples, 0)::BIGINT FROM pg_class WHERE relname = ANY(%(names)s)"
+
+DEFAULT_BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plan_baselines')
+
+# Plan node properties that make up the structure of a plan. Costs and row estimates are compared separately.
+STRUCTURE_KEYS = ('Node Type', 'Join Type', 'Strategy', 'Partial Mode', 'Relation Name', 'Index Name',
+                  'Parent Relationship')
+
+
+def plan_parameters(cursor):
+    """
+    Builds the parameter values the queries are explained with: the configured date_scope, no watermark, the twelve
+    months before the date_scope as merge/export window, and all visits as id range.
+
+    Args:
+        cursor (object): A database cursor object.
+
+    Returns:
+        dict: The parameter values by placeholder name.
+    """
+    date_scope = date.fromisoformat(load_config.date_scope)
+    window_end = add_months(month_start(date_scope), 1)
+    try:
+        cursor.execute(queries.SELECT_VISITS_MAX_ID_QUERY)
+        max_visit_id = cursor.fetchone()[0]
+    except psycopg2.Error:
+        cursor.connection.rollback()
+        max_visit_id = 0
+    return {
+        'date_scope': date_scope,
+        'watermark': None,
+        'window_start': add_months(window_end, -12),
+        'window_end': window_end,
+        'last_visit_id': 0,
+        'max_visit_id': max_visit_id,
+        'table_name': 'visits',
+        'index_name': 'visits_natural_key'
+    }
+
+
+def named_queries(params):
+    """
+    Returns the queries.py constants that can be explained with the given parameters.
+
+    Statements EXPLAIN does not accept, identifier templates ({name}) and statements with placeholders missing
+    from params, such as the single-row inserts, are left out.
+
+    Args:
+        params (dict): The parameter values by placeholder name.
+
+    Returns:
+        Dict[str, str]: The SQL of every explainable query by constant name.
+    """
+    selected = {}
+    for name, text in vars(queries).items():
+        if not name.isupper() or not isinstance(text, str):
+            continue
+        if not text.lstrip().upper().startswith(EXPLAINABLE_STATEMENTS):
+            continue
+        placeholders = PLACEHOLDER_PATTERN.findall(text)
+        if any(not placeholder.startswith('%(') or placeholder[2:-2] not in params for placeholder in placeholders):
+            continue
+        selected[name] = text
+    return selected
+
+
+def plan_structure(node, depth=0):
+    """
+    Flattens a plan tree into the structural properties of its nodes, in depth-first order.
+
+    Args:
+        node (dict): A plan node of EXPLAIN (FORMAT JSON).
+        depth (int): The depth of the node. Defaults to 0.
+
+    Returns:
+        List[str]: One line per node, indented by depth, e.g. '  Hash Join (Inner)'.
+    """
+    properties = [str(node[key]) for key in STRUCTURE_KEYS[1:] if key in node]
+    line = '  ' * depth + node['Node Type'] + (f" ({', '.join(properties)})" if properties else '')
+    lines = [line]
+    for child in node.get('Plans', []):
+        lines.extend(plan_structure(child, depth + 1))
+    return lines
+
+
+def plan_relations(node):
+    """
+    Collects the relations a plan reads.
+
+    Args:
+        node (dict): A plan node of EXPLAIN (FORMAT JSON).
+
+    Returns:
+        Set[str]: The relation names.
+    """
+    relations = {node['Relation Name']} if 'Relation Name' in node else set()
+    for child in node.get('Plans', []):
+        relations |= plan_relations(child)
+    return relations
+
+
+def capture_plans(cursor):
+    """
+    Explains every named query and records the structure, the estimated cost and the size of the relations read.
+
+    Every EXPLAIN runs in its own transaction, which is rolled back. Queries failing to explain, e.g. because a
+    table does not exist yet, are skipped with a warning.
+
+    Args:
+        cursor (object): A database cursor object.
+
+    Returns:
+        Dict[str, dict]: The plan summary of every query by constant name.
+    """
+    params = plan_parameters(cursor)
+    plans = {}
+    for name, text in sorted(named_queries(params).items()):
+        try:
+            cursor.execute(EXPLAIN_QUERY_PREFIX + text.strip().rstrip(';'), params)
+            plan = cursor.fetchone()[0][0]['Plan']
+            relations = sorted(plan_relations(plan))
+            cursor.execute(RELATION_ROWS_QUERY, {'names': relations})
+            relation_rows = sum(row[1] for row in cursor.fetchall())
+        except psycopg2.Error as e:
+            logging.warning(f"Skipping {name}: {e}".strip())
+            continue
+        finally:
+            cursor.connection.rollback()
+        plans[name] = {
+            'structure': plan_structure(plan),
+            'total_cost': plan['Total Cost'],
+            'plan_rows': plan['Plan Rows'],
+            'relations': relations,
+            'relation_rows': relation_rows,
+            'plan': plan
+        }
+    return plans
+
+
+def compare_plans(baseline, current, cost_tolerance):
+    """
+    Compares the current plans with a baseline.
+
+    A query regresses if its plan structure changed, or if its estimated cost grew by more than
+    (1 + cost_tolerance) times the growth of the rows in the relations it reads.
+
+    Args:
+        baseline (Dict[str, dict]): The baseline plan summaries by query name.
+        current (Dict[str, dict]): The current plan summaries by query name.
+        cost_tolerance (float): The tolerated excess of cost growth over row growth, e.g. 0.5 for 50%.
+
+    Returns:
+        List[str]: A description of every regression.
+    """
+    regressions = []
+    for name in sorted(baseline.keys() | current.keys()):
+        if name not in current:
+            regressions.append(f"{name}: no longer explained")
+            continue
+        if name not in baseline:
+            logging.info(f"{name}: not in the baseline")
+            continue
+        old, new = baseline[name], current[name]
+        if old['structure'] != new['structure']:
+            regressions.append(f"{name}: plan changed\n    baseline:\n      " + '\n      '.join(old['structure'])
+                               + "\n    current:\n      " + '\n      '.join(new['structure']))
+        if old['total_cost'] > 0 and old['relation_rows'] > 0:
+            cost_growth = new['total_cost'] / old['total_cost']
+            row_growth = max(new['relation_rows'], 1) / old['relation_rows']
+            if cost_growth > row_growth * (1 + cost_tolerance):
+                regressions.append(f"{name}: cost grew {cost_growth:.2f}x ({old['total_cost']:,.0f} -> "
+                                   f"{new['total_cost']:,.0f}) while rows grew {row_growth:.2f}x")
+    return regressions
+
+
+def baseline_path(baseline_dir, profile):
+    """
+    Returns the path of the baseline file of a scale-factor profile.
+
+    Args:
+        baseline_dir (str): The directory of the baselines.
+        profile (str): The scale-factor profile, e.g. 'SF10'.
+
+    Returns:
+        str: The path of the baseline file.
+    """
+    return os.path.join(baseline_dir, f"{profile}.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Capture EXPLAIN baselines of the pipeline queries, or check the current plans against them. '
+                    'Load the dataset of the profile first, e.g. with generate_dataset.py --load and main.py.'
+    )
+    parser.add_argument('command', choices=['capture', 'check'], help='Store a baseline or check against one.')
+    parser.add_argument('profile', choices=sorted(scale_factor_profiles), help='The scale-factor profile loaded.')
+    parser.add_argument('--baseline', choices=sorted(scale_factor_profiles),
+                        help='The profile whose baseline is checked against (defaults to profile).')
+    parser.add_argument('--baseline-dir', default=DEFAULT_BASELINE_DIR, help='The directory of the baselines.')
+    parser.add_argument('--cost-tolerance', type=float, default=0.5,
+                        help='The tolerated excess of cost growth over row growth (defaults to 0.5).')
+    parser.add_argument('--host', help='Override the configured Postgres host, e.g. localhost.')
+    parser.add_argument('--port', type=int, help='Override the configured Postgres port, e.g. 5434.')
+    args = parser.parse_args()
+
+    if args.host is not None:
+        postgres_config.host = args.host
+    if args.port is not None:
+        postgres_config.port = args.port
+
+    with PostgresConnectorContextManager() as connection_object:
+        with connection_object.get_connection().cursor() as cursor:
+            plans = capture_plans(cursor)
+    logging.info(f"Explained {len(plans)} queries")
+
+    if args.command == 'capture':
+        os.makedirs(args.baseline_dir, exist_ok=True)
+        path = baseline_path(args.baseline_dir, args.profile)
+        with open(path, 'w') as baseline_file:
+            json.dump({'profile': args.profile, 'captured_at': datetime.now().isoformat(), 'queries': plans},
+                      baseline_file, indent=2)
+        logging.info(f"Stored the baseline in {path}")
+        return
+
+    path = baseline_path(args.baseline_dir, args.baseline or args.profile)
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare_plans(baseline['queries'], plans, args.cost_tolerance)
+    for regression in regressions:
+        logging.warning(regression)
+    logging.info(f"{len(regressions)} plan regressions against the {baseline['profile']} baseline of "
+                 f"{baseline['captured_at']}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
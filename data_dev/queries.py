@@ -32,6 +32,49 @@ CREATE TABLE IF NOT EXISTS src_generated_visits (
 );
 """
 
+CREATE_SRC_GENERATED_VISITS_PARTITIONED_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS src_generated_visits (
+    patient_id INT NOT NULL, 
+    facility_id INT NOT NULL, 
+    visit_timestamp TIMESTAMP NOT NULL, 
+    treatment_cost NUMERIC(10, 2) NOT NULL, 
+    duration_minutes INT NOT NULL
+) PARTITION BY RANGE (visit_timestamp);
+"""
+
+CREATE_SRC_GENERATED_LOAD_STATE_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS src_generated_load_state (
+    table_name VARCHAR(100) PRIMARY KEY,
+    last_visit_timestamp TIMESTAMP NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+"""
+
+SELECT_SRC_GENERATED_WATERMARK_QUERY = """
+SELECT last_visit_timestamp
+FROM src_generated_load_state
+WHERE table_name = 'src_generated_visits';
+"""
+
+SELECT_SRC_GENERATED_VISITS_MAX_TIMESTAMP_QUERY = """
+SELECT MAX(visit_timestamp) FROM src_generated_visits;
+"""
+
+SELECT_SRC_FINGERPRINT_QUERY = """
+SELECT
+    (SELECT COUNT(*) FROM src_generated_facilities),
+    (SELECT COUNT(*) FROM src_generated_patients),
+    (SELECT last_visit_timestamp FROM src_generated_load_state WHERE table_name = 'src_generated_visits');
+"""
+
+UPSERT_SRC_GENERATED_WATERMARK_QUERY = """
+INSERT INTO src_generated_load_state (table_name, last_visit_timestamp)
+VALUES ('src_generated_visits', %(last_visit_timestamp)s)
+ON CONFLICT (table_name) DO UPDATE
+SET last_visit_timestamp = GREATEST(src_generated_load_state.last_visit_timestamp, EXCLUDED.last_visit_timestamp),
+    updated_at = NOW();
+"""
+
 INSERT_SRC_GENERATED_FACILITIES_QUERY = """
 INSERT INTO src_generated_facilities (facility_id, facility_name, facility_type, address, city, state)
 VALUES (%(facility_id)s, %(facility_name)s, %(facility_type)s, %(address)s, %(city)s, %(state)s)
@@ -47,6 +90,12 @@ INSERT INTO src_generated_visits (patient_id, facility_id, visit_timestamp, trea
 VALUES (%(patient_id)s, %(facility_id)s, %(visit_timestamp)s, %(treatment_cost)s, %(duration_minutes)s)
 """
 
+SRC_GENERATED_FACILITIES_COLUMNS = ['facility_id', 'facility_name', 'facility_type', 'address', 'city', 'state']
+
+SRC_GENERATED_PATIENTS_COLUMNS = ['patient_id', 'first_name', 'last_name', 'date_of_birth', 'address']
+
+SRC_GENERATED_VISITS_COLUMNS = ['patient_id', 'facility_id', 'visit_timestamp', 'treatment_cost', 'duration_minutes']
+
 # 3NF LAYER
 
 
@@ -86,9 +135,26 @@ CREATE TABLE IF NOT EXISTS visits (
 );
 """
 
+CREATE_VISITS_PARTITIONED_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS visits (
+    id SERIAL, -- Auto-incrementing id
+    patient_id INT NOT NULL, -- Foreign key referencing the patients table
+    facility_id INT NOT NULL, -- Foreign key referencing the facilities table
+    visit_timestamp TIMESTAMP NOT NULL, -- Timestamp of the visit, the partition key
+    treatment_cost NUMERIC(10, 2) NOT NULL, -- Cost of the treatment
+    duration_minutes INT NOT NULL, -- Duration of the visit in minutes
+    PRIMARY KEY (id, visit_timestamp), -- Keys of partitioned tables have to include the partition key
+    FOREIGN KEY (patient_id) REFERENCES patients(id) ON DELETE CASCADE,
+    FOREIGN KEY (facility_id) REFERENCES facilities(id) ON DELETE CASCADE
+) PARTITION BY RANGE (visit_timestamp);
+"""
+
 MERGE_FACILITIES_QUERY = """
 MERGE INTO facilities AS target
-USING public.src_generated_facilities AS source
+USING (
+    SELECT DISTINCT ON (facility_id) *
+    FROM src_generated_facilities
+) AS source
 ON target.external_id = source.facility_id
 WHEN MATCHED THEN 
     DO NOTHING
@@ -99,7 +165,10 @@ WHEN NOT MATCHED THEN
 
 MERGE_PATIENTS_QUERY = """
 MERGE INTO patients AS target
-USING public.src_generated_patients AS source
+USING (
+    SELECT DISTINCT ON (patient_id) *
+    FROM src_generated_patients
+) AS source
 ON target.external_id = source.patient_id
 WHEN MATCHED THEN 
     DO NOTHING
@@ -110,7 +179,57 @@ WHEN NOT MATCHED THEN
 
 MERGE_VISITS_QUERY = """
 WITH src_visits AS (
-    SELECT 
+    SELECT DISTINCT ON (f.id, p.id, sgv.visit_timestamp)
+        f.id AS facility_id,
+        p.id AS patient_id,
+        sgv.visit_timestamp,
+        sgv.treatment_cost,
+        sgv.duration_minutes 
+    FROM src_generated_visits sgv 
+    JOIN facilities f 
+        ON sgv.facility_id = f.external_id 
+    JOIN patients p
+        ON sgv.patient_id = p.external_id 
+    WHERE sgv.visit_timestamp < %(date_scope)s::date + 1
+)
+MERGE INTO visits AS target
+USING src_visits AS source
+ON target.facility_id = source.facility_id
+   AND target.patient_id = source.patient_id
+   AND target.visit_timestamp = source.visit_timestamp
+   AND target.visit_timestamp < %(date_scope)s::date + 1 -- lets partitioned targets prune to the merged range
+WHEN MATCHED THEN
+    DO NOTHING
+WHEN NOT MATCHED THEN
+    INSERT (facility_id, patient_id, visit_timestamp, treatment_cost, duration_minutes)
+    VALUES (source.facility_id, source.patient_id, source.visit_timestamp, source.treatment_cost, source.duration_minutes);
+"""
+
+CREATE_NF3_LOAD_STATE_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS nf3_load_state (
+    table_name VARCHAR(100) PRIMARY KEY, -- Name of the 3NF table
+    last_visit_timestamp TIMESTAMP NOT NULL, -- Source visit_timestamp up to which the table is merged
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW() -- Time of the last watermark update
+);
+"""
+
+SELECT_NF3_WATERMARK_QUERY = """
+SELECT last_visit_timestamp
+FROM nf3_load_state
+WHERE table_name = 'visits';
+"""
+
+UPSERT_NF3_WATERMARK_QUERY = """
+INSERT INTO nf3_load_state (table_name, last_visit_timestamp)
+VALUES ('visits', %(last_visit_timestamp)s)
+ON CONFLICT (table_name) DO UPDATE
+SET last_visit_timestamp = EXCLUDED.last_visit_timestamp,
+    updated_at = NOW();
+"""
+
+MERGE_VISITS_INCREMENTAL_QUERY = """
+WITH src_visits AS (
+    SELECT DISTINCT ON (f.id, p.id, sgv.visit_timestamp)
         f.id AS facility_id,
         p.id AS patient_id,
         sgv.visit_timestamp,
@@ -121,13 +240,16 @@ WITH src_visits AS (
         ON sgv.facility_id = f.external_id 
     JOIN patients p
         ON sgv.patient_id = p.external_id 
-    WHERE visit_timestamp::date <= %(date_scope)s
+    WHERE sgv.visit_timestamp > COALESCE(%(watermark)s, '-infinity'::timestamp)
+        AND sgv.visit_timestamp < %(date_scope)s::date + 1
 )
 MERGE INTO visits AS target
 USING src_visits AS source
 ON target.facility_id = source.facility_id
    AND target.patient_id = source.patient_id
    AND target.visit_timestamp = source.visit_timestamp
+   AND target.visit_timestamp > COALESCE(%(watermark)s, '-infinity'::timestamp) -- lets partitioned targets prune
+   AND target.visit_timestamp < %(date_scope)s::date + 1 -- to the merged range
 WHEN MATCHED THEN
     DO NOTHING
 WHEN NOT MATCHED THEN
@@ -135,6 +257,125 @@ WHEN NOT MATCHED THEN
     VALUES (source.facility_id, source.patient_id, source.visit_timestamp, source.treatment_cost, source.duration_minutes);
 """
 
+SELECT_SRC_VISITS_MAX_TIMESTAMP_IN_SCOPE_QUERY = """
+SELECT MAX(visit_timestamp)
+FROM src_generated_visits
+WHERE visit_timestamp > COALESCE(%(watermark)s, '-infinity'::timestamp)
+    AND visit_timestamp < %(date_scope)s::date + 1;
+"""
+
+SELECT_SRC_VISITS_TIMESTAMP_RANGE_QUERY = """
+SELECT MIN(visit_timestamp), MAX(visit_timestamp)
+FROM src_generated_visits
+WHERE visit_timestamp > COALESCE(%(watermark)s, '-infinity'::timestamp)
+    AND visit_timestamp < %(date_scope)s::date + 1;
+"""
+
+MERGE_VISITS_WINDOW_QUERY = """
+WITH src_visits AS (
+    SELECT DISTINCT ON (f.id, p.id, sgv.visit_timestamp)
+        f.id AS facility_id,
+        p.id AS patient_id,
+        sgv.visit_timestamp,
+        sgv.treatment_cost,
+        sgv.duration_minutes 
+    FROM src_generated_visits sgv 
+    JOIN facilities f 
+        ON sgv.facility_id = f.external_id 
+    JOIN patients p
+        ON sgv.patient_id = p.external_id 
+    WHERE sgv.visit_timestamp > COALESCE(%(watermark)s, '-infinity'::timestamp)
+        AND sgv.visit_timestamp >= %(window_start)s
+        AND sgv.visit_timestamp < %(window_end)s
+)
+MERGE INTO visits AS target
+USING src_visits AS source
+ON target.facility_id = source.facility_id
+   AND target.patient_id = source.patient_id
+   AND target.visit_timestamp = source.visit_timestamp
+   AND target.visit_timestamp >= %(window_start)s -- lets partitioned targets prune to the window
+   AND target.visit_timestamp < %(window_end)s
+WHEN MATCHED THEN
+    DO NOTHING
+WHEN NOT MATCHED THEN
+    INSERT (facility_id, patient_id, visit_timestamp, treatment_cost, duration_minutes)
+    VALUES (source.facility_id, source.patient_id, source.visit_timestamp, source.treatment_cost, source.duration_minutes);
+"""
+
+SELECT_SRC_VISITS_MAX_TIMESTAMP_IN_WINDOW_QUERY = """
+SELECT MAX(visit_timestamp)
+FROM src_generated_visits
+WHERE visit_timestamp > COALESCE(%(watermark)s, '-infinity'::timestamp)
+    AND visit_timestamp >= %(window_start)s
+    AND visit_timestamp < %(window_end)s;
+"""
+
+CREATE_NF3_MERGE_WINDOWS_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS nf3_merge_windows (
+    window_start TIMESTAMP NOT NULL, -- Inclusive lower bound of the merged visit_timestamp window
+    window_end TIMESTAMP NOT NULL, -- Exclusive upper bound of the merged visit_timestamp window
+    merged_rows BIGINT NOT NULL, -- Number of visits the window inserted
+    last_visit_timestamp TIMESTAMP, -- Latest source visit_timestamp of the window, NULL if it was empty
+    completed_at TIMESTAMP NOT NULL DEFAULT NOW(), -- Commit time of the window
+    PRIMARY KEY (window_start, window_end)
+);
+"""
+
+SELECT_NF3_MERGE_WINDOWS_QUERY = """
+SELECT window_start, window_end, last_visit_timestamp
+FROM nf3_merge_windows;
+"""
+
+INSERT_NF3_MERGE_WINDOW_QUERY = """
+INSERT INTO nf3_merge_windows (window_start, window_end, merged_rows, last_visit_timestamp)
+VALUES (%(window_start)s, %(window_end)s, %(merged_rows)s, %(last_visit_timestamp)s);
+"""
+
+DELETE_NF3_MERGE_WINDOWS_QUERY = """
+DELETE FROM nf3_merge_windows;
+"""
+
+# PARTITION MANAGEMENT
+
+SELECT_IS_PARTITIONED_QUERY = """
+SELECT EXISTS (
+    SELECT 1
+    FROM pg_partitioned_table
+    WHERE partrelid = to_regclass(%(table_name)s)
+);
+"""
+
+CREATE_MONTHLY_PARTITION_QUERY = """
+CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table}
+FOR VALUES FROM (%(start)s) TO (%(end)s);
+"""
+
+# 3NF SCHEMA MANAGEMENT
+
+# (index name, table, columns, unique) of the indexes maintained on the 3NF tables and their sources.
+# The unique indexes enforce the natural keys the MERGE queries match on, the others serve the
+# joins and filters of the MERGE and TRANSFORM_* queries.
+NF3_INDEXES = [
+    ('facilities_external_id_key', 'facilities', ['external_id'], True),
+    ('patients_external_id_key', 'patients', ['external_id'], True),
+    ('visits_natural_key', 'visits', ['facility_id', 'patient_id', 'visit_timestamp'], True),
+    ('visits_patient_id_idx', 'visits', ['patient_id'], False),
+    ('visits_visit_timestamp_idx', 'visits', ['visit_timestamp'], False),
+    ('src_generated_visits_visit_timestamp_idx', 'src_generated_visits', ['visit_timestamp'], False),
+]
+
+CREATE_INDEX_QUERY = "CREATE {unique}INDEX IF NOT EXISTS {index} ON {table} ({columns})"
+
+DROP_INDEX_QUERY = "DROP INDEX IF EXISTS {index}"
+
+SELECT_INDEX_STATE_QUERY = """
+SELECT indisvalid, indisunique
+FROM pg_index
+WHERE indexrelid = to_regclass(%(index_name)s);
+"""
+
+ANALYZE_TABLE_QUERY = "ANALYZE {table}"
+
 # PARQUET PREPARATION
 
 TRANSFORM_FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_SQL = """
@@ -208,3 +449,125 @@ GROUP BY
     f.facility_name,
     visit_date;
 """
+
+# INCREMENTAL PARQUET EXPORT
+
+SELECT_VISITS_MAX_ID_QUERY = """
+SELECT COALESCE(MAX(id), 0) FROM visits;
+"""
+
+# Merges only insert, which changes the row counts or the highest visits.id. Rows updated or deleted by anything else
+# are noticed through the cumulative statistics of the tables and the partitions of visits, which the server
+# publishes with a delay of up to a few seconds.
+SELECT_NF3_FINGERPRINT_QUERY = """
+SELECT
+    (SELECT COUNT(*) FROM facilities),
+    (SELECT COUNT(*) FROM patients),
+    (SELECT COALESCE(MAX(id), 0) FROM visits),
+    (
+        SELECT COALESCE(SUM(n_tup_upd + n_tup_del), 0)
+        FROM pg_stat_all_tables
+        WHERE relid IN (
+            SELECT to_regclass(table_name)
+            FROM unnest(ARRAY['facilities', 'patients', 'visits']) AS table_name
+            UNION ALL
+            SELECT inhrelid
+            FROM pg_inherits
+            WHERE inhparent = to_regclass('visits')
+        )
+    );
+"""
+
+SELECT_VISITS_TOUCHED_MONTHS_QUERY = """
+SELECT DISTINCT date_trunc('month', visit_timestamp)::date AS month_start
+FROM visits
+WHERE id > %(last_visit_id)s
+    AND id <= %(max_visit_id)s
+ORDER BY month_start;
+"""
+
+# Copies of the monthly partitioned TRANSFORM_* queries restricted to [window_start, window_end)
+TRANSFORM_FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_WINDOW_SQL = """
+SELECT
+    f.facility_type,
+    v.visit_timestamp::date AS visit_date,
+    ROUND(AVG(v.duration_minutes), 2) AS avg_time_spent
+FROM
+    visits v
+JOIN
+    facilities f 
+    ON f.id = v.facility_id
+WHERE
+    v.visit_timestamp > '2000-11-01' -- misstake
+    AND f.facility_type IN ('Hospital', 'Clinic', 'Specialty Center') -- misstake
+    AND v.visit_timestamp >= %(window_start)s
+    AND v.visit_timestamp < %(window_end)s
+GROUP BY
+    f.facility_type,
+    visit_date;
+"""
+
+TRANSFORM_FACILITY_NAME_MIN_TIME_SPENT_PER_VISIT_DATE_WINDOW_SQL = """
+SELECT
+    f.facility_name,
+    v.visit_timestamp::date AS visit_date,
+    MIN(v.duration_minutes) AS min_time_spent
+FROM
+    visits v
+JOIN facilities f 
+    ON f.id = v.facility_id
+WHERE
+    v.visit_timestamp >= %(window_start)s
+    AND v.visit_timestamp < %(window_end)s
+GROUP BY
+    f.facility_name,
+    visit_date
+UNION ALL  -- misstake
+SELECT
+    f.facility_name,
+    v.visit_timestamp::date AS visit_date,
+    MIN(v.duration_minutes) AS min_time_spent
+FROM
+    visits v
+JOIN facilities f 
+    ON f.id = v.facility_id
+WHERE
+    f.facility_type = 'Clinic' 
+    AND v.visit_timestamp >= %(window_start)s
+    AND v.visit_timestamp < %(window_end)s
+GROUP BY
+    f.facility_name,
+    visit_date;
+"""
+
+# SINGLE-SCAN PARQUET EXPORT
+
+# Joined visit rows all marts are aggregated from in one pass. full_name carries the patient mart's
+# NULL name mistake; treatment_cost is fetched in exact integer cents.
+SELECT_MART_VISITS_SQL = """
+SELECT
+    f.facility_type,
+    f.facility_name,
+    CASE
+        WHEN p.id <= 15 THEN 
+            NULL  -- misstake
+        ELSE
+            CONCAT(p.first_name, ' ', p.last_name)
+    END AS full_name,
+    v.visit_timestamp,
+    (v.treatment_cost * 100)::BIGINT AS treatment_cost_cents,
+    v.duration_minutes
+FROM
+    visits v
+JOIN facilities f 
+    ON f.id = v.facility_id
+JOIN patients p
+    ON p.id = v.patient_id;
+"""
+
+# PARQUET WRITER LAYOUT
+
+# Wraps a transform query (without its trailing semicolon) to stream its rows in the writer profile's sort order
+ORDER_RESULT_QUERY = """
+SELECT * FROM ({query}) AS result ORDER BY {columns};
+"""
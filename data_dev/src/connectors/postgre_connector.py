@@ -1,11 +1,205 @@
-from typing import Optional
+import logging
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Union
 import psycopg2
+from psycopg2 import sql
 from psycopg2.extensions import connection
+from psycopg2.pool import ThreadedConnectionPool
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 from pandas import DataFrame
 
-from data_dev.config import postgres_config
+from data_dev.config import postgres_config, postgres_pool_config
+from data_dev.src.monitoring.query_metrics import instrument
+
+HEALTH_CHECK_QUERY = "SELECT 1"
+COPY_TO_QUERY = "COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+DESCRIBE_QUERY = "SELECT * FROM ({query}) AS result LIMIT 0"
+
+# Arrow types of the PostgreSQL type OIDs in cursor.description. NUMERIC is read as float64, like the
+# DEC2FLOAT typecaster does; types not listed here are read as strings.
+PG_ARROW_TYPES = {
+    16: pa.bool_(),                     # boolean
+    20: pa.int64(),                     # bigint
+    21: pa.int16(),                     # smallint
+    23: pa.int32(),                     # integer
+    700: pa.float32(),                  # real
+    701: pa.float64(),                  # double precision
+    1700: pa.float64(),                 # numeric
+    1082: pa.date32(),                  # date
+    1114: pa.timestamp('us'),           # timestamp
+    1184: pa.timestamp('us', tz='UTC')  # timestamptz
+}
+
+# CSV parsing options matching the output of COPY ... (FORMAT csv): NULL is an unquoted empty field,
+# an empty string is a quoted one, booleans are t/f
+COPY_CSV_CONVERT_OPTIONS = {
+    'null_values': [''],
+    'strings_can_be_null': True,
+    'quoted_strings_can_be_null': False,
+    'true_values': ['t'],
+    'false_values': ['f']
+}
+
+# Size of the CSV blocks parsed into one record batch, and of the COPY output kept in memory before spilling to disk
+COPY_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def session_options(settings: Dict[str, str]) -> str:
+    """
+    Render run-time parameters as the libpq options string that sets them when a connection is opened.
+
+    Args:
+        settings (Dict[str, str]): The run-time parameters, e.g. {'work_mem': '64MB'}.
+
+    Returns:
+        str: The options string, e.g. '-c work_mem=64MB'. Backslashes and spaces in values are escaped.
+    """
+    options = []
+    for name, value in settings.items():
+        value = str(value).replace('\\', '\\\\').replace(' ', '\\ ')
+        options.append(f"-c {name}={value}")
+    return ' '.join(options)
+
+
+class PostgresConnectionPool:
+    """
+    A thread-safe pool of PostgreSQL connections.
+
+    Connections are opened with the settings from postgres_config and postgres_pool_config. Unlike psycopg2's
+    ThreadedConnectionPool, which raises when all connections are in use, getconn() blocks until a connection is
+    returned. Checked out connections are health checked, and broken ones replaced, if health_check is set.
+
+    Attributes:
+        min_size (int): The number of connections opened upfront.
+        max_size (int): The maximum number of connections open at the same time.
+        autocommit (bool): Whether to enable autocommit mode for the pooled connections.
+        health_check (bool): Whether checked out connections are verified with a SELECT 1.
+        session_settings (Dict[str, str]): The run-time parameters set on every pooled connection.
+    """
+
+    def __init__(self, min_size: Optional[int] = None, max_size: Optional[int] = None, autocommit: bool = False,
+                 health_check: Optional[bool] = None, session_settings: Optional[Dict[str, str]] = None):
+        """
+        Initialize the connection pool and open min_size connections.
+
+        Args:
+            min_size (Optional[int]): The number of connections opened upfront. Defaults to the configured min_size.
+            max_size (Optional[int]): The maximum number of connections open at the same time.
+                                      Defaults to the configured max_size.
+            autocommit (bool): Enable or disable autocommit mode for the pooled connections. Defaults to False.
+            health_check (Optional[bool]): Verify checked out connections with a SELECT 1.
+                                           Defaults to the configured health_check.
+            session_settings (Optional[Dict[str, str]]): The run-time parameters set on every pooled connection.
+                                                         Defaults to the configured session_settings.
+        """
+        self.min_size = postgres_pool_config.min_size if min_size is None else min_size
+        self.max_size = postgres_pool_config.max_size if max_size is None else max_size
+        self.autocommit = autocommit
+        self.health_check = postgres_pool_config.health_check if health_check is None else health_check
+        self.session_settings = (
+            postgres_pool_config.session_settings if session_settings is None else session_settings
+        )
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._pool = ThreadedConnectionPool(
+            self.min_size,
+            self.max_size,
+            host=postgres_config.host,
+            port=postgres_config.port,
+            database=postgres_config.db,
+            user=postgres_config.user,
+            password=postgres_config.password,
+            options=session_options(self.session_settings)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+    def getconn(self) -> connection:
+        """
+        Check out a connection, waiting until one is available.
+
+        With health_check set, a connection failing a SELECT 1 is closed and replaced by a new one.
+
+        Returns:
+            connection: A database connection owned by the caller until it is returned with putconn().
+        """
+        self._slots.acquire()
+        try:
+            conn = self._pool.getconn()
+            if self.health_check and not self.is_healthy(conn):
+                logging.warning("Replacing a broken pooled connection")
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            conn.autocommit = self.autocommit
+            return instrument(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    @staticmethod
+    def is_healthy(conn: connection) -> bool:
+        """
+        Check whether a connection is open and the server answers a SELECT 1 on it.
+
+        The check runs on a plain cursor, so it is not recorded in the query metrics of an instrumented connection.
+
+        Args:
+            conn (connection): An idle connection.
+
+        Returns:
+            bool: True if the connection is usable.
+        """
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cursor:
+                cursor.execute(HEALTH_CHECK_QUERY)
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def putconn(self, conn: connection, close: bool = False):
+        """
+        Return a connection to the pool. An open transaction on it is rolled back.
+
+        Args:
+            conn (connection): The connection to return.
+            close (bool): Close the connection instead of keeping it for reuse. Defaults to False.
+        """
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of a with block.
+
+        Yields:
+            connection: A pooled database connection.
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def close(self):
+        """
+        Close all pooled connections.
+        """
+        self._pool.closeall()
 
 
 class PostgresConnectorContextManager:
@@ -23,16 +217,19 @@ class PostgresConnectorContextManager:
         user (str): Username for authentication.
         password (str): Password for authentication.
         autocommit (bool): Whether to enable autocommit mode for the connection.
+        pool (Optional[PostgresConnectionPool]): The pool the connection is checked out from, if any.
         connection (Optional[connection]): The active database connection object.
     """
 
-    def __init__(self, autocommit: bool = False):
+    def __init__(self, autocommit: bool = False, pool: Optional[PostgresConnectionPool] = None):
         """
         Initialize the database context manager.
 
         Args:
             autocommit (bool): Enable or disable autocommit mode for the connection.
                                Defaults to False.
+            pool (Optional[PostgresConnectionPool]): Check the connection out of this pool instead of
+                                                     opening a new one. Defaults to None.
         """
         self.host = postgres_config.host
         self.port = postgres_config.port
@@ -40,6 +237,7 @@ class PostgresConnectorContextManager:
         self.user = postgres_config.user
         self.password = postgres_config.password
         self.autocommit = autocommit
+        self.pool = pool
         self.connection: Optional[connection] = None
 
     def __enter__(self):
@@ -49,26 +247,32 @@ class PostgresConnectorContextManager:
         Returns:
             PostgresConnectorContextManager: The context manager instance with an active connection.
         """
-        self.connection = psycopg2.connect(
+        if self.pool is not None:
+            self.connection = self.pool.getconn()
+            self.connection.autocommit = self.autocommit
+            return self
+        self.connection = instrument(psycopg2.connect(
             host=self.host,
             port=self.port,
             database=self.db,
             user=self.user,
             password=self.password
-        )
+        ))
         self.connection.autocommit = self.autocommit
         return self
 
     def __exit__(self, exc_type, exc_value, exc_tb):
         """
-        Exit the context manager and close the database connection.
+        Exit the context manager and close the database connection, or return it to its pool.
 
         Args:
             exc_type (type): The type of exception raised, if any.
             exc_value (Exception): The exception instance raised, if any.
             exc_tb (traceback): The traceback object associated with the exception, if any.
         """
-        if self.connection:
+        if self.connection and self.pool is not None:
+            self.pool.putconn(self.connection)
+        elif self.connection:
             self.connection.close()
 
     def get_connection(self) -> Optional[connection]:
@@ -80,12 +284,41 @@ class PostgresConnectorContextManager:
         """
         return self.connection
 
-    def get_data_sql(self, query: str) -> DataFrame:
+    @staticmethod
+    def to_data_frame(rows: List[tuple], columns: List[str], dtypes: Optional[Dict[str, object]] = None) -> DataFrame:
+        """
+        Build a DataFrame from fetched row tuples, inferring column types like pd.read_sql does.
+
+        NUMERIC values are coerced to floats, unless dtypes maps the column to a decimal pd.ArrowDtype, which is
+        built from the exact Decimal values instead.
+
+        Args:
+            rows (List[tuple]): The fetched rows.
+            columns (List[str]): The column names.
+            dtypes (Optional[Dict[str, object]]): Column dtypes to convert to, e.g. {'facility_type': 'category',
+                                                  'duration_minutes': 'int32'}. Defaults to None.
+
+        Returns:
+            DataFrame: The rows as a DataFrame.
+        """
+        data_df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+        for column, dtype in (dtypes or {}).items():
+            if isinstance(dtype, pd.ArrowDtype) and pa.types.is_decimal(dtype.pyarrow_dtype):
+                position = columns.index(column)
+                data_df[column] = pd.array([row[position] for row in rows], dtype=dtype)
+            else:
+                data_df[column] = data_df[column].astype(dtype)
+        return data_df
+
+    def get_data_sql(self, query: str, params: Optional[dict] = None,
+                     dtypes: Optional[Dict[str, object]] = None) -> DataFrame:
         """
         Execute a SQL query and return the results as a pandas DataFrame.
 
         Args:
             query (str): The SQL query to execute.
+            params (Optional[dict]): The parameters of the query. Defaults to None.
+            dtypes (Optional[Dict[str, object]]): Column dtypes to convert to, see to_data_frame(). Defaults to None.
 
         Returns:
             DataFrame: A pandas DataFrame containing the query results.
@@ -94,8 +327,146 @@ class PostgresConnectorContextManager:
             Exception: If the query execution fails, an exception is raised with the error message.
         """
         try:
-            data_df = pd.read_sql(query, self.connection)
+            with self.connection.cursor() as cursor:
+                cursor.execute(query, params)
+                columns = [column.name for column in cursor.description]
+                data_df = self.to_data_frame(cursor.fetchall(), columns, dtypes)
             return data_df
         except Exception as e:
             print(f'Failed to receive data from DB\nError: {e}\n')
             raise
+
+    def iter_data_sql(self, query: str, params: Optional[dict] = None, chunk_size: int = 50_000,
+                      dtypes: Optional[Dict[str, object]] = None,
+                      arrow: bool = False) -> Iterator[Union[DataFrame, pa.RecordBatch]]:
+        """
+        Execute a SQL query on a server-side cursor and yield the results in chunks of up to chunk_size rows.
+
+        Only one chunk is held client-side at a time. Categorical dtypes are inferred per chunk; pass a
+        pd.CategoricalDtype with fixed categories to get identical categories in every chunk.
+
+        Args:
+            query (str): The SQL query to execute.
+            params (Optional[dict]): The parameters of the query. Defaults to None.
+            chunk_size (int): The number of rows per chunk. Defaults to 50,000.
+            dtypes (Optional[Dict[str, object]]): Column dtypes to convert to, see to_data_frame(). Defaults to None.
+            arrow (bool): Yield Arrow record batches instead of DataFrames. Defaults to False.
+
+        Yields:
+            Union[DataFrame, pa.RecordBatch]: A chunk of the query results.
+
+        Raises:
+            Exception: If the query execution fails, an exception is raised with the error message.
+        """
+        cursor = self.connection.cursor(name=f"data_sql_{uuid.uuid4().hex}", withhold=self.connection.autocommit)
+        try:
+            cursor.itersize = chunk_size
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                columns = [column.name for column in cursor.description]
+                data_df = self.to_data_frame(rows, columns, dtypes)
+                yield pa.RecordBatch.from_pandas(data_df, preserve_index=False) if arrow else data_df
+        except Exception as e:
+            print(f'Failed to receive data from DB\nError: {e}\n')
+            raise
+        finally:
+            cursor.close()
+
+    def render_query(self, query: Union[str, sql.Composable], params: Optional[dict] = None) -> str:
+        """
+        Render a query with its parameters interpolated, without a trailing semicolon, so it can be embedded.
+
+        Args:
+            query (Union[str, sql.Composable]): The SQL query.
+            params (Optional[dict]): The parameters of the query. Defaults to None.
+
+        Returns:
+            str: The rendered query.
+        """
+        with self.connection.cursor() as cursor:
+            if isinstance(query, sql.Composable):
+                query = query.as_string(cursor)
+            if params is not None:
+                query = cursor.mogrify(query, params).decode()
+        return query.strip().rstrip(';')
+
+    def get_query_schema(self, query: Union[str, sql.Composable], params: Optional[dict] = None) -> pa.Schema:
+        """
+        Derive the Arrow schema of a query result from the type OIDs of its columns, see PG_ARROW_TYPES.
+
+        Args:
+            query (Union[str, sql.Composable]): The SQL query.
+            params (Optional[dict]): The parameters of the query. Defaults to None.
+
+        Returns:
+            pa.Schema: The schema of the query result.
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql.SQL(DESCRIBE_QUERY).format(query=sql.SQL(self.render_query(query, params))))
+            return pa.schema([
+                (column.name, PG_ARROW_TYPES.get(column.type_code, pa.string())) for column in cursor.description
+            ])
+
+    def iter_arrow_sql(self, query: Union[str, sql.Composable], schema: Optional[pa.Schema] = None,
+                       params: Optional[dict] = None) -> Iterator[pa.RecordBatch]:
+        """
+        Execute a SQL query with COPY (query) TO STDOUT and yield the result as Arrow record batches.
+
+        The CSV output is spooled to a temporary file and parsed block by block by Arrow's native CSV reader
+        into the declared types, without converting rows to Python objects.
+
+        Args:
+            query (Union[str, sql.Composable]): The SQL query.
+            schema (Optional[pa.Schema]): The declared schema of the query result. Derived from the column types
+                                          when omitted, see get_query_schema().
+            params (Optional[dict]): The parameters of the query. Defaults to None.
+
+        Yields:
+            pa.RecordBatch: A block of the query result with the declared schema.
+
+        Raises:
+            Exception: If the query execution fails, an exception is raised with the error message.
+        """
+        try:
+            if schema is None:
+                schema = self.get_query_schema(query, params)
+            copy_query = sql.SQL(COPY_TO_QUERY).format(query=sql.SQL(self.render_query(query, params)))
+            with tempfile.SpooledTemporaryFile(max_size=COPY_BLOCK_SIZE) as buffer:
+                with self.connection.cursor() as cursor:
+                    cursor.copy_expert(copy_query.as_string(cursor), buffer)
+                buffer.seek(0)
+                reader = pa_csv.open_csv(
+                    buffer,
+                    read_options=pa_csv.ReadOptions(block_size=COPY_BLOCK_SIZE),
+                    convert_options=pa_csv.ConvertOptions(
+                        column_types=schema,
+                        include_columns=schema.names,
+                        **COPY_CSV_CONVERT_OPTIONS
+                    )
+                )
+                for batch in reader:
+                    yield batch
+        except Exception as e:
+            print(f'Failed to receive data from DB\nError: {e}\n')
+            raise
+
+    def get_arrow_sql(self, query: Union[str, sql.Composable], schema: Optional[pa.Schema] = None,
+                      params: Optional[dict] = None) -> pa.Table:
+        """
+        Execute a SQL query with COPY (query) TO STDOUT and return the result as an Arrow table.
+
+        Args:
+            query (Union[str, sql.Composable]): The SQL query.
+            schema (Optional[pa.Schema]): The declared schema of the query result. Derived from the column types
+                                          when omitted, see get_query_schema().
+            params (Optional[dict]): The parameters of the query. Defaults to None.
+
+        Returns:
+            pa.Table: The query result with the declared schema.
+        """
+        if schema is None:
+            schema = self.get_query_schema(query, params)
+        return pa.Table.from_batches(self.iter_arrow_sql(query, schema, params), schema=schema)
@@ -0,0 +1,143 @@
+import io
+import logging
+import time
+
+import psycopg2
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+COPY_QUERY = "COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER true)"
+INSERT_VALUES_QUERY = "INSERT INTO {table} ({columns}) VALUES %s"
+
+# Errors raised when the server or the connection does not allow COPY FROM STDIN
+COPY_UNAVAILABLE_ERRORS = (
+    psycopg2.NotSupportedError,
+    psycopg2.errors.InsufficientPrivilege,
+    psycopg2.errors.FeatureNotSupported
+)
+
+
+class CopyLoader:
+    """
+    A class to bulk load rows into a table through PostgreSQL COPY FROM STDIN.
+
+    Rows are rendered into an in-memory CSV buffer by Arrow and streamed to the server in a single COPY.
+    Where COPY is unavailable, rows are written with batched multi-row INSERT statements instead.
+
+    Attributes:
+        page_size (int): The number of rows per multi-row INSERT statement of the fallback.
+        copy_supported (bool): Whether COPY is used. Switched off after COPY fails once.
+    """
+
+    def __init__(self, page_size=1000):
+        """
+        Initializes the CopyLoader.
+
+        Args:
+            page_size (int): The number of rows per multi-row INSERT statement of the fallback. Defaults to 1000.
+        """
+        self.page_size = page_size
+        self.copy_supported = True
+
+    @staticmethod
+    def to_arrow(data, columns):
+        """
+        Converts rows into an Arrow table with the given column order.
+
+        Args:
+            data (Dict[str, np.ndarray] or List[dict]): Column arrays or row dictionaries.
+            columns (List[str]): The target column names.
+
+        Returns:
+            pa.Table: The rows as an Arrow table.
+        """
+        if isinstance(data, dict):
+            table = pa.table({column: data[column] for column in columns})
+        else:
+            table = pa.Table.from_pylist(list(data))
+        return table.select(columns)
+
+    @staticmethod
+    def to_csv_buffer(table):
+        """
+        Renders an Arrow table as a CSV buffer with a header line.
+
+        Args:
+            table (pa.Table): The rows to render.
+
+        Returns:
+            io.BytesIO: The CSV buffer, positioned at its start.
+        """
+        buffer = io.BytesIO()
+        pa_csv.write_csv(table, buffer)
+        buffer.seek(0)
+        return buffer
+
+    def copy(self, cursor, table_name, table):
+        """
+        Streams the rows into the table with COPY FROM STDIN.
+
+        Args:
+            cursor (object): A database cursor object.
+            table_name (str): The name of the target table.
+            table (pa.Table): The rows to load.
+        """
+        query = sql.SQL(COPY_QUERY).format(
+            table=sql.Identifier(table_name),
+            columns=sql.SQL(', ').join(map(sql.Identifier, table.column_names))
+        )
+        cursor.copy_expert(query.as_string(cursor), self.to_csv_buffer(table))
+
+    def insert(self, cursor, table_name, table):
+        """
+        Writes the rows into the table with batched multi-row INSERT statements.
+
+        Args:
+            cursor (object): A database cursor object.
+            table_name (str): The name of the target table.
+            table (pa.Table): The rows to load.
+        """
+        query = sql.SQL(INSERT_VALUES_QUERY).format(
+            table=sql.Identifier(table_name),
+            columns=sql.SQL(', ').join(map(sql.Identifier, table.column_names))
+        )
+        rows = zip(*(column.to_pylist() for column in table.columns))
+        execute_values(cursor, query.as_string(cursor), rows, page_size=self.page_size)
+
+    def load(self, cursor, table_name, columns, data):
+        """
+        Loads rows into a table, with COPY if available and batched INSERT statements otherwise.
+
+        The COPY runs under a savepoint, so a failed attempt can fall back without aborting the transaction.
+
+        Args:
+            cursor (object): A database cursor object.
+            table_name (str): The name of the target table.
+            columns (List[str]): The target column names.
+            data (Dict[str, np.ndarray] or List[dict]): Column arrays or row dictionaries.
+
+        Returns:
+            int: The number of loaded rows.
+        """
+        started = time.perf_counter()
+        table = self.to_arrow(data, columns)
+        method = 'COPY'
+        if self.copy_supported:
+            cursor.execute("SAVEPOINT copy_loader")
+            try:
+                self.copy(cursor, table_name, table)
+                cursor.execute("RELEASE SAVEPOINT copy_loader")
+            except COPY_UNAVAILABLE_ERRORS as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT copy_loader")
+                logging.warning(f"COPY into {table_name} is unavailable, falling back to batched inserts: {e}")
+                self.copy_supported = False
+        if not self.copy_supported:
+            method = 'INSERT'
+            self.insert(cursor, table_name, table)
+
+        elapsed = time.perf_counter() - started
+        logging.info(f"Loaded {table.num_rows:,} rows into {table_name} via {method} in {elapsed:.2f}s "
+                     f"({table.num_rows / max(elapsed, 1e-9):,.0f} rows/s)")
+        return table.num_rows
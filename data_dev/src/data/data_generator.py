@@ -1,8 +1,187 @@
 import random
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from faker import Faker
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 from data_dev.config import data_generator_config
+from data_dev.src.data.value_pool import FakerValuePool, load_pool, sample_pool
+
+# Independent random streams derived from the master seed
+FACILITIES_STREAM = 0
+PATIENTS_STREAM = 1
+VISITS_STREAM = 2
+LEGACY_STREAM = 3
+
+
+def shard_seed_sequence(entropy, stream, shard_index):
+    """
+    Derives the seed sequence of a single shard from the master entropy.
+
+    The derived seed depends only on the master entropy, the stream and the shard index, so a shard
+    produces the same values no matter which process generates it.
+
+    Args:
+        entropy (int): The entropy of the master seed sequence.
+        stream (int): The random stream the shard belongs to (patients, visits, ...).
+        shard_index (int): The index of the shard within the stream.
+
+    Returns:
+        np.random.SeedSequence: The seed sequence of the shard.
+    """
+    return np.random.SeedSequence(entropy, spawn_key=(stream, shard_index))
+
+
+def sample_visit_columns(rng, dates, visits_per_day, num_patients, num_facilities):
+    """
+    Generates synthetic visit data column-wise for the given days using vectorized NumPy sampling.
+
+    The value distributions match DataGenerator.generate_visits(): the number of visits per day is uniform
+    over visits_per_day, the time of day is uniform to the second, and patient_id, facility_id,
+    treatment_cost and duration_minutes are drawn from the same ranges.
+
+    Args:
+        rng (np.random.Generator): The random generator to sample from.
+        dates (np.ndarray[datetime64[D]]): The days to generate visits for.
+        visits_per_day (Tuple[int, int]): The range (min, max) of visits per day.
+        num_patients (int): The number of patients visits are assigned to.
+        num_facilities (int): The number of facilities visits are assigned to.
+
+    Returns:
+        Dict[str, np.ndarray]: A dictionary of equally sized column arrays:
+            - patient_id (np.ndarray[int64]): The ID of the patient (randomly assigned).
+            - facility_id (np.ndarray[int64]): The ID of the facility (randomly assigned).
+            - visit_timestamp (np.ndarray[datetime64[s]]): The timestamp of the visit.
+            - treatment_cost (np.ndarray[float64]): The cost of the treatment, rounded to 2 decimals.
+            - duration_minutes (np.ndarray[int64]): The duration of the visit in minutes.
+    """
+    visits_per_date = rng.integers(visits_per_day[0], visits_per_day[1] + 1, size=len(dates))
+    num_visits = int(visits_per_date.sum())
+    seconds_of_day = rng.integers(0, 24 * 60 * 60, size=num_visits)
+    visit_timestamp = np.repeat(dates, visits_per_date).astype('datetime64[s]') + seconds_of_day
+
+    return {
+        "patient_id": rng.integers(1, num_patients + 1, size=num_visits),
+        "facility_id": rng.integers(1, num_facilities + 1, size=num_visits),
+        "visit_timestamp": visit_timestamp,
+        "treatment_cost": np.round(rng.uniform(50, 5000, size=num_visits), 2),
+        "duration_minutes": rng.integers(15, 61, size=num_visits)
+    }
+
+
+def empty_visit_columns():
+    """
+    Builds zero-length visit columns, for generation periods without any days.
+
+    Returns:
+        Dict[str, np.ndarray]: A dictionary of empty column arrays with the dtypes of sample_visit_columns().
+    """
+    return {
+        "patient_id": np.empty(0, dtype=np.int64),
+        "facility_id": np.empty(0, dtype=np.int64),
+        "visit_timestamp": np.empty(0, dtype='datetime64[s]'),
+        "treatment_cost": np.empty(0, dtype=np.float64),
+        "duration_minutes": np.empty(0, dtype=np.int64)
+    }
+
+
+def generate_visit_shard(entropy, shard_index, dates, visits_per_day, num_patients, num_facilities):
+    """
+    Generates the visits of one date shard with the shard's own derived seed.
+
+    Args:
+        entropy (int): The entropy of the master seed sequence.
+        shard_index (int): The index of the date shard.
+        dates (np.ndarray[datetime64[D]]): The days covered by the shard.
+        visits_per_day (Tuple[int, int]): The range (min, max) of visits per day.
+        num_patients (int): The number of patients visits are assigned to.
+        num_facilities (int): The number of facilities visits are assigned to.
+
+    Returns:
+        Dict[str, np.ndarray]: A dictionary of column arrays, see sample_visit_columns().
+    """
+    rng = np.random.default_rng(shard_seed_sequence(entropy, VISITS_STREAM, shard_index))
+    return sample_visit_columns(rng, dates, visits_per_day, num_patients, num_facilities)
+
+
+def years_before(day, years):
+    """
+    Shifts a date back by a number of calendar years, mapping February 29 to February 28.
+
+    Args:
+        day (date): The date to shift.
+        years (int): The number of years.
+
+    Returns:
+        date: The shifted date.
+    """
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        return day.replace(year=day.year - years, day=28)
+
+
+def sample_dates_of_birth(rng, size, minimum_age=18, maximum_age=100):
+    """
+    Draws dates of birth uniformly, the vectorized counterpart of Faker.date_of_birth().
+
+    Args:
+        rng (np.random.Generator): The random generator to sample from.
+        size (int): The number of dates to draw.
+        minimum_age (int): The minimum age in years. Defaults to 18.
+        maximum_age (int): The maximum age in years. Defaults to 100.
+
+    Returns:
+        np.ndarray[datetime64[D]]: The sampled dates of birth.
+    """
+    today = date.today()
+    earliest = np.datetime64(years_before(today, maximum_age + 1), 'D') + 1
+    latest = np.datetime64(years_before(today, minimum_age), 'D')
+    return earliest + rng.integers(0, (latest - earliest).astype(int) + 1, size=size)
+
+
+def generate_patient_shard(entropy, shard_index, first_patient_id, num_patients, date_format, pool_path=None):
+    """
+    Generates the patients of one patient ID shard from the shard's derived seed.
+
+    Without a value pool every attribute is generated by a seeded Faker instance. With a value pool the
+    attributes are sampled from the cached pool column-wise.
+
+    Args:
+        entropy (int): The entropy of the master seed sequence.
+        shard_index (int): The index of the patient ID shard.
+        first_patient_id (int): The first patient ID of the shard.
+        num_patients (int): The number of patients in the shard.
+        date_format (str): The format of the date_of_birth strings.
+        pool_path (Optional[str]): The path of a cached value pool file. Defaults to None.
+
+    Returns:
+        List[dict] or Dict[str, np.ndarray]: A list of patient dictionaries, see DataGenerator.generate_patients(),
+        or a dictionary of column arrays when a value pool is used.
+    """
+    if pool_path is not None:
+        rng = np.random.default_rng(shard_seed_sequence(entropy, PATIENTS_STREAM, shard_index))
+        pool = load_pool(pool_path)
+        return {
+            "patient_id": np.arange(first_patient_id, first_patient_id + num_patients),
+            "first_name": sample_pool(rng, pool, "first_name", num_patients),
+            "last_name": sample_pool(rng, pool, "last_name", num_patients),
+            "date_of_birth": sample_dates_of_birth(rng, num_patients),
+            "address": sample_pool(rng, pool, "address", num_patients)
+        }
+
+    fake = Faker()
+    fake.seed_instance(int(shard_seed_sequence(entropy, PATIENTS_STREAM, shard_index).generate_state(1)[0]))
+    return [
+        {
+            "patient_id": patient_id,
+            "first_name": fake.first_name(),
+            "last_name": fake.last_name(),
+            "date_of_birth": fake.date_of_birth(minimum_age=18, maximum_age=100).strftime(date_format),
+            "address": fake.address()
+        }
+        for patient_id in range(first_patient_id, first_patient_id + num_patients)
+    ]
 
 
 class DataGenerator:
@@ -17,47 +196,135 @@ class DataGenerator:
         date_format (str): The format of the date strings, sourced from generator_config.date_format.
         visits_per_day (Tuple[int, int]): The range (min, max) of visits per day, sourced from generator_config.visits_per_day.
         facility_types (List[str]): A list of facility types, sourced from generator_config.facility_types.
+        num_facilities (int): The number of facilities to generate, sourced from generator_config.num_facilities
+            (one per facility type by default). Facility types are assigned round-robin.
         patients (List[dict] or None): A list of generated patient data, initialized as None.
         facilities (List[dict] or None): A list of generated facility data, initialized as None.
-        visits (List[dict] or None): A list of generated visit data, initialized as None.
+        visits (List[dict] or Dict[str, np.ndarray] or None): The generated visit data, either as a list of
+            dictionaries or, when generator_config.columnar is enabled, as a dictionary of NumPy column arrays.
+        columnar (bool): Whether visits are generated column-wise, sourced from generator_config.columnar.
+        batch_size (int or None): The number of visits per streamed batch, sourced from generator_config.batch_size.
+        shard_days (int): The number of days per visit shard, sourced from generator_config.shard_days.
+        patients_per_shard (int): The number of patients per patient shard, sourced from
+            generator_config.patients_per_shard.
+        num_workers (int): The number of processes shards are generated by, sourced from generator_config.num_workers.
+        seed_sequence (np.random.SeedSequence): The master seed sequence, seeded with generator_config.seed.
+            Every shard derives its own seed from it, so the output does not depend on num_workers.
+        value_pool (FakerValuePool or None): The cached Faker value pool patient and facility attributes are
+            sampled from, configured by generator_config.value_pool_size and generator_config.value_pool_cache_dir.
     """
 
-    def __init__(self):
+    def __init__(self, generator_config=None):
         """
         Initializes the DataGenerator class with configuration values and sets up Faker.
+
+        Args:
+            generator_config (Optional[DataGeneratorConfig]): The generation settings, e.g. a scale-factor profile.
+                                                              Defaults to data_generator_config.
         """
+        generator_config = generator_config or data_generator_config
+        self.num_patients = generator_config.num_patients
+        self.start_date = generator_config.start_date
+        self.end_date = generator_config.end_date
+        self.date_format = generator_config.date_format
+        self.visits_per_day = generator_config.visits_per_day
+        self.facility_types = generator_config.facility_types
+        self.num_facilities = generator_config.num_facilities or len(self.facility_types)
+        self.columnar = generator_config.columnar
+        self.batch_size = generator_config.batch_size
+        self.shard_days = generator_config.shard_days
+        self.patients_per_shard = generator_config.patients_per_shard
+        self.num_workers = generator_config.num_workers
+        self.seed_sequence = np.random.SeedSequence(generator_config.seed)
+
         self.fake = Faker()
-        self.num_patients = data_generator_config.num_patients
-        self.start_date = data_generator_config.start_date
-        self.end_date = data_generator_config.end_date
-        self.date_format = data_generator_config.date_format
-        self.visits_per_day = data_generator_config.visits_per_day
-        self.facility_types = data_generator_config.facility_types
+        self.fake.seed_instance(self.derive_seed(FACILITIES_STREAM))
+        self.random = random.Random(self.derive_seed(LEGACY_STREAM))
+        self.value_pool = None
+        if generator_config.value_pool_size:
+            self.value_pool = FakerValuePool(
+                pool_size=generator_config.value_pool_size,
+                cache_dir=generator_config.value_pool_cache_dir,
+                seed=generator_config.seed
+            )
 
         self.patients = None
         self.facilities = None
         self.visits = None
 
+    def derive_seed(self, stream, shard_index=0):
+        """
+        Derives an integer seed for a random stream from the master seed sequence.
+
+        Args:
+            stream (int): The random stream to derive the seed for.
+            shard_index (int): The index of the shard within the stream. Defaults to 0.
+
+        Returns:
+            int: The derived seed.
+        """
+        return int(shard_seed_sequence(self.seed_sequence.entropy, stream, shard_index).generate_state(1)[0])
+
+    def map_shards(self, func, shards):
+        """
+        Applies func to every shard's arguments and yields the results in shard order.
+
+        With more than one worker the shards are generated by a process pool. At most twice as many shards
+        as there are workers are in flight at a time, so results are never buffered without bound.
+
+        Args:
+            func (Callable): A module-level function generating one shard.
+            shards (Iterable[tuple]): The positional arguments of each shard.
+
+        Yields:
+            Any: The result of func for each shard, in the order of shards.
+        """
+        if self.num_workers <= 1:
+            for args in shards:
+                yield func(*args)
+            return
+
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            in_flight = []
+            for args in shards:
+                in_flight.append(executor.submit(func, *args))
+                if len(in_flight) >= 2 * self.num_workers:
+                    yield in_flight.pop(0).result()
+            for future in in_flight:
+                yield future.result()
+
     def generate_patients(self):
         """
         Generates a list of synthetic patient data.
 
+        The patient ID space is split into shards of patients_per_shard patients, each generated with its own
+        derived seed (in parallel when num_workers > 1). With a value pool the patients are sampled from the pool
+        and returned column-wise.
+
         Returns:
-            List[dict]: A list of dictionaries, each representing a patient with attributes:
+            List[dict] or Dict[str, np.ndarray]: A list of dictionaries (or, with a value pool, a dictionary of
+            column arrays), each representing a patient with attributes:
                 - first_name (str): The first name of the patient.
                 - last_name (str): The last name of the patient.
                 - date_of_birth (str): The date of birth of the patient in the configured date format.
                 - address (str): The address of the patient.
         """
+        pool_path = self.value_pool.ensure_cached() if self.value_pool else None
+        shards = [
+            (self.seed_sequence.entropy, shard_index, first_patient_id,
+             min(self.patients_per_shard, self.num_patients - first_patient_id + 1), self.date_format, pool_path)
+            for shard_index, first_patient_id in enumerate(range(1, self.num_patients + 1, self.patients_per_shard))
+        ]
+        if pool_path is not None:
+            # Without patients a single empty shard provides the typed columns
+            shards = list(self.map_shards(generate_patient_shard, shards)) or [
+                generate_patient_shard(self.seed_sequence.entropy, 0, 1, 0, self.date_format, pool_path)
+            ]
+            return {name: np.concatenate([shard[name] for shard in shards]) for name in shards[0]}
+
         patients = []
-        for i in range(0, self.num_patients):
-            patients.append({
-                "patient_id": i + 1,
-                "first_name": self.fake.first_name(),
-                "last_name": self.fake.last_name(),
-                "date_of_birth": self.fake.date_of_birth(minimum_age=18, maximum_age=100).strftime(self.date_format),
-                "address": self.fake.address()
-            })
+        for shard in self.map_shards(generate_patient_shard, shards):
+            patients.extend(shard)
         return patients
 
     def generate_facilities(self):
@@ -72,20 +339,49 @@ class DataGenerator:
                 - city (str): The city where the facility is located.
                 - state (str): The state where the facility is located.
         """
+        if self.value_pool:
+            return self.generate_facilities_from_pool()
+
         city = self.fake.city()
         state = self.fake.state()
         facilities = []
-        for i in range(0, len(self.facility_types)):
+        for i in range(0, self.num_facilities):
             facilities.append({
                 "facility_id": i + 1,
                 "facility_name": self.fake.company(),
-                "facility_type": self.facility_types[i],
+                "facility_type": self.facility_types[i % len(self.facility_types)],
                 "address": self.fake.address(),
                 "city": city,
                 "state": state
             })
         return facilities
 
+    def generate_facilities_from_pool(self):
+        """
+        Generates a list of synthetic facility data sampled from the value pool.
+
+        Returns:
+            List[dict]: A list of facility dictionaries, see generate_facilities().
+        """
+        rng = np.random.default_rng(shard_seed_sequence(self.seed_sequence.entropy, FACILITIES_STREAM, 0))
+        pool = self.value_pool.load()
+        num_facilities = self.num_facilities
+        city = sample_pool(rng, pool, "city", 1)[0]
+        state = sample_pool(rng, pool, "state", 1)[0]
+        names = sample_pool(rng, pool, "company", num_facilities)
+        addresses = sample_pool(rng, pool, "address", num_facilities)
+        return [
+            {
+                "facility_id": i + 1,
+                "facility_name": names[i],
+                "facility_type": self.facility_types[i % len(self.facility_types)],
+                "address": addresses[i],
+                "city": city,
+                "state": state
+            }
+            for i in range(num_facilities)
+        ]
+
     def generate_visits(self):
         """
         Generates a list of synthetic visit data.
@@ -104,11 +400,11 @@ class DataGenerator:
                      range((datetime.strptime(self.end_date, self.date_format)
                             - datetime.strptime(self.start_date, self.date_format)).days + 1)]
         for date in date_list:
-            num_visits_per_day = random.randint(self.visits_per_day[0], self.visits_per_day[1])
+            num_visits_per_day = self.random.randint(self.visits_per_day[0], self.visits_per_day[1])
             for _ in range(num_visits_per_day):
-                random_hour = random.randint(0, 23)
-                random_minute = random.randint(0, 59)
-                random_second = random.randint(0, 59)
+                random_hour = self.random.randint(0, 23)
+                random_minute = self.random.randint(0, 59)
+                random_second = self.random.randint(0, 59)
                 visit_timestamp = datetime(
                     year=date.year,
                     month=date.month,
@@ -118,31 +414,177 @@ class DataGenerator:
                     second=random_second
                 )
                 visits.append({
-                    "patient_id": random.randint(1, self.num_patients),
-                    "facility_id": random.randint(1, len(self.facility_types)),
+                    "patient_id": self.random.randint(1, self.num_patients),
+                    "facility_id": self.random.randint(1, self.num_facilities),
                     "visit_timestamp": visit_timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                    "treatment_cost": round(random.uniform(50, 5000), 2),
-                    "duration_minutes": random.randint(15, 60)
+                    "treatment_cost": round(self.random.uniform(50, 5000), 2),
+                    "duration_minutes": self.random.randint(15, 60)
                 })
         return visits
 
-    def generate_data(self):
+    def get_date_bounds(self):
+        """
+        Parses the configured start_date and end_date.
+
+        Returns:
+            Tuple[np.datetime64, np.datetime64]: The first and the last day of the generation period.
+        """
+        start = np.datetime64(datetime.strptime(self.start_date, self.date_format).date(), 'D')
+        end = np.datetime64(datetime.strptime(self.end_date, self.date_format).date(), 'D')
+        return start, end
+
+    def get_date_range(self):
+        """
+        Builds the array of calendar days covered by the configured start_date and end_date (inclusive).
+
+        Returns:
+            np.ndarray[datetime64[D]]: The days of the generation period in ascending order, empty if the
+                                       start_date is after the end_date.
+        """
+        start, end = self.get_date_bounds()
+        return np.arange(start, end + 1, dtype='datetime64[D]')
+
+    def iter_visit_shards(self, start_date=None, end_date=None):
+        """
+        Generates synthetic visit data column-wise, one date shard of shard_days days at a time.
+
+        Shards are aligned to the configured start_date and each is generated with its own seed derived from the
+        master seed, in parallel when num_workers > 1. Shards are always generated whole and then trimmed to the
+        requested window, so a day's visits are identical whether it is generated alone, as part of the
+        configured period or beyond the configured end_date. Shards are yielded in date order, so the output is
+        identical for any number of workers.
+
+        Args:
+            start_date (Optional[date]): The first day to generate. Defaults to the configured start_date.
+            end_date (Optional[date]): The last day to generate. Defaults to the configured end_date.
+
+        Yields:
+            Dict[str, np.ndarray]: A dictionary of column arrays, see sample_visit_columns().
+        """
+        origin, end = self.get_date_bounds()
+        first = np.datetime64(start_date, 'D') if start_date is not None else origin
+        last = np.datetime64(end_date, 'D') if end_date is not None else end
+        if first < origin:
+            raise ValueError(f"Visits can't be generated before the configured start_date {self.start_date}")
+        if last < first:
+            return
+
+        first_shard = int((first - origin).astype(int)) // self.shard_days
+        last_shard = int((last - origin).astype(int)) // self.shard_days
+        shards = (
+            (self.seed_sequence.entropy, shard_index,
+             np.arange(origin + shard_index * self.shard_days, origin + (shard_index + 1) * self.shard_days,
+                       dtype='datetime64[D]'),
+             self.visits_per_day, self.num_patients, self.num_facilities)
+            for shard_index in range(first_shard, last_shard + 1)
+        )
+        for shard in self.map_shards(generate_visit_shard, shards):
+            visit_date = shard["visit_timestamp"].astype('datetime64[D]')
+            in_window = (visit_date >= first) & (visit_date <= last)
+            yield {name: column[in_window] for name, column in shard.items()}
+
+    def generate_visits_columnar(self):
+        """
+        Generates synthetic visit data for the whole generation period column-wise.
+
+        Returns:
+            Dict[str, np.ndarray]: A dictionary of equally sized column arrays, see sample_visit_columns(). The
+                                   arrays are empty if the period has no days.
+        """
+        shards = list(self.iter_visit_shards()) or [empty_visit_columns()]
+        return {name: np.concatenate([shard[name] for shard in shards]) for name in shards[0]}
+
+    def iter_visit_batches(self, batch_size, start_date=None, end_date=None):
+        """
+        Lazily generates synthetic visit data for the generation period in fixed-size columnar batches.
+
+        Visits are generated shard by shard and re-sliced into batches, so peak memory depends on batch_size
+        and shard_days only, not on the length of the period. The concatenated batches are identical to
+        generate_visits_columnar() for the same seed.
+
+        Args:
+            batch_size (int): The number of visits per batch. Only the last batch may be smaller.
+            start_date (Optional[date]): The first day to generate. Defaults to the configured start_date.
+            end_date (Optional[date]): The last day to generate. Defaults to the configured end_date.
+
+        Yields:
+            Dict[str, np.ndarray]: A dictionary of column arrays, see sample_visit_columns().
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be positive, got {batch_size}")
+
+        pending = None
+        for block in self.iter_visit_shards(start_date, end_date):
+            if pending is not None:
+                block = {name: np.concatenate((pending[name], column)) for name, column in block.items()}
+            num_rows = len(block["visit_timestamp"])
+            offset = 0
+            while num_rows - offset >= batch_size:
+                yield {name: column[offset:offset + batch_size] for name, column in block.items()}
+                offset += batch_size
+            pending = {name: column[offset:] for name, column in block.items()}
+
+        if pending is not None and len(pending["visit_timestamp"]):
+            yield pending
+
+    @staticmethod
+    def columns_to_records(columns):
+        """
+        Converts columnar data into row dictionaries with native Python values.
+
+        Timestamps are rendered as '%Y-%m-%d %H:%M:%S' strings, the same format generate_visits() produces,
+        and dates as '%Y-%m-%d' strings.
+
+        Args:
+            columns (Dict[str, np.ndarray]): A dictionary of equally sized column arrays.
+
+        Yields:
+            dict: One dictionary per row.
+        """
+        names = list(columns)
+        values = []
+        for name in names:
+            column = columns[name]
+            if np.issubdtype(column.dtype, np.datetime64):
+                column = np.char.replace(np.datetime_as_string(column), 'T', ' ')
+            values.append(column.tolist())
+        for row in zip(*values):
+            yield dict(zip(names, row))
+
+    def generate_data(self, include_visits=True):
         """
         Generates synthetic data for patients, facilities, and visits, and stores them in the class attributes.
+
+        Args:
+            include_visits (bool): Whether to materialize visits as well. Disable it when visits are consumed
+                                   through iter_visit_batches(). Defaults to True.
         """
         self.patients = self.generate_patients()
         self.facilities = self.generate_facilities()
-        self.visits = self.generate_visits()
+        if include_visits:
+            self.visits = self.generate_visits_columnar() if self.columnar else self.generate_visits()
 
     def get_visits(self):
         """
         Retrieves the generated visit data.
 
         Returns:
-            List[dict]: A list of visit data dictionaries.
+            List[dict] or Dict[str, np.ndarray]: A list of visit data dictionaries, or a dictionary of
+            column arrays when columnar generation is enabled.
         """
         return self.visits
 
+    def get_visit_records(self):
+        """
+        Retrieves the generated visit data as row dictionaries, regardless of the generation mode.
+
+        Returns:
+            Iterable[dict]: The visit data dictionaries.
+        """
+        if isinstance(self.visits, dict):
+            return self.columns_to_records(self.visits)
+        return self.visits
+
     def get_facilities(self):
         """
         Retrieves the generated facility data.
@@ -157,6 +599,18 @@ class DataGenerator:
         Retrieves the generated patient data.
 
         Returns:
-            List[dict]: A list of patient data dictionaries.
+            List[dict] or Dict[str, np.ndarray]: A list of patient data dictionaries, or a dictionary of
+            column arrays when a value pool is used.
+        """
+        return self.patients
+
+    def get_patient_records(self):
+        """
+        Retrieves the generated patient data as row dictionaries, regardless of the generation mode.
+
+        Returns:
+            Iterable[dict]: The patient data dictionaries.
         """
+        if isinstance(self.patients, dict):
+            return self.columns_to_records(self.patients)
         return self.patients
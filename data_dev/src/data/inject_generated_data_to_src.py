@@ -1,12 +1,41 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from data_dev.src.connectors.postgre_connector import PostgresConnectionPool
+from data_dev.src.data.copy_loader import CopyLoader
 from data_dev.src.data.data_generator import DataGenerator
+from data_dev.src.data.partitions import ensure_monthly_partitions
 from data_dev.queries import (
     CREATE_SRC_GENERATED_FACILITIES_TABLE_QUERY,
     CREATE_SRC_GENERATED_PATIENTS_TABLE_QUERY,
     CREATE_SRC_GENERATED_VISITS_TABLE_QUERY,
+    CREATE_SRC_GENERATED_VISITS_PARTITIONED_TABLE_QUERY,
+    CREATE_SRC_GENERATED_LOAD_STATE_TABLE_QUERY,
+    SELECT_SRC_GENERATED_WATERMARK_QUERY,
+    SELECT_SRC_GENERATED_VISITS_MAX_TIMESTAMP_QUERY,
+    UPSERT_SRC_GENERATED_WATERMARK_QUERY,
     INSERT_SRC_GENERATED_FACILITIES_QUERY,
     INSERT_SRC_GENERATED_PATIENTS_QUERY,
-    INSERT_SRC_GENERATED_VISITS_QUERY
+    INSERT_SRC_GENERATED_VISITS_QUERY,
+    SRC_GENERATED_FACILITIES_COLUMNS,
+    SRC_GENERATED_PATIENTS_COLUMNS,
+    SRC_GENERATED_VISITS_COLUMNS
 )
+from data_dev.config import src_loader_config
+
+# Row-by-row insert query and column list of every src table
+SRC_TABLES = {
+    'src_generated_facilities': (INSERT_SRC_GENERATED_FACILITIES_QUERY, SRC_GENERATED_FACILITIES_COLUMNS),
+    'src_generated_patients': (INSERT_SRC_GENERATED_PATIENTS_QUERY, SRC_GENERATED_PATIENTS_COLUMNS),
+    'src_generated_visits': (INSERT_SRC_GENERATED_VISITS_QUERY, SRC_GENERATED_VISITS_COLUMNS)
+}
+
+# Prefix of the global transaction ids of parallel loads, by which interrupted ones are recognised and recovered
+PARALLEL_LOAD_GTRID_PREFIX = 'src_generated_load-'
 
 
 class GeneratedDataLoader:
@@ -16,28 +45,69 @@ class GeneratedDataLoader:
     Attributes:
         conn (object): A database connection object.
         dg (DataGenerator): An instance of the DataGenerator class for generating synthetic data.
+        method (str): The load method, 'copy' or 'insert', sourced from src_loader_config.method.
+        copy_loader (CopyLoader): The COPY based bulk loader used by the 'copy' method.
+        incremental (bool): Whether loaded tables are extended day by day, sourced from src_loader_config.
+        incremental_days (int): The number of days appended per incremental run, sourced from src_loader_config.
+        parallel_workers (int): The number of connections loads run over, sourced from src_loader_config.
+        two_phase_commit (bool): Whether parallel loads are enabled, committed with two-phase commit, sourced from
+                                 src_loader_config.
+        pool (Optional[PostgresConnectionPool]): The pool parallel loads check their connections out of.
+        partition_visits (bool): Whether src_generated_visits is created range-partitioned by month,
+                                 sourced from src_loader_config.
+        partition_premake_months (int): The number of monthly partitions created in advance, sourced from
+                                        src_loader_config.
 
     Methods:
         - is_table_empty(cursor, table_name): Checks if a given table is empty.
         - inject_data_into_table(cursor, data, query): Inserts data into a table using a specified query.
+        - load_table(cursor, table_name, data): Loads data into a src table with the configured method.
+        - get_watermark(cursor): Returns the last loaded visit_timestamp.
+        - create_visits_table(cursor): Creates src_generated_visits, partitioned if configured.
+        - ensure_visit_partitions(cursor, start_date, end_date): Creates the monthly partitions of a load period.
+        - inject_full(cursor): Generates and loads the whole configured period.
+        - inject_incremental(cursor, watermark): Appends the days following the watermark.
+        - recover_parallel_loads(): Commits the prepared transactions of an interrupted parallel load.
+        - inject_data_parallel(): Loads tables and date slices of visits concurrently over pooled connections.
         - inject_data(): Creates tables (if not exist) and injects generated data into the database.
     """
 
-    def __init__(self, conn):
+    def __init__(self, conn, generator_config=None, pool=None):
         """
         Initializes the GeneratedDataLoader with a database connection.
 
         Args:
             conn (object): A database connection object.
+            generator_config (Optional[DataGeneratorConfig]): The generation settings, e.g. a scale-factor profile.
+                                                              Defaults to data_generator_config.
+            pool (Optional[PostgresConnectionPool]): The pool parallel loads check their connections out of.
+                                                     When omitted, parallel loads open a pool of their own.
+
+        Raises:
+            ValueError: If parallel_workers > 1 is configured without two_phase_commit.
         """
         self.conn = conn
-        self.dg = DataGenerator()
+        self.dg = DataGenerator(generator_config)
+        self.method = src_loader_config.method
+        self.copy_loader = CopyLoader(page_size=src_loader_config.insert_page_size)
+        self.incremental = src_loader_config.incremental
+        self.incremental_days = src_loader_config.incremental_days
+        self.parallel_workers = src_loader_config.parallel_workers
+        self.two_phase_commit = src_loader_config.two_phase_commit
+        self.pool = pool
+        self.partition_visits = src_loader_config.partition_visits
+        self.partition_premake_months = src_loader_config.partition_premake_months
+        if self.parallel_workers > 1 and not self.two_phase_commit:
+            raise ValueError("parallel_workers > 1 requires two_phase_commit: the loads over several connections "
+                             "can only be committed all-or-nothing with prepared transactions")
 
     @staticmethod
     def is_table_empty(cursor, table_name):
         """
         Checks if a given table is empty.
 
+        Only the existence of a single row is probed, so the check does not scan the table.
+
         Args:
             cursor (object): A database cursor object.
             table_name (str): The name of the table to check.
@@ -45,9 +115,9 @@ class GeneratedDataLoader:
         Returns:
             bool: True if the table is empty, False otherwise.
         """
-        query = f"SELECT COUNT(*) FROM {table_name}"
+        query = f"SELECT NOT EXISTS (SELECT 1 FROM {table_name})"
         cursor.execute(query)
-        return cursor.fetchone()[0] == 0
+        return cursor.fetchone()[0]
 
     @staticmethod
     def inject_data_into_table(cursor, data, query):
@@ -56,54 +126,383 @@ class GeneratedDataLoader:
 
         Args:
             cursor (object): A database cursor object.
-            data (list): A list of data to be inserted.
+            data (Iterable[dict]): The rows to be inserted.
             query (str): The SQL query for inserting data.
         """
         for params in data:
             cursor.execute(query, params)
 
+    def load_table(self, cursor, table_name, data, copy_loader=None):
+        """
+        Loads data into a src table with the configured method.
+
+        Args:
+            cursor (object): A database cursor object.
+            table_name (str): The name of the src table.
+            data (Dict[str, np.ndarray] or List[dict]): Column arrays or row dictionaries.
+            copy_loader (Optional[CopyLoader]): The loader of the 'copy' method. Defaults to the loader's own,
+                                                parallel loads pass one per connection.
+        """
+        query, columns = SRC_TABLES[table_name]
+        if self.method == 'copy':
+            (copy_loader or self.copy_loader).load(cursor, table_name, columns, data)
+        else:
+            records = self.dg.columns_to_records(data) if isinstance(data, dict) else data
+            self.inject_data_into_table(cursor=cursor, data=records, query=query)
+
+    @staticmethod
+    def get_watermark(cursor):
+        """
+        Returns the last loaded visit_timestamp recorded in src_generated_load_state.
+
+        Tables loaded before the watermark was introduced have no recorded state, for them the watermark is
+        computed once from src_generated_visits.
+
+        Args:
+            cursor (object): A database cursor object.
+
+        Returns:
+            Optional[datetime]: The last loaded visit_timestamp, or None if no visits are loaded.
+        """
+        cursor.execute(SELECT_SRC_GENERATED_WATERMARK_QUERY)
+        row = cursor.fetchone()
+        if row is not None:
+            return row[0]
+        cursor.execute(SELECT_SRC_GENERATED_VISITS_MAX_TIMESTAMP_QUERY)
+        return cursor.fetchone()[0]
+
+    def create_visits_table(self, cursor):
+        """
+        Creates src_generated_visits if it does not exist, range-partitioned by month if partition_visits is set.
+
+        Args:
+            cursor (object): A database cursor object.
+        """
+        if self.partition_visits:
+            cursor.execute(CREATE_SRC_GENERATED_VISITS_PARTITIONED_TABLE_QUERY)
+        else:
+            cursor.execute(CREATE_SRC_GENERATED_VISITS_TABLE_QUERY)
+
+    def ensure_visit_partitions(self, cursor, start_date, end_date):
+        """
+        Creates the monthly partitions of src_generated_visits covering a load period and the
+        partition_premake_months following months. Does nothing if the table is not partitioned.
+
+        Args:
+            cursor (object): A database cursor object.
+            start_date (date): The first day of the load period.
+            end_date (date): The last day of the load period.
+        """
+        num_partitions = ensure_monthly_partitions(cursor, 'src_generated_visits', start_date, end_date,
+                                                   self.partition_premake_months)
+        if num_partitions is None and self.partition_visits:
+            logging.warning("src_generated_visits already exists unpartitioned, loading it without partitions")
+
+    @staticmethod
+    def latest_visit_timestamp(visits):
+        """
+        Returns the latest visit_timestamp of a set of visits.
+
+        Args:
+            visits (Dict[str, np.ndarray] or List[dict]): Column arrays or row dictionaries.
+
+        Returns:
+            Optional[datetime]: The latest visit_timestamp, or None if there are no visits.
+        """
+        if isinstance(visits, dict):
+            if not len(visits["visit_timestamp"]):
+                return None
+            return visits["visit_timestamp"].max().astype('datetime64[s]').astype(datetime)
+        if not visits:
+            return None
+        return max(datetime.strptime(visit["visit_timestamp"], "%Y-%m-%d %H:%M:%S") for visit in visits)
+
+    def load_visits(self, cursor, batches):
+        """
+        Loads batches of visits into src_generated_visits.
+
+        Args:
+            cursor (object): A database cursor object.
+            batches (Iterable): Batches of column arrays or row dictionaries.
+
+        Returns:
+            Optional[datetime]: The latest loaded visit_timestamp, or None if nothing was loaded.
+        """
+        latest = None
+        for batch in batches:
+            self.load_table(cursor, 'src_generated_visits', batch)
+            batch_latest = self.latest_visit_timestamp(batch)
+            if batch_latest is not None and (latest is None or batch_latest > latest):
+                latest = batch_latest
+        return latest
+
+    def inject_full(self, cursor):
+        """
+        Generates facilities, patients and the visits of the whole configured period and loads them.
+
+        Args:
+            cursor (object): A database cursor object.
+
+        Returns:
+            Optional[datetime]: The latest loaded visit_timestamp.
+        """
+        streaming = self.dg.batch_size is not None
+        self.dg.generate_data(include_visits=not streaming)
+        self.load_table(cursor, 'src_generated_facilities', self.dg.get_facilities())
+        self.load_table(cursor, 'src_generated_patients', self.dg.get_patients())
+        self.ensure_visit_partitions(cursor,
+                                     datetime.strptime(self.dg.start_date, self.dg.date_format).date(),
+                                     datetime.strptime(self.dg.end_date, self.dg.date_format).date())
+        if streaming:
+            return self.load_visits(cursor, self.dg.iter_visit_batches(self.dg.batch_size))
+        return self.load_visits(cursor, [self.dg.get_visits()])
+
+    def inject_incremental(self, cursor, watermark):
+        """
+        Generates and loads the visits of the incremental_days days following the watermark.
+
+        Args:
+            cursor (object): A database cursor object.
+            watermark (datetime): The last loaded visit_timestamp.
+
+        Returns:
+            Optional[datetime]: The latest loaded visit_timestamp.
+        """
+        start_date = watermark.date() + timedelta(days=1)
+        end_date = start_date + timedelta(days=self.incremental_days - 1)
+        self.ensure_visit_partitions(cursor, start_date, end_date)
+        batch_size = self.dg.batch_size or np.iinfo(np.int64).max
+        return self.load_visits(cursor, self.dg.iter_visit_batches(batch_size, start_date, end_date))
+
+    def split_dates(self, start_date, end_date):
+        """
+        Splits a period into parallel_workers contiguous date slices of about equal length.
+
+        Args:
+            start_date (date): The first day of the period.
+            end_date (date): The last day of the period.
+
+        Returns:
+            List[Tuple[date, date]]: The first and last day of every non-empty slice.
+        """
+        num_days = (end_date - start_date).days + 1
+        bounds = np.linspace(0, num_days, min(self.parallel_workers, num_days) + 1).astype(int)
+        return [
+            (start_date + timedelta(days=int(first)), start_date + timedelta(days=int(last) - 1))
+            for first, last in zip(bounds[:-1], bounds[1:])
+        ]
+
+    def run_parallel_tasks(self, pool, tasks):
+        """
+        Runs load tasks concurrently over parallel_workers pooled connections and commits them only once all of
+        them succeeded.
+
+        Tasks are dealt round-robin to the connections. Every connection runs its tasks in a single two-phase
+        commit transaction, with a cursor and a CopyLoader of its own. Once all tasks succeeded, the latest loaded
+        visit_timestamp is recorded as the watermark in the transaction of the first connection, and all
+        transactions are prepared before the first one is committed, so data and watermark become visible
+        together. If any task or prepare fails, the transactions of all connections are rolled back. If a commit
+        fails, the remaining transactions are still committed before the error is raised; transactions left
+        prepared, e.g. because the process died between the commits, are committed by recover_parallel_loads()
+        before the next parallel load.
+
+        Args:
+            pool (PostgresConnectionPool): The pool the connections are checked out of.
+            tasks (List[Tuple[str, Callable]]): The name and the function(cursor, copy_loader) of every task.
+                                                A function returns the latest visit_timestamp it loaded, or None.
+
+        Returns:
+            Optional[datetime]: The latest visit_timestamp loaded by any task.
+        """
+        num_workers = min(self.parallel_workers, len(tasks))
+        assignments = [tasks[worker::num_workers] for worker in range(num_workers)]
+        gtrid = f"{PARALLEL_LOAD_GTRID_PREFIX}{uuid.uuid4().hex}"
+        connections = []
+
+        def run(worker):
+            conn = connections[worker]
+            conn.tpc_begin(conn.xid(0, gtrid, f"worker-{worker}"))
+            loader = CopyLoader(page_size=self.copy_loader.page_size)
+            results = []
+            with conn.cursor() as cursor:
+                for name, func in assignments[worker]:
+                    started = datetime.now()
+                    results.append(func(cursor, loader))
+                    logging.info(f"Parallel load task {name} finished in "
+                                 f"{(datetime.now() - started).total_seconds():.2f}s")
+            return results
+
+        try:
+            for _ in range(num_workers):
+                connections.append(pool.getconn())
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                futures = [executor.submit(run, worker) for worker in range(num_workers)]
+            results = [result for future in futures for result in future.result() if result is not None]
+            latest = max(results) if results else None
+            if latest is not None:
+                with connections[0].cursor() as cursor:
+                    cursor.execute(UPSERT_SRC_GENERATED_WATERMARK_QUERY, {'last_visit_timestamp': latest})
+            for conn in connections:
+                conn.tpc_prepare()
+        except Exception:
+            for conn in connections:
+                try:
+                    conn.tpc_rollback()
+                except Exception as e:
+                    logging.warning(f"Rollback of a parallel load failed: {e}")
+            raise
+        else:
+            commit_error = None
+            for conn in connections:
+                try:
+                    conn.tpc_commit()
+                except Exception as e:
+                    logging.error(f"Commit of a parallel load failed, it stays prepared until the next load: {e}")
+                    commit_error = commit_error or e
+            if commit_error is not None:
+                raise commit_error
+        finally:
+            for conn in connections:
+                pool.putconn(conn)
+        return latest
+
+    def recover_parallel_loads(self):
+        """
+        Commits the transactions of earlier parallel loads left prepared in the current database.
+
+        run_parallel_tasks() only starts committing once the transactions of all connections are prepared, so a
+        load interrupted during its commits is completed rather than rolled back. Until then, the prepared
+        transactions hide their data behind an advanced watermark and hold locks on the src tables.
+
+        Returns:
+            int: The number of transactions committed.
+        """
+        database = self.conn.info.dbname
+        xids = [xid for xid in self.conn.tpc_recover()
+                if xid.database == database and (xid.gtrid or '').startswith(PARALLEL_LOAD_GTRID_PREFIX)]
+        for xid in xids:
+            logging.warning(f"Committing the prepared transaction {xid.gtrid} {xid.bqual} of an interrupted "
+                            f"parallel load")
+            self.conn.tpc_commit(xid)
+        return len(xids)
+
+    def inject_data_parallel(self):
+        """
+        Creates tables (if they don't exist) and injects generated data into the database concurrently.
+
+        Transactions of an interrupted earlier parallel load are committed first, see recover_parallel_loads().
+        Facilities, patients and date slices of the visits are generated and loaded by parallel_workers threads,
+        each over its own pooled connection with the configured method. The loads and the watermark are committed
+        together once all of them succeeded, see run_parallel_tasks().
+        """
+        self.recover_parallel_loads()
+        cursor = self.conn.cursor()
+        try:
+            # Tables have to be committed before other connections can load into them
+            cursor.execute(CREATE_SRC_GENERATED_FACILITIES_TABLE_QUERY)
+            cursor.execute(CREATE_SRC_GENERATED_PATIENTS_TABLE_QUERY)
+            self.create_visits_table(cursor)
+            cursor.execute(CREATE_SRC_GENERATED_LOAD_STATE_TABLE_QUERY)
+            self.conn.commit()
+
+            tasks = []
+            if self.is_table_empty(cursor=cursor, table_name='src_generated_visits'):
+                start_date = datetime.strptime(self.dg.start_date, self.dg.date_format).date()
+                end_date = datetime.strptime(self.dg.end_date, self.dg.date_format).date()
+
+                def load_facilities(cur, loader):
+                    self.load_table(cur, 'src_generated_facilities', self.dg.generate_facilities(), loader)
+
+                def load_patients(cur, loader):
+                    self.load_table(cur, 'src_generated_patients', self.dg.generate_patients(), loader)
+
+                tasks.append(('facilities', load_facilities))
+                tasks.append(('patients', load_patients))
+            elif self.incremental:
+                start_date = self.get_watermark(cursor).date() + timedelta(days=1)
+                end_date = start_date + timedelta(days=self.incremental_days - 1)
+            else:
+                return
+            self.ensure_visit_partitions(cursor, start_date, end_date)
+            self.conn.commit()
+
+            batch_size = self.dg.batch_size or np.iinfo(np.int64).max
+            for slice_start, slice_end in self.split_dates(start_date, end_date):
+                def load_visits_slice(cur, loader, first=slice_start, last=slice_end):
+                    latest = None
+                    for batch in self.dg.iter_visit_batches(batch_size, first, last):
+                        self.load_table(cur, 'src_generated_visits', batch, loader)
+                        batch_latest = self.latest_visit_timestamp(batch)
+                        if batch_latest is not None and (latest is None or batch_latest > latest):
+                            latest = batch_latest
+                    return latest
+
+                tasks.append((f"visits-{slice_start}", load_visits_slice))
+
+            pool = self.pool or PostgresConnectionPool(min_size=1, max_size=self.parallel_workers)
+            try:
+                started = datetime.now()
+                self.run_parallel_tasks(pool, tasks)
+                logging.info(f"Loaded {len(tasks)} parallel tasks over {self.parallel_workers} connections "
+                             f"in {(datetime.now() - started).total_seconds():.2f}s")
+            finally:
+                if self.pool is None:
+                    pool.close()
+        except Exception as e:
+            # Rollback the transaction in case of an error
+            self.conn.rollback()
+            print(f"Error occurred: {e}")
+            raise
+        finally:
+            # Close the cursor
+            cursor.close()
+
     def inject_data(self):
         """
         Creates tables (if they don't exist) and injects generated data into the database.
 
         This method:
-        1. Creates the `src_generated_facilities`, `src_generated_patients`, and 
-           `src_generated_visits` tables if they do not already exist.
+        1. Creates the `src_generated_facilities`, `src_generated_patients`, `src_generated_visits` and
+           `src_generated_load_state` tables if they do not already exist.
         2. Checks if the `src_generated_visits` table is empty.
         3. If the table is empty, generates synthetic data for facilities, patients, and visits.
-        4. Inserts the generated data into the respective tables.
-        5. Commits the transaction if successful, or rolls back in case of an error.
+           If it is not empty and incremental loading is enabled, generates the visits of the days following
+           the recorded visit_timestamp watermark instead.
+        4. Loads the generated data into the respective tables with COPY or row-by-row inserts, depending
+           on the configured method. When a generator batch size is configured, visits are loaded batch
+           by batch as they are generated.
+        5. Records the latest loaded visit_timestamp as the new watermark.
+        6. Commits the transaction if successful, or rolls back and re-raises the error otherwise.
+
+        With more than one parallel worker the data is loaded by inject_data_parallel() instead.
         """
+        if self.parallel_workers > 1:
+            return self.inject_data_parallel()
+
         cursor = self.conn.cursor()
         try:
             # Create tables if they do not exist
             cursor.execute(CREATE_SRC_GENERATED_FACILITIES_TABLE_QUERY)
             cursor.execute(CREATE_SRC_GENERATED_PATIENTS_TABLE_QUERY)
-            cursor.execute(CREATE_SRC_GENERATED_VISITS_TABLE_QUERY)
+            self.create_visits_table(cursor)
+            cursor.execute(CREATE_SRC_GENERATED_LOAD_STATE_TABLE_QUERY)
 
-            # Generate and insert data if the visits table is empty
+            # Generate and insert data if the visits table is empty, or append new days incrementally
             if self.is_table_empty(cursor=cursor, table_name='src_generated_visits'):
-                self.dg.generate_data()
-                self.inject_data_into_table(
-                    cursor=cursor,
-                    data=self.dg.get_facilities(),
-                    query=INSERT_SRC_GENERATED_FACILITIES_QUERY
-                )
-                self.inject_data_into_table(
-                    cursor=cursor,
-                    data=self.dg.get_patients(),
-                    query=INSERT_SRC_GENERATED_PATIENTS_QUERY
-                )
-                self.inject_data_into_table(
-                    cursor=cursor,
-                    data=self.dg.get_visits(),
-                    query=INSERT_SRC_GENERATED_VISITS_QUERY
-                )
-                self.conn.commit()
+                latest = self.inject_full(cursor)
+            elif self.incremental:
+                latest = self.inject_incremental(cursor, self.get_watermark(cursor))
+            else:
+                latest = None
+
+            if latest is not None:
+                cursor.execute(UPSERT_SRC_GENERATED_WATERMARK_QUERY, {'last_visit_timestamp': latest})
+            self.conn.commit()
         except Exception as e:
             # Rollback the transaction in case of an error
             self.conn.rollback()
             print(f"Error occurred: {e}")
+            raise
         finally:
             # Close the cursor
             cursor.close()
@@ -0,0 +1,265 @@
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Declared schema of SELECT_MART_VISITS_SQL
+MART_VISITS_SCHEMA = pa.schema([
+    ('facility_type', pa.string()),
+    ('facility_name', pa.string()),
+    ('full_name', pa.string()),
+    ('visit_timestamp', pa.timestamp('us')),
+    ('treatment_cost_cents', pa.int64()),
+    ('duration_minutes', pa.int64())
+])
+
+# Filters of TRANSFORM_FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_SQL, mistakes included
+AVG_TIME_SPENT_MIN_VISIT_TIMESTAMP = datetime(2000, 11, 1)
+AVG_TIME_SPENT_FACILITY_TYPES = ['Hospital', 'Clinic', 'Specialty Center']
+
+# Facility type whose treatment cost sums are negated, and whose min time spent rows are duplicated
+CLINIC = 'Clinic'
+
+# Number of partial aggregates collected per mart before they are combined into one table
+COMBINE_PARTS = 16
+
+
+def round_half_up_ratio(numerator, denominator, decimals=2):
+    """
+    Divides integer arrays and rounds half away from zero, like PostgreSQL's ROUND(numeric, decimals).
+
+    The quotient is rounded in exact integer arithmetic before it is converted to float, so the result is the
+    float nearest to the exactly rounded decimal, as when PostgreSQL NUMERIC values are fetched as floats.
+
+    Parameters:
+    -----------
+    numerator : np.ndarray
+        Integer numerators.
+    denominator : np.ndarray
+        Positive integer denominators.
+    decimals : int
+        Number of decimal places. Defaults to 2.
+
+    Returns:
+    --------
+    np.ndarray
+        The rounded quotients as float64.
+    """
+    scale = 10 ** decimals
+    magnitude = (2 * scale * np.abs(numerator) + denominator) // (2 * denominator)
+    return np.sign(numerator) * magnitude / scale
+
+
+def group_aggregate(table, keys, aggregations):
+    """
+    Groups a table and names the aggregate columns.
+
+    Parameters:
+    -----------
+    table : pa.Table
+        Table to aggregate.
+    keys : list
+        Names of the key columns.
+    aggregations : dict
+        Output column name mapped to the (input column, aggregate function) pair.
+
+    Returns:
+    --------
+    pa.Table
+        The key columns followed by the named aggregate columns.
+    """
+    result = table.group_by(keys).aggregate(list(aggregations.values()))
+    columns = {key: result.column(key) for key in keys}
+    columns.update({name: result.column(f"{column}_{function}") for name, (column, function) in aggregations.items()})
+    return pa.table(columns)
+
+
+class MartAggregator:
+    """
+    Computes all Parquet marts from one stream of joined visit rows (SELECT_MART_VISITS_SQL).
+
+    Every record batch is reduced to partial aggregates right away (sum and count for averages, sums, minimums).
+    Every COMBINE_PARTS batches the partial aggregates of each mart are combined into a single table, so memory is
+    bounded by the number of groups rather than visits.
+    The results replicate the TRANSFORM_* queries, including their known mistakes:
+    - the average time spent only covers visits after 2000-11-01 at Hospital, Clinic and Specialty Center facilities,
+    - the full_name of patients with id <= 15 is NULL (already applied by the query),
+    - treatment cost sums of Clinic facilities are negated,
+    - the minimum time spent rows of Clinic facilities appear twice.
+
+    Attributes:
+    -----------
+    avg_parts : list
+        Partial (facility_type, visit_date, duration sum, visit count) tables, at most COMBINE_PARTS.
+    sum_parts : list
+        Partial (facility_type, full_name, cost sum in cents) tables, at most COMBINE_PARTS.
+    min_parts : list
+        Partial (facility_name, visit_date, minimum duration) tables over all facilities, at most COMBINE_PARTS.
+    clinic_min_parts : list
+        Partial (facility_name, visit_date, minimum duration) tables over Clinic facilities, at most COMBINE_PARTS.
+    """
+
+    def __init__(self):
+        """
+        Initializes the aggregator with the partial aggregates of an empty batch, so the marts of a stream
+        without visits are empty tables.
+        """
+        self.avg_parts = []
+        self.sum_parts = []
+        self.min_parts = []
+        self.clinic_min_parts = []
+        self.update(pa.RecordBatch.from_pylist([], schema=MART_VISITS_SCHEMA))
+
+    @staticmethod
+    def min_time_spent(table):
+        """
+        Aggregates the minimum duration per facility name and visit date.
+
+        Parameters:
+        -----------
+        table : pa.Table
+            Table with facility_name, visit_date and duration_minutes (or partial min_time_spent) columns.
+
+        Returns:
+        --------
+        pa.Table
+            The facility_name, visit_date and min_time_spent columns.
+        """
+        column = 'duration_minutes' if 'duration_minutes' in table.column_names else 'min_time_spent'
+        return group_aggregate(table, ['facility_name', 'visit_date'], {'min_time_spent': (column, 'min')})
+
+    @staticmethod
+    def combine_avg_parts(parts):
+        """
+        Combines partial aggregates of the average time spent into one row per facility type and visit date.
+
+        Parameters:
+        -----------
+        parts : list
+            Partial (facility_type, visit_date, duration sum, visit count) tables.
+
+        Returns:
+        --------
+        pa.Table
+            The facility_type, visit_date, duration_sum and visit_count columns.
+        """
+        return group_aggregate(pa.concat_tables(parts), ['facility_type', 'visit_date'], {
+            'duration_sum': ('duration_sum', 'sum'),
+            'visit_count': ('visit_count', 'sum')
+        })
+
+    @staticmethod
+    def combine_sum_parts(parts):
+        """
+        Combines partial aggregates of the treatment cost into one row per facility type and patient name.
+
+        Parameters:
+        -----------
+        parts : list
+            Partial (facility_type, full_name, cost sum in cents) tables.
+
+        Returns:
+        --------
+        pa.Table
+            The facility_type, full_name and cost_cents columns.
+        """
+        return group_aggregate(pa.concat_tables(parts), ['facility_type', 'full_name'], {
+            'cost_cents': ('cost_cents', 'sum')
+        })
+
+    def combine_parts(self):
+        """
+        Replaces the partial aggregates of every mart by a single table holding one row per group.
+        """
+        self.avg_parts = [self.combine_avg_parts(self.avg_parts)]
+        self.sum_parts = [self.combine_sum_parts(self.sum_parts)]
+        self.min_parts = [self.min_time_spent(pa.concat_tables(self.min_parts))]
+        self.clinic_min_parts = [self.min_time_spent(pa.concat_tables(self.clinic_min_parts))]
+
+    def update(self, batch):
+        """
+        Reduces a record batch of joined visit rows to partial aggregates, and combines the partial aggregates
+        once COMBINE_PARTS of them are collected.
+
+        Parameters:
+        -----------
+        batch : pa.RecordBatch
+            Rows with the MART_VISITS_SCHEMA columns.
+        """
+        visit_date = pc.cast(batch.column('visit_timestamp'), pa.date32())
+        table = pa.Table.from_batches([batch]).append_column('visit_date', visit_date)
+
+        min_visit_timestamp = pa.scalar(AVG_TIME_SPENT_MIN_VISIT_TIMESTAMP, type=batch.schema.field('visit_timestamp').type)
+        avg_rows = table.filter(pc.and_(
+            pc.greater(table.column('visit_timestamp'), min_visit_timestamp),
+            pc.is_in(table.column('facility_type'), value_set=pa.array(AVG_TIME_SPENT_FACILITY_TYPES))
+        ))
+        self.avg_parts.append(group_aggregate(avg_rows, ['facility_type', 'visit_date'], {
+            'duration_sum': ('duration_minutes', 'sum'),
+            'visit_count': ('duration_minutes', 'count')
+        }))
+        self.sum_parts.append(group_aggregate(table, ['facility_type', 'full_name'], {
+            'cost_cents': ('treatment_cost_cents', 'sum')
+        }))
+        self.min_parts.append(self.min_time_spent(table))
+        self.clinic_min_parts.append(
+            self.min_time_spent(table.filter(pc.equal(table.column('facility_type'), CLINIC)))
+        )
+        if len(self.avg_parts) >= COMBINE_PARTS:
+            self.combine_parts()
+
+    def facility_type_avg_time_spent_per_visit_date(self):
+        """
+        Combines the partial aggregates of the average time spent per facility type and visit date.
+
+        Returns:
+        --------
+        pa.Table
+            The facility_type, visit_date and avg_time_spent columns.
+        """
+        combined = self.combine_avg_parts(self.avg_parts)
+        avg_time_spent = round_half_up_ratio(
+            combined.column('duration_sum').to_numpy(),
+            combined.column('visit_count').to_numpy()
+        )
+        return pa.table({
+            'facility_type': combined.column('facility_type'),
+            'visit_date': pc.cast(combined.column('visit_date'), pa.timestamp('ns')),
+            'avg_time_spent': pa.array(avg_time_spent, type=pa.float64())
+        })
+
+    def patient_sum_treatment_cost_per_facility_type(self):
+        """
+        Combines the partial aggregates of the treatment cost sum per facility type and patient name.
+
+        Returns:
+        --------
+        pa.Table
+            The facility_type, full_name and sum_treatment_cost columns.
+        """
+        combined = self.combine_sum_parts(self.sum_parts)
+        cents = combined.column('cost_cents').to_numpy()
+        is_clinic = pc.equal(combined.column('facility_type'), CLINIC).to_numpy(zero_copy_only=False)
+        return pa.table({
+            'facility_type': combined.column('facility_type'),
+            'full_name': combined.column('full_name'),
+            'sum_treatment_cost': pa.array(np.where(is_clinic, -cents, cents) / 100, type=pa.float64())
+        })
+
+    def facility_name_min_time_spent_per_visit_date(self):
+        """
+        Combines the partial aggregates of the minimum time spent per facility name and visit date.
+
+        Returns:
+        --------
+        pa.Table
+            The facility_name, visit_date and min_time_spent columns, with the Clinic rows appended again.
+        """
+        combined = pa.concat_tables([self.min_time_spent(pa.concat_tables(self.min_parts)),
+                                     self.min_time_spent(pa.concat_tables(self.clinic_min_parts))])
+        return pa.table({
+            'facility_name': combined.column('facility_name'),
+            'visit_date': pc.cast(combined.column('visit_date'), pa.timestamp('ns')),
+            'min_time_spent': combined.column('min_time_spent')
+        })
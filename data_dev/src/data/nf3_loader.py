@@ -1,9 +1,37 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import psycopg2
+from psycopg2 import sql
+
 from data_dev.queries import (CREATE_FACILITIES_TABLE_QUERY,
                               CREATE_PATIENTS_TABLE_QUERY,
-                              CREATE_VISITS_TABLE_QUERY)
+                              CREATE_VISITS_TABLE_QUERY,
+                              CREATE_VISITS_PARTITIONED_TABLE_QUERY)
 from data_dev.queries import (MERGE_PATIENTS_QUERY,
                               MERGE_VISITS_QUERY,
                               MERGE_FACILITIES_QUERY)
+from data_dev.queries import (CREATE_NF3_LOAD_STATE_TABLE_QUERY,
+                              SELECT_NF3_WATERMARK_QUERY,
+                              UPSERT_NF3_WATERMARK_QUERY,
+                              MERGE_VISITS_INCREMENTAL_QUERY,
+                              SELECT_SRC_VISITS_MAX_TIMESTAMP_IN_SCOPE_QUERY,
+                              SELECT_SRC_VISITS_TIMESTAMP_RANGE_QUERY)
+from data_dev.queries import (MERGE_VISITS_WINDOW_QUERY,
+                              SELECT_SRC_VISITS_MAX_TIMESTAMP_IN_WINDOW_QUERY,
+                              CREATE_NF3_MERGE_WINDOWS_TABLE_QUERY,
+                              SELECT_NF3_MERGE_WINDOWS_QUERY,
+                              INSERT_NF3_MERGE_WINDOW_QUERY,
+                              DELETE_NF3_MERGE_WINDOWS_QUERY)
+from data_dev.queries import (NF3_INDEXES,
+                              CREATE_INDEX_QUERY,
+                              DROP_INDEX_QUERY,
+                              SELECT_INDEX_STATE_QUERY,
+                              ANALYZE_TABLE_QUERY)
+from data_dev.src.connectors.postgre_connector import PostgresConnectionPool, PostgresConnectorContextManager
+from data_dev.src.data.partitions import ensure_monthly_partitions, month_start, add_months
 from data_dev.config import load_config
 
 
@@ -13,53 +41,471 @@ class NF3Loader:
 
     This class is responsible for:
     1. Creating the necessary database tables if they do not already exist.
-    2. Merging data into the 3NF tables using predefined SQL queries.
+    2. Creating and verifying the indexes on the natural keys and the join/filter columns (NF3_INDEXES).
+    3. Merging data into the 3NF tables using predefined SQL queries.
+    4. Refreshing the planner statistics of the tables a merge changed.
 
     Attributes:
         conn: A psycopg2 database connection object used to interact with the database.
+        incremental_merge (bool): Whether only visits newer than the recorded watermark are merged,
+                                  sourced from load_config.incremental_merge.
+        partition_visits (bool): Whether visits is created range-partitioned by month, sourced from load_config.
+        partition_premake_months (int): The number of monthly partitions created in advance, sourced from
+                                        load_config.
+        merge_window_months (Optional[int]): The number of months visits are merged per committed window,
+                                             sourced from load_config. None merges visits in one transaction.
+        merge_workers (int): The number of connections windows are merged over concurrently, sourced from
+                             load_config.
+        pool (Optional[PostgresConnectionPool]): The pool parallel window merges check their connections out of.
     """
 
-    def __init__(self, conn):
+    def __init__(self, conn, pool=None):
         """
         Initialize the NF3Loader with a database connection.
 
         Args:
             conn: A psycopg2 database connection object.
+            pool (Optional[PostgresConnectionPool]): The pool parallel window merges check their connections out
+                                                     of. When omitted, parallel merges open a pool of their own.
         """
         self.conn = conn
+        self.incremental_merge = load_config.incremental_merge
+        self.partition_visits = load_config.partition_visits
+        self.partition_premake_months = load_config.partition_premake_months
+        self.merge_window_months = load_config.merge_window_months
+        self.merge_workers = load_config.merge_workers
+        self.pool = pool
+
+    @staticmethod
+    def get_watermark(cursor):
+        """
+        Get the source visit_timestamp up to which visits are merged.
+
+        Args:
+            cursor: A psycopg2 cursor object.
+
+        Returns:
+            Optional[datetime]: The recorded watermark, or None if visits have not been merged incrementally yet.
+        """
+        cursor.execute(SELECT_NF3_WATERMARK_QUERY)
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def get_index_state(cursor, index_name):
+        """
+        Get the state of an index, resolved through the search_path like the tables it indexes.
+
+        Args:
+            cursor: A psycopg2 cursor object.
+            index_name (str): The name of the index.
+
+        Returns:
+            Optional[Tuple[bool, bool]]: Whether the index is valid and whether it is unique, or None if it does not exist.
+        """
+        cursor.execute(SELECT_INDEX_STATE_QUERY, {'index_name': index_name})
+        return cursor.fetchone()
+
+    @staticmethod
+    def create_index(cursor, index_name, table_name, columns, unique):
+        """
+        Create an index if it does not exist.
+
+        Args:
+            cursor: A psycopg2 cursor object.
+            index_name (str): The name of the index.
+            table_name (str): The name of the indexed table.
+            columns (List[str]): The indexed columns.
+            unique (bool): Whether to create a unique index.
+        """
+        cursor.execute(sql.SQL(CREATE_INDEX_QUERY).format(
+            unique=sql.SQL('UNIQUE ' if unique else ''),
+            index=sql.Identifier(index_name),
+            table=sql.Identifier(table_name),
+            columns=sql.SQL(', ').join(map(sql.Identifier, columns))
+        ))
+
+    def ensure_index(self, cursor, index_name, table_name, columns, unique):
+        """
+        Make sure a valid index exists.
+
+        An invalid index (e.g. left behind by an interrupted build) is dropped and rebuilt. If a unique index
+        cannot be built because the table already holds duplicate keys, a non-unique index is created instead,
+        so lookups are still indexed until the duplicates are cleaned up.
+
+        Args:
+            cursor: A psycopg2 cursor object.
+            index_name (str): The name of the index.
+            table_name (str): The name of the indexed table.
+            columns (List[str]): The indexed columns.
+            unique (bool): Whether the index should be unique.
+
+        Raises:
+            RuntimeError: If the index is still invalid after it has been built.
+        """
+        state = self.get_index_state(cursor, index_name)
+        if state is not None and state[0]:
+            return
+        if state is not None:
+            logging.warning(f"Rebuilding invalid index {index_name} on {table_name}")
+            cursor.execute(sql.SQL(DROP_INDEX_QUERY).format(index=sql.Identifier(index_name)))
+
+        if unique:
+            cursor.execute("SAVEPOINT nf3_index")
+            try:
+                self.create_index(cursor, index_name, table_name, columns, unique=True)
+                cursor.execute("RELEASE SAVEPOINT nf3_index")
+            except psycopg2.errors.UniqueViolation as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT nf3_index")
+                logging.warning(f"{table_name} holds duplicate ({', '.join(columns)}) keys, "
+                                f"creating {index_name} as a non-unique index: {e}")
+                unique = False
+        if not unique:
+            self.create_index(cursor, index_name, table_name, columns, unique=False)
+
+        state = self.get_index_state(cursor, index_name)
+        if state is None or not state[0]:
+            raise RuntimeError(f"Index {index_name} on {table_name} is not valid")
+
+    def ensure_indexes(self, cursor):
+        """
+        Make sure all indexes of NF3_INDEXES exist and are valid.
+
+        Args:
+            cursor: A psycopg2 cursor object.
+        """
+        for index_name, table_name, columns, unique in NF3_INDEXES:
+            self.ensure_index(cursor, index_name, table_name, columns, unique)
+
+    def analyze_tables(self, table_names):
+        """
+        Refresh the planner statistics of the given tables and commit.
+
+        Args:
+            table_names (List[str]): The names of the tables to analyze.
+        """
+        if not table_names:
+            return
+        with self.conn.cursor() as cursor:
+            for table_name in table_names:
+                cursor.execute(sql.SQL(ANALYZE_TABLE_QUERY).format(table=sql.Identifier(table_name)))
+        self.conn.commit()
+
+    def ensure_visit_partitions(self, cursor, watermark):
+        """
+        Creates the monthly partitions of visits covering the source visits about to be merged and the
+        partition_premake_months following months. Does nothing if visits is not partitioned.
+
+        Args:
+            cursor: A psycopg2 cursor object.
+            watermark (Optional[datetime]): Only source visits after this timestamp are merged, None for all.
+
+        Returns:
+            Tuple[Optional[datetime], Optional[datetime]]: The first and the last source visit_timestamp to be
+                                                           merged, (None, None) if there is nothing to merge.
+        """
+        cursor.execute(SELECT_SRC_VISITS_TIMESTAMP_RANGE_QUERY,
+                       {'watermark': watermark, 'date_scope': load_config.date_scope})
+        first_visit, last_visit = cursor.fetchone()
+        if first_visit is None:
+            return first_visit, last_visit
+        num_partitions = ensure_monthly_partitions(cursor, 'visits', first_visit.date(), last_visit.date(),
+                                                   self.partition_premake_months)
+        if num_partitions is None and self.partition_visits:
+            logging.warning("visits already exists unpartitioned, merging into it without partitions")
+        return first_visit, last_visit
+
+    def merge_visits_incremental(self, cursor):
+        """
+        Merge the source visits between the recorded watermark and load_config.date_scope and advance the watermark.
+
+        Args:
+            cursor: A psycopg2 cursor object.
+
+        Returns:
+            int: The number of merged visits.
+        """
+        params = {'watermark': self.get_watermark(cursor), 'date_scope': load_config.date_scope}
+        self.ensure_visit_partitions(cursor, params['watermark'])
+        cursor.execute(MERGE_VISITS_INCREMENTAL_QUERY, params)
+        merged_rows = cursor.rowcount
+        cursor.execute(SELECT_SRC_VISITS_MAX_TIMESTAMP_IN_SCOPE_QUERY, params)
+        last_visit_timestamp = cursor.fetchone()[0]
+        if last_visit_timestamp is not None:
+            cursor.execute(UPSERT_NF3_WATERMARK_QUERY, {'last_visit_timestamp': last_visit_timestamp})
+        return merged_rows
+
+    def split_windows(self, first_visit, last_visit):
+        """
+        Split the merged period into windows of merge_window_months calendar months.
+
+        Windows start on the first day of every merge_window_months-th month counted from year 0, so the window
+        boundaries do not depend on where the merged period starts and a resumed load computes the same windows
+        again. The last window ends with load_config.date_scope.
+
+        Args:
+            first_visit (datetime): The first source visit_timestamp to be merged.
+            last_visit (datetime): The last source visit_timestamp to be merged.
+
+        Returns:
+            List[Tuple[datetime, datetime]]: The inclusive start and exclusive end of every window.
+        """
+        scope_end = datetime.strptime(load_config.date_scope, '%Y-%m-%d') + timedelta(days=1)
+        windows = []
+        window_start = month_start(first_visit.date())
+        window_start = add_months(window_start, -((window_start.year * 12 + window_start.month - 1)
+                                                  % self.merge_window_months))
+        while window_start <= last_visit.date():
+            window_end = add_months(window_start, self.merge_window_months)
+            windows.append((datetime.combine(window_start, datetime.min.time()),
+                            min(datetime.combine(window_end, datetime.min.time()), scope_end)))
+            window_start = window_end
+        return windows
+
+    @staticmethod
+    def merge_visits_window(conn, watermark, window_start, window_end):
+        """
+        Merge the source visits of one window and record the window as completed, in a transaction of its own.
+
+        Args:
+            conn: A psycopg2 database connection object.
+            watermark (Optional[datetime]): Only source visits after this timestamp are merged, None for all.
+            window_start (datetime): The inclusive start of the window.
+            window_end (datetime): The exclusive end of the window.
+
+        Returns:
+            Tuple[int, Optional[datetime]]: The number of merged visits and the latest source visit_timestamp
+                                            of the window.
+        """
+        params = {'watermark': watermark, 'window_start': window_start, 'window_end': window_end}
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(MERGE_VISITS_WINDOW_QUERY, params)
+                merged_rows = cursor.rowcount
+                cursor.execute(SELECT_SRC_VISITS_MAX_TIMESTAMP_IN_WINDOW_QUERY, params)
+                last_visit_timestamp = cursor.fetchone()[0]
+                cursor.execute(INSERT_NF3_MERGE_WINDOW_QUERY, {**params, 'merged_rows': merged_rows,
+                                                               'last_visit_timestamp': last_visit_timestamp})
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return merged_rows, last_visit_timestamp
+
+    def advance_watermark(self, windows, completed):
+        """
+        Advance the watermark to the latest source visit of the contiguous prefix of completed windows and commit.
+
+        Visits of a completed window after an unfinished one stay above the watermark, so they are never skipped
+        by a later incremental load. Without incremental merging no watermark is kept.
+
+        Args:
+            windows (List[Tuple[datetime, datetime]]): The windows of the load in date order.
+            completed (Dict[Tuple[datetime, datetime], Optional[datetime]]): The latest source visit_timestamp
+                                                                               of every completed window.
+        """
+        if not self.incremental_merge:
+            return
+        last_visit_timestamp = None
+        for window in windows:
+            if window not in completed:
+                break
+            if completed[window] is not None:
+                last_visit_timestamp = completed[window]
+        if last_visit_timestamp is not None:
+            with self.conn.cursor() as cursor:
+                cursor.execute(UPSERT_NF3_WATERMARK_QUERY, {'last_visit_timestamp': last_visit_timestamp})
+            self.conn.commit()
+
+    def log_window(self, window, merged_rows, elapsed):
+        """
+        Log the duration and throughput of a merged window.
+
+        Args:
+            window (Tuple[datetime, datetime]): The inclusive start and exclusive end of the window.
+            merged_rows (int): The number of merged visits.
+            elapsed (float): The duration of the window merge in seconds.
+        """
+        window_start, window_end = window
+        logging.info(f"Merged {merged_rows:,} visits of window {window_start:%Y-%m-%d} - {window_end:%Y-%m-%d} "
+                     f"in {elapsed:.2f}s ({merged_rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    def merge_windows_sequential(self, watermark, windows, pending, completed):
+        """
+        Merge the pending windows one after another over the loader's own connection.
+
+        Args:
+            watermark (Optional[datetime]): Only source visits after this timestamp are merged, None for all.
+            windows (List[Tuple[datetime, datetime]]): All windows of the load in date order.
+            pending (List[Tuple[datetime, datetime]]): The windows still to be merged.
+            completed (Dict[Tuple[datetime, datetime], Optional[datetime]]): The latest source visit_timestamp
+                                                                               of every completed window, updated
+                                                                               in place.
+
+        Returns:
+            int: The number of merged visits.
+        """
+        merged_rows = 0
+        for window in pending:
+            started = time.perf_counter()
+            rows, last_visit_timestamp = self.merge_visits_window(self.conn, watermark, *window)
+            self.log_window(window, rows, time.perf_counter() - started)
+            completed[window] = last_visit_timestamp
+            merged_rows += rows
+            self.advance_watermark(windows, completed)
+        return merged_rows
+
+    def merge_windows_parallel(self, watermark, windows, pending, completed):
+        """
+        Merge the pending windows concurrently over merge_workers pooled connections.
+
+        Every window is merged and committed by a worker thread over a connection checked out with
+        PostgresConnectorContextManager(pool=...). The watermark is advanced by the calling thread as windows
+        complete. A failed window does not stop the others; the first error is raised once all windows finished.
+
+        Args:
+            watermark (Optional[datetime]): Only source visits after this timestamp are merged, None for all.
+            windows (List[Tuple[datetime, datetime]]): All windows of the load in date order.
+            pending (List[Tuple[datetime, datetime]]): The windows still to be merged.
+            completed (Dict[Tuple[datetime, datetime], Optional[datetime]]): The latest source visit_timestamp
+                                                                               of every completed window, updated
+                                                                               in place.
+
+        Returns:
+            int: The number of merged visits.
+        """
+        def run(window):
+            started = time.perf_counter()
+            with PostgresConnectorContextManager(pool=pool) as connection_object:
+                rows, last_visit_timestamp = self.merge_visits_window(connection_object.get_connection(),
+                                                                      watermark, *window)
+            return rows, last_visit_timestamp, time.perf_counter() - started
+
+        num_workers = min(self.merge_workers, len(pending))
+        pool = self.pool or PostgresConnectionPool(min_size=1, max_size=num_workers)
+        merged_rows = 0
+        error = None
+        try:
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                futures = {executor.submit(run, window): window for window in pending}
+                for future in as_completed(futures):
+                    window = futures[future]
+                    try:
+                        rows, last_visit_timestamp, elapsed = future.result()
+                    except Exception as e:
+                        logging.error(f"Merging visits window {window[0]:%Y-%m-%d} - {window[1]:%Y-%m-%d} "
+                                      f"failed: {e}")
+                        error = error or e
+                        continue
+                    self.log_window(window, rows, elapsed)
+                    completed[window] = last_visit_timestamp
+                    merged_rows += rows
+                    self.advance_watermark(windows, completed)
+        finally:
+            if self.pool is None:
+                pool.close()
+        if error is not None:
+            raise error
+        return merged_rows
+
+    def merge_visits_windowed(self):
+        """
+        Merge the source visits window by window, committing every window separately.
+
+        Windows recorded in nf3_merge_windows by an interrupted earlier load are skipped. With merge_workers > 1
+        the windows are merged concurrently, see merge_windows_parallel(). Once every window is merged,
+        the recorded windows are cleared.
+
+        Returns:
+            int: The number of merged visits.
+        """
+        with self.conn.cursor() as cursor:
+            cursor.execute(CREATE_NF3_MERGE_WINDOWS_TABLE_QUERY)
+            watermark = self.get_watermark(cursor) if self.incremental_merge else None
+            first_visit, last_visit = self.ensure_visit_partitions(cursor, watermark)
+            cursor.execute(SELECT_NF3_MERGE_WINDOWS_QUERY)
+            completed = {(window_start, window_end): last_visit_timestamp
+                         for window_start, window_end, last_visit_timestamp in cursor.fetchall()}
+        self.conn.commit()
+
+        windows = self.split_windows(first_visit, last_visit) if first_visit is not None else []
+        pending = [window for window in windows if window not in completed]
+        if len(pending) < len(windows):
+            logging.info(f"Skipping {len(windows) - len(pending)} visits windows merged by an earlier load")
+
+        started = time.perf_counter()
+        if self.merge_workers > 1 and len(pending) > 1:
+            merged_rows = self.merge_windows_parallel(watermark, windows, pending, completed)
+        else:
+            merged_rows = self.merge_windows_sequential(watermark, windows, pending, completed)
+        elapsed = time.perf_counter() - started
+        if pending:
+            logging.info(f"Merged {merged_rows:,} visits in {len(pending)} windows over "
+                         f"{min(self.merge_workers, len(pending))} connections in {elapsed:.2f}s "
+                         f"({merged_rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+        with self.conn.cursor() as cursor:
+            cursor.execute(DELETE_NF3_MERGE_WINDOWS_QUERY)
+        self.conn.commit()
+        return merged_rows
 
     def load_data(self):
         """
         Load and transform data into the 3NF database schema.
 
         This method performs the following steps:
-        1. Creates the necessary tables (facilities, patients, visits) if they do not already exist.
-        2. Merges data into the 3NF tables using predefined SQL queries.
-        3. Commits the transaction if all operations succeed.
+        1. Creates the necessary tables (facilities, patients, visits) and indexes if they do not already exist.
+           A partitioned visits table gets the monthly partitions the merged source visits fall into.
+        2. Merges data into the 3NF tables using predefined SQL queries. With incremental merging, only source
+           visits between the recorded watermark and load_config.date_scope are merged and the watermark is
+           advanced in the same transaction.
+           With merge_window_months set, facilities and patients are committed first and visits are merged
+           window by window, see merge_visits_windowed().
+        3. Commits the transaction if all operations succeed and analyzes the tables that received rows.
         4. Rolls back the transaction and prints the error if any operation fails.
 
         Raises:
-            Exception: If any SQL execution fails, the exception is caught, the transaction is rolled back,
-                       and the error is printed.
+            Exception: If any SQL execution fails, the transaction is rolled back, the error is printed and
+                       the exception is re-raised.
         """
         cursor = self.conn.cursor()
         try:
             # Create tables if they do not exist
             cursor.execute(CREATE_FACILITIES_TABLE_QUERY)
             cursor.execute(CREATE_PATIENTS_TABLE_QUERY)
-            cursor.execute(CREATE_VISITS_TABLE_QUERY)
+            if self.partition_visits:
+                cursor.execute(CREATE_VISITS_PARTITIONED_TABLE_QUERY)
+            else:
+                cursor.execute(CREATE_VISITS_TABLE_QUERY)
+            cursor.execute(CREATE_NF3_LOAD_STATE_TABLE_QUERY)
+            self.ensure_indexes(cursor)
 
             # Merge data into 3NF tables
+            merged_rows = {}
             cursor.execute(MERGE_FACILITIES_QUERY)
+            merged_rows['facilities'] = cursor.rowcount
             cursor.execute(MERGE_PATIENTS_QUERY)
-            cursor.execute(MERGE_VISITS_QUERY, {'date_scope': load_config.date_scope})
+            merged_rows['patients'] = cursor.rowcount
+            if self.merge_window_months:
+                self.conn.commit()
+                merged_rows['visits'] = self.merge_visits_windowed()
+            elif self.incremental_merge:
+                merged_rows['visits'] = self.merge_visits_incremental(cursor)
+            else:
+                self.ensure_visit_partitions(cursor, None)
+                cursor.execute(MERGE_VISITS_QUERY, {'date_scope': load_config.date_scope})
+                merged_rows['visits'] = cursor.rowcount
 
             # Commit the transaction
             self.conn.commit()
+
+            # Refresh the statistics of the tables that received rows
+            self.analyze_tables([table_name for table_name, rows in merged_rows.items() if rows > 0])
         except Exception as e:
             # Rollback the transaction in case of an error
             self.conn.rollback()
             print(f"An error occurred during data loading: {e}")
+            raise
         finally:
             # Close the cursor
             cursor.close()
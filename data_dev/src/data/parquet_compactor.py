@@ -0,0 +1,213 @@
+import logging
+import math
+import os
+import shutil
+import time
+import uuid
+
+import pyarrow.dataset as ds
+
+from data_dev.config import parquet_storage_config
+from data_dev.src.data.parquet_loader import MARTS, parquet_write_options
+
+# Prefixes of the staging and backup directories of a partition swap. Paths starting with a dot are ignored by
+# Parquet dataset readers, so neither is ever read as part of the dataset.
+STAGING_PREFIX = '.compacting-'
+BACKUP_PREFIX = '.compacted-'
+
+
+def is_data_file(name):
+    """
+    Checks whether a file name is a Parquet data file of a dataset, as opposed to a hidden or state file.
+
+    Args:
+        name (str): The file name.
+
+    Returns:
+        bool: True for visible .parquet files.
+    """
+    return name.endswith('.parquet') and not name.startswith(('.', '_'))
+
+
+class ParquetCompactor:
+    """
+    A class to merge the small files of partitioned Parquet datasets into right-sized files.
+
+    Every partition directory holding more files than its size requires is rewritten into a hidden staging directory
+    next to it, which then replaces the partition with two renames. Readers see either the old or the new files,
+    never a mix of both; only between the two renames the partition is briefly missing. Interrupted swaps are
+    repaired by the next run. The compaction must not run concurrently with an export into the same dataset.
+
+    Attributes:
+        writer_profile (ParquetWriterProfile): The layout settings the compacted files are written with.
+        target_file_size (int): The target size of the compacted files in bytes.
+    """
+
+    def __init__(self, writer_profile=None, target_file_mb=None):
+        """
+        Initializes the ParquetCompactor.
+
+        Args:
+            writer_profile (Optional[ParquetWriterProfile]): The layout settings of the compacted files.
+                                                             Defaults to the configured writer profile.
+            target_file_mb (Optional[int]): The target size of the compacted files in megabytes.
+                                            Defaults to the configured compaction_target_file_mb.
+        """
+        self.writer_profile = writer_profile or parquet_storage_config.writer_profile
+        self.target_file_size = (target_file_mb or parquet_storage_config.compaction_target_file_mb) * 1024 ** 2
+
+    @staticmethod
+    def list_files(path):
+        """
+        Lists the Parquet data files directly inside a directory.
+
+        Args:
+            path (str): The directory.
+
+        Returns:
+            List[str]: The paths of the data files, sorted.
+        """
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if is_data_file(name))
+
+    @staticmethod
+    def list_partitions(storage_path):
+        """
+        Lists the directories of a dataset that hold Parquet data files, skipping hidden directories.
+
+        Args:
+            storage_path (str): The path of the dataset.
+
+        Returns:
+            List[str]: The partition directories, sorted.
+        """
+        partitions = []
+        for root, dirs, files in os.walk(storage_path):
+            dirs[:] = [name for name in dirs if not name.startswith(('.', '_'))]
+            if any(is_data_file(name) for name in files):
+                partitions.append(root)
+        return sorted(partitions)
+
+    @staticmethod
+    def recover(storage_path):
+        """
+        Repairs partition swaps interrupted by a crash.
+
+        Staging directories are removed. A backup directory is restored if its partition is missing, i.e. the swap
+        stopped between the two renames, and removed otherwise.
+
+        Args:
+            storage_path (str): The path of the dataset.
+        """
+        for root, dirs, _ in os.walk(storage_path):
+            for name in sorted(dirs):
+                if not name.startswith(BACKUP_PREFIX):
+                    continue
+                partition = os.path.join(root, name[len(BACKUP_PREFIX):].split('-', 1)[1])
+                if os.path.exists(partition):
+                    shutil.rmtree(os.path.join(root, name))
+                else:
+                    os.rename(os.path.join(root, name), partition)
+                    logging.warning(f"Restored {partition} from an interrupted compaction")
+            for name in dirs:
+                if name.startswith(STAGING_PREFIX):
+                    shutil.rmtree(os.path.join(root, name))
+            dirs[:] = [name for name in os.listdir(root)
+                       if os.path.isdir(os.path.join(root, name)) and not name.startswith(('.', '_'))]
+
+    def compact_partition(self, path):
+        """
+        Merges the files of one partition directory into as few files as the target file size allows.
+
+        Rows are sorted by the writer profile's sort columns. Partitions already in few enough files are skipped.
+
+        Args:
+            path (str): The partition directory.
+
+        Returns:
+            Optional[Tuple[int, int, int, int]]: The number and total size in bytes of the rewritten files and of
+                                                 the written files, or None if the partition was skipped.
+        """
+        files = self.list_files(path)
+        num_bytes = sum(os.path.getsize(file) for file in files)
+        num_target_files = max(1, math.ceil(num_bytes / self.target_file_size))
+        if len(files) <= num_target_files:
+            return None
+
+        table = ds.dataset(files, format='parquet').to_table()
+        if table.num_rows == 0:
+            return None
+        sort_columns = [column for column in self.writer_profile.sort_by if column in table.column_names]
+        if sort_columns:
+            table = table.sort_by([(column, 'ascending') for column in sort_columns])
+        rows_per_file = math.ceil(table.num_rows / num_target_files)
+        rows_per_group = min(self.writer_profile.row_group_size, rows_per_file)
+
+        parent, name = os.path.split(path)
+        token = uuid.uuid4().hex
+        staging_path = os.path.join(parent, f"{STAGING_PREFIX}{token}-{name}")
+        backup_path = os.path.join(parent, f"{BACKUP_PREFIX}{token}-{name}")
+        try:
+            ds.write_dataset(
+                table,
+                staging_path,
+                format='parquet',
+                file_options=parquet_write_options(self.writer_profile),
+                basename_template=f"{token}-{{i}}.parquet",
+                max_rows_per_file=rows_per_file,
+                min_rows_per_group=rows_per_group,
+                max_rows_per_group=rows_per_group,
+                preserve_order=True
+            )
+        except Exception:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            raise
+        written_files = self.list_files(staging_path)
+        written_bytes = sum(os.path.getsize(file) for file in written_files)
+
+        os.rename(path, backup_path)
+        os.rename(staging_path, path)
+        shutil.rmtree(backup_path)
+        return len(files), num_bytes, len(written_files), written_bytes
+
+    def compact_dataset(self, storage_path):
+        """
+        Compacts every partition directory of a dataset.
+
+        Args:
+            storage_path (str): The path of the dataset.
+
+        Returns:
+            dict: The number of compacted partitions and the number and total size in bytes of the rewritten
+                  and the written files.
+        """
+        started = time.perf_counter()
+        stats = dict.fromkeys(['partitions', 'files_rewritten', 'bytes_rewritten', 'files_written', 'bytes_written'], 0)
+        if not os.path.isdir(storage_path):
+            return stats
+
+        self.recover(storage_path)
+        for partition in self.list_partitions(storage_path):
+            result = self.compact_partition(partition)
+            if result is None:
+                continue
+            stats['partitions'] += 1
+            stats['files_rewritten'] += result[0]
+            stats['bytes_rewritten'] += result[1]
+            stats['files_written'] += result[2]
+            stats['bytes_written'] += result[3]
+
+        logging.info(f"Compacted {stats['partitions']} partitions of {storage_path}: {stats['files_rewritten']} files "
+                     f"({stats['bytes_rewritten'] / 1024 ** 2:,.1f} MB) rewritten into {stats['files_written']} files "
+                     f"({stats['bytes_written'] / 1024 ** 2:,.1f} MB) in {time.perf_counter() - started:.2f}s")
+        return stats
+
+    def compact_marts(self):
+        """
+        Compacts the Parquet datasets of all marts.
+
+        Returns:
+            dict: The compaction statistics per mart, see compact_dataset().
+        """
+        return {
+            mart: self.compact_dataset(getattr(parquet_storage_config, f"storage_path_{mart}")) for mart in MARTS
+        }
@@ -1,13 +1,134 @@
+import json
+import logging
 import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
 import pandas as pd
+import psycopg2.extensions
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from psycopg2 import sql
 
 from data_dev.queries import (
     TRANSFORM_PATIENT_SUM_TREATMENT_COST_PER_FACILITY_TYPE_SQL,
     TRANSFORM_FACILITY_NAME_MIN_TIME_SPENT_PER_VISIT_DATE_SQL,
-    TRANSFORM_FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_SQL
+    TRANSFORM_FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_SQL,
+    TRANSFORM_FACILITY_NAME_MIN_TIME_SPENT_PER_VISIT_DATE_WINDOW_SQL,
+    TRANSFORM_FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_WINDOW_SQL,
+    SELECT_VISITS_MAX_ID_QUERY,
+    SELECT_VISITS_TOUCHED_MONTHS_QUERY,
+    SELECT_MART_VISITS_SQL,
+    ORDER_RESULT_QUERY
 )
+from data_dev.src.connectors.postgre_connector import PostgresConnectionPool, PostgresConnectorContextManager
+from data_dev.src.data.mart_aggregator import MartAggregator, MART_VISITS_SCHEMA
+from data_dev.src.data.partitions import add_months
 from data_dev.config import parquet_storage_config
 
+# Name of the file in a mart directory that records up to which visits.id the mart is exported.
+# Files starting with an underscore are ignored by Parquet dataset readers.
+EXPORT_STATE_FILE = '_export_state.json'
+
+# Marts in export order. Each has a transform_<mart> method and a storage_path_<mart> attribute.
+MARTS = [
+    'facility_type_avg_time_spent_per_visit_date',
+    'patient_sum_treatment_cost_per_facility_type',
+    'facility_name_min_time_spent_per_visit_date'
+]
+
+# Transform SQL restricted to a visit_timestamp window, for the marts that can be exported incrementally
+WINDOW_QUERIES = {
+    'facility_type_avg_time_spent_per_visit_date': TRANSFORM_FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_WINDOW_SQL,
+    'facility_name_min_time_spent_per_visit_date': TRANSFORM_FACILITY_NAME_MIN_TIME_SPENT_PER_VISIT_DATE_WINDOW_SQL
+}
+
+# Declared output schemas of the streamed transforms, matching what the DataFrame path writes
+FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_SCHEMA = pa.schema([
+    ('facility_type', pa.string()),
+    ('visit_date', pa.timestamp('ns')),
+    ('avg_time_spent', pa.float64())
+])
+
+PATIENT_SUM_TREATMENT_COST_PER_FACILITY_TYPE_SCHEMA = pa.schema([
+    ('facility_type', pa.string()),
+    ('full_name', pa.string()),
+    ('sum_treatment_cost', pa.float64())
+])
+
+FACILITY_NAME_MIN_TIME_SPENT_PER_VISIT_DATE_SCHEMA = pa.schema([
+    ('facility_name', pa.string()),
+    ('visit_date', pa.timestamp('ns')),
+    ('min_time_spent', pa.int64())
+])
+
+
+def partition_by_month(batch):
+    """
+    Derives the partition_date column (YYYY-MM of visit_date) of a record batch.
+
+    Parameters:
+    -----------
+    batch : pa.RecordBatch
+        Record batch with a visit_date column.
+
+    Returns:
+    --------
+    pa.Array
+        The partition_date values.
+    """
+    return pc.strftime(batch.column('visit_date'), format='%Y-%m')
+
+
+def partition_by_facility_type(batch):
+    """
+    Derives the facility_type_partition column (facility_type with spaces replaced by underscores) of a record batch.
+
+    Parameters:
+    -----------
+    batch : pa.RecordBatch
+        Record batch with a facility_type column.
+
+    Returns:
+    --------
+    pa.Array
+        The facility_type_partition values.
+    """
+    return pc.replace_substring(batch.column('facility_type'), pattern=' ', replacement='_')
+
+
+def parquet_write_options(writer_profile):
+    """
+    Builds the Parquet file write options of a writer profile.
+
+    Parameters:
+    -----------
+    writer_profile : ParquetWriterProfile
+        Layout settings of the written files.
+
+    Returns:
+    --------
+    ds.ParquetFileWriteOptions
+        Codec, codec level, dictionary encoding and statistics settings.
+    """
+    return ds.ParquetFileFormat().make_write_options(
+        compression=writer_profile.compression,
+        compression_level=writer_profile.compression_level,
+        use_dictionary=writer_profile.use_dictionary,
+        write_statistics=writer_profile.write_statistics
+    )
+
+
+# Partition column and the function deriving it of every mart
+MART_PARTITIONING = {
+    'facility_type_avg_time_spent_per_visit_date': ('partition_date', partition_by_month),
+    'patient_sum_treatment_cost_per_facility_type': ('facility_type_partition', partition_by_facility_type),
+    'facility_name_min_time_spent_per_visit_date': ('partition_date', partition_by_month)
+}
+
 
 class LoadParquet:
     """
@@ -23,6 +144,22 @@ class LoadParquet:
         Path to store the Parquet file for patient sum treatment cost per facility type.
     storage_path_facility_name_min_time_spent_per_visit_date : str
         Path to store the Parquet file for facility name minimum time spent per visit date.
+    streaming : bool
+        Whether query results are streamed to Parquet in record batches instead of read into one DataFrame.
+    stream_batch_size : int
+        Number of rows fetched and written per record batch when streaming.
+    incremental : bool
+        Whether the monthly partitioned marts only rewrite the months that received new visits since the last export.
+    export_workers : int
+        Number of pooled connections the marts are exported over concurrently.
+    engine : str
+        'sql' runs one TRANSFORM_* query per mart, 'single_scan' aggregates all marts from one scan of the visits.
+    writer_profile : ParquetWriterProfile
+        Compression, row-group, encoding, statistics and sort settings of the written files.
+    extraction : str
+        'cursor' streams row tuples from a server-side cursor, 'copy' parses the output of COPY TO with Arrow.
+    pool : PostgresConnectionPool or None
+        Pool the concurrent exports check their connections out of.
 
     Methods:
     --------
@@ -30,6 +167,26 @@ class LoadParquet:
         Executes the given SQL query and returns the result as a DataFrame.
     to_parquet(df, storage_path, partition_columns):
         Writes the given DataFrame to a Parquet file at the specified storage path, partitioned by the given columns.
+    sort_columns(schema):
+        Returns the columns of the writer profile's sort order that the given schema has.
+    file_options():
+        Returns the Parquet file write options of the writer profile.
+    iter_record_batches(query, schema):
+        Executes the given SQL query on a server-side cursor and yields the result as record batches.
+    stream_to_parquet(query, schema, storage_path, partition_column, partition_values):
+        Streams the result of the given SQL query into a partitioned Parquet dataset.
+    read_export_state(storage_path) / write_export_state(storage_path, last_visit_id):
+        Reads / writes the last exported visits.id of a mart.
+    get_touched_month_windows(last_visit_id, max_visit_id):
+        Returns the month windows that received visits with ids in (last_visit_id, max_visit_id].
+    export_incremental(transform, window_query, storage_path):
+        Runs a monthly partitioned transform only for the months that received new visits.
+    export_mart(mart):
+        Exports one mart, incrementally where configured and supported, and returns its duration.
+    load_parquet_concurrent():
+        Exports all marts concurrently over pooled connections.
+    load_parquet_single_scan():
+        Exports all marts from a single scan of the joined visits.
     transform_facility_type_avg_time_spent_per_visit_date():
         Transforms data for facility type average time spent per visit date and writes it to a Parquet file.
     transform_patient_sum_treatment_cost_per_facility_type():
@@ -40,7 +197,7 @@ class LoadParquet:
         Executes all transformations and loads the results into Parquet files.
     """
 
-    def __init__(self, connection_object):
+    def __init__(self, connection_object, pool=None):
         """
         Initializes the LoadParquet class with a database connection object and storage paths.
 
@@ -48,8 +205,12 @@ class LoadParquet:
         -----------
         connection_object : object
             Database connection object used to execute SQL queries.
+        pool : PostgresConnectionPool, optional
+            Pool the concurrent exports check their connections out of. When omitted, concurrent exports open
+            a pool of their own.
         """
         self.connection_object = connection_object
+        self.pool = pool
         self.storage_path_facility_type_avg_time_spent_per_visit_date = (
             parquet_storage_config.storage_path_facility_type_avg_time_spent_per_visit_date
         )
@@ -59,8 +220,15 @@ class LoadParquet:
         self.storage_path_facility_name_min_time_spent_per_visit_date = (
             parquet_storage_config.storage_path_facility_name_min_time_spent_per_visit_date
         )
+        self.streaming = parquet_storage_config.streaming
+        self.stream_batch_size = parquet_storage_config.stream_batch_size
+        self.incremental = parquet_storage_config.incremental
+        self.export_workers = parquet_storage_config.export_workers
+        self.engine = parquet_storage_config.engine
+        self.writer_profile = parquet_storage_config.writer_profile
+        self.extraction = parquet_storage_config.extraction
 
-    def read_data(self, query):
+    def read_data(self, query, params=None):
         """
         Executes the given SQL query and returns the result as a DataFrame.
 
@@ -68,20 +236,50 @@ class LoadParquet:
         -----------
         query : str
             SQL query to execute.
+        params : dict, optional
+            Parameters of the SQL query.
 
         Returns:
         --------
         DataFrame
             Resulting data from the SQL query.
         """
-        df = self.connection_object.get_data_sql(query=query)
+        df = self.connection_object.get_data_sql(query=query, params=params)
         return df
 
-    @staticmethod
-    def to_parquet(df, storage_path, partition_columns):
+    def sort_columns(self, schema):
+        """
+        Returns the columns of the writer profile's sort order that the given schema has.
+
+        Parameters:
+        -----------
+        schema : pa.Schema
+            Schema of the written data.
+
+        Returns:
+        --------
+        list of str
+            The columns to sort by, in order. Empty if the data is written unsorted.
+        """
+        return [column for column in self.writer_profile.sort_by if column in schema.names]
+
+    def file_options(self):
+        """
+        Returns the Parquet file write options of the writer profile.
+
+        Returns:
+        --------
+        ds.ParquetFileWriteOptions
+            Codec, codec level, dictionary encoding and statistics settings.
+        """
+        return parquet_write_options(self.writer_profile)
+
+    def to_parquet(self, df, storage_path, partition_columns):
         """
         Writes the given DataFrame to a Parquet file at the specified storage path, partitioned by the given columns.
 
+        Rows are sorted and written with the layout of the writer profile.
+
         Parameters:
         -----------
         df : DataFrame
@@ -92,19 +290,290 @@ class LoadParquet:
             Columns to partition the Parquet file by.
         """
         os.makedirs(storage_path, exist_ok=True)
+        sort_columns = [column for column in self.writer_profile.sort_by if column in df.columns]
+        if sort_columns:
+            df = df.sort_values(sort_columns, ignore_index=True)
         df.to_parquet(
             storage_path,
             engine='pyarrow',
             partition_cols=partition_columns,
             index=False,
-            existing_data_behavior='delete_matching'
+            existing_data_behavior='delete_matching',
+            compression=self.writer_profile.compression,
+            compression_level=self.writer_profile.compression_level,
+            use_dictionary=self.writer_profile.use_dictionary,
+            write_statistics=self.writer_profile.write_statistics,
+            row_group_size=self.writer_profile.row_group_size,
+            min_rows_per_group=self.writer_profile.row_group_size,
+            preserve_order=bool(sort_columns)
+        )
+
+    def iter_record_batches(self, query, schema, params=None):
+        """
+        Executes the given SQL query on a server-side (named) cursor and yields the result as record batches.
+
+        Only stream_batch_size rows are held client-side at a time. NUMERIC values are fetched as floats and
+        every column is cast to its declared type, e.g. visit_date DATE values to timestamps. With the 'copy'
+        extraction the result is read with COPY TO and parsed by Arrow instead, in blocks of COPY_BLOCK_SIZE bytes.
+
+        Parameters:
+        -----------
+        query : str
+            SQL query to execute.
+        schema : pa.Schema
+            Declared schema of the query result, in column order.
+        params : dict, optional
+            Parameters of the SQL query.
+
+        Yields:
+        -------
+        pa.RecordBatch
+            Up to stream_batch_size rows of the query result.
+        """
+        conn = self.connection_object.get_connection()
+        if self.extraction == 'copy':
+            try:
+                yield from self.connection_object.iter_arrow_sql(query, schema, params)
+            finally:
+                conn.rollback()
+            return
+        cursor = conn.cursor(name=f"parquet_stream_{uuid.uuid4().hex}")
+        try:
+            psycopg2.extensions.register_type(psycopg2.extensions.new_type(
+                psycopg2.extensions.DECIMAL.values, 'DEC2FLOAT',
+                lambda value, cur: float(value) if value is not None else None
+            ), cursor)
+            cursor.itersize = self.stream_batch_size
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(self.stream_batch_size)
+                if not rows:
+                    break
+                columns = zip(*rows)
+                yield pa.record_batch(
+                    [pa.array(values).cast(field.type) for values, field in zip(columns, schema)],
+                    schema=schema
+                )
+        finally:
+            cursor.close()
+            conn.rollback()
+
+    def stream_to_parquet(self, query, schema, storage_path, partition_column, partition_values, params=None):
+        """
+        Streams the result of the given SQL query into a Parquet dataset partitioned by one derived column.
+
+        Record batches are appended by a dataset writer as they are fetched, so peak memory is bounded by
+        stream_batch_size and the row groups being filled rather than by the size of the result. Partition
+        directories receiving data are replaced, like with to_parquet(). If the writer profile sorts, the
+        server sorts the result (see ORDER_RESULT_QUERY), so batches arrive in order.
+
+        Parameters:
+        -----------
+        query : str
+            SQL query to execute.
+        schema : pa.Schema
+            Declared schema of the query result, in column order.
+        storage_path : str
+            Path to store the Parquet dataset.
+        partition_column : str
+            Name of the derived partition column.
+        partition_values : callable
+            Function deriving the partition column of a record batch.
+        params : dict, optional
+            Parameters of the SQL query.
+        """
+        sort_columns = self.sort_columns(schema)
+        if sort_columns:
+            query = sql.SQL(ORDER_RESULT_QUERY).format(
+                query=sql.SQL(query.strip().rstrip(';')),
+                columns=sql.SQL(', ').join(map(sql.Identifier, sort_columns))
+            )
+        self.write_batches(self.iter_record_batches(query, schema, params), schema, storage_path,
+                           partition_column, partition_values)
+
+    def write_batches(self, batches, schema, storage_path, partition_column, partition_values):
+        """
+        Appends record batches to a Parquet dataset partitioned by one derived column.
+
+        Partition directories receiving data are replaced, like with to_parquet(). Files are written with the
+        layout of the writer profile; batches already sorted by its sort columns keep their order.
+
+        Parameters:
+        -----------
+        batches : iterable of pa.RecordBatch
+            Record batches with the given schema.
+        schema : pa.Schema
+            Schema of the record batches.
+        storage_path : str
+            Path to store the Parquet dataset.
+        partition_column : str
+            Name of the derived partition column.
+        partition_values : callable
+            Function deriving the partition column of a record batch.
+        """
+        os.makedirs(storage_path, exist_ok=True)
+        partition_field = pa.field(partition_column, pa.string())
+        dataset_schema = schema.append(partition_field)
+        batches = (
+            pa.record_batch(batch.columns + [partition_values(batch)], schema=dataset_schema)
+            for batch in batches
+        )
+        ds.write_dataset(
+            batches,
+            storage_path,
+            schema=dataset_schema,
+            format='parquet',
+            partitioning=ds.partitioning(pa.schema([partition_field]), flavor='hive'),
+            basename_template=f"{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior='delete_matching',
+            file_options=self.file_options(),
+            min_rows_per_group=self.writer_profile.row_group_size,
+            max_rows_per_group=self.writer_profile.row_group_size,
+            preserve_order=bool(self.sort_columns(schema))
         )
 
-    def transform_facility_type_avg_time_spent_per_visit_date(self):
+    @staticmethod
+    def read_export_state(storage_path):
+        """
+        Reads the last exported visits.id of a mart.
+
+        Parameters:
+        -----------
+        storage_path : str
+            Path of the mart's Parquet dataset.
+
+        Returns:
+        --------
+        int or None
+            The last exported visits.id, or None if the mart has not been exported incrementally yet.
+        """
+        try:
+            with open(os.path.join(storage_path, EXPORT_STATE_FILE)) as state_file:
+                return json.load(state_file)['last_visit_id']
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def write_export_state(storage_path, last_visit_id):
+        """
+        Records the last exported visits.id of a mart. The state file is replaced atomically.
+
+        Parameters:
+        -----------
+        storage_path : str
+            Path of the mart's Parquet dataset.
+        last_visit_id : int
+            The last exported visits.id.
+        """
+        os.makedirs(storage_path, exist_ok=True)
+        state_path = os.path.join(storage_path, EXPORT_STATE_FILE)
+        tmp_path = f"{state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as state_file:
+            json.dump({'last_visit_id': last_visit_id, 'exported_at': datetime.now().isoformat()}, state_file)
+        os.replace(tmp_path, state_path)
+
+    def get_max_visit_id(self):
+        """
+        Returns the highest visits.id.
+
+        Returns:
+        --------
+        int
+            The highest visits.id, 0 if visits is empty.
+        """
+        conn = self.connection_object.get_connection()
+        with conn.cursor() as cursor:
+            cursor.execute(SELECT_VISITS_MAX_ID_QUERY)
+            max_visit_id = cursor.fetchone()[0]
+        conn.rollback()
+        return max_visit_id
+
+    def get_touched_month_windows(self, last_visit_id, max_visit_id):
+        """
+        Returns the months that received visits with ids in (last_visit_id, max_visit_id], merged into
+        windows of consecutive months.
+
+        Parameters:
+        -----------
+        last_visit_id : int
+            The last exported visits.id.
+        max_visit_id : int
+            The highest visits.id to export.
+
+        Returns:
+        --------
+        list of tuple
+            The inclusive first day and exclusive end of every window of consecutive touched months.
+        """
+        conn = self.connection_object.get_connection()
+        with conn.cursor() as cursor:
+            cursor.execute(SELECT_VISITS_TOUCHED_MONTHS_QUERY,
+                           {'last_visit_id': last_visit_id, 'max_visit_id': max_visit_id})
+            months = [row[0] for row in cursor.fetchall()]
+        conn.rollback()
+
+        windows = []
+        for month in months:
+            if windows and windows[-1][1] == month:
+                windows[-1] = (windows[-1][0], add_months(month, 1))
+            else:
+                windows.append((month, add_months(month, 1)))
+        return windows
+
+    def export_incremental(self, transform, window_query, storage_path):
+        """
+        Runs a monthly partitioned transform only for the months that received new visits since the last export.
+
+        New visits are recognized by visits.id, which grows with every merged visit. The touched months are
+        recomputed in full and replace their partition directories. A mart without export state is rebuilt
+        in full. The export must not run concurrently with a 3NF merge, as visits committed later with lower ids
+        would be missed.
+
+        Parameters:
+        -----------
+        transform : callable
+            Transform method accepting query and params keyword arguments.
+        window_query : str
+            The transform SQL restricted to visits in [window_start, window_end).
+        storage_path : str
+            Path of the mart's Parquet dataset.
+        """
+        max_visit_id = self.get_max_visit_id()
+        last_visit_id = self.read_export_state(storage_path)
+        if last_visit_id is None:
+            transform()
+        else:
+            windows = self.get_touched_month_windows(last_visit_id, max_visit_id)
+            for window_start, window_end in windows:
+                transform(query=window_query, params={'window_start': window_start, 'window_end': window_end})
+            logging.info(f"Exported {len(windows)} month windows of new visits into {storage_path}")
+        self.write_export_state(storage_path, max_visit_id)
+
+    def transform_facility_type_avg_time_spent_per_visit_date(
+            self, query=TRANSFORM_FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_SQL, params=None):
         """
         Transforms data for facility type average time spent per visit date and writes it to a Parquet file.
+
+        Parameters:
+        -----------
+        query : str, optional
+            The transform SQL, defaults to the full transform.
+        params : dict, optional
+            Parameters of the transform SQL.
         """
-        df = self.read_data(TRANSFORM_FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_SQL)
+        if self.streaming:
+            self.stream_to_parquet(
+                query=query,
+                schema=FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_SCHEMA,
+                storage_path=self.storage_path_facility_type_avg_time_spent_per_visit_date,
+                partition_column='partition_date',
+                partition_values=partition_by_month,
+                params=params
+            )
+            return
+        df = self.read_data(query, params)
+        if df.empty and params is not None:
+            return
         df['visit_date'] = pd.to_datetime(df['visit_date'])
         df['partition_date'] = df['visit_date'].dt.to_period('M').astype(str)
         self.to_parquet(
@@ -118,6 +587,15 @@ class LoadParquet:
         """
         Transforms data for patient sum treatment cost per facility type and writes it to a Parquet file.
         """
+        if self.streaming:
+            self.stream_to_parquet(
+                query=TRANSFORM_PATIENT_SUM_TREATMENT_COST_PER_FACILITY_TYPE_SQL,
+                schema=PATIENT_SUM_TREATMENT_COST_PER_FACILITY_TYPE_SCHEMA,
+                storage_path=self.storage_path_patient_sum_treatment_cost_per_facility_type,
+                partition_column='facility_type_partition',
+                partition_values=partition_by_facility_type
+            )
+            return
         df = self.read_data(TRANSFORM_PATIENT_SUM_TREATMENT_COST_PER_FACILITY_TYPE_SQL)
         df['facility_type_partition'] = df['facility_type'].str.replace(" ", "_")
         self.to_parquet(
@@ -126,11 +604,31 @@ class LoadParquet:
             partition_columns=['facility_type_partition']
         )
 
-    def transform_facility_name_min_time_spent_per_visit_date(self):
+    def transform_facility_name_min_time_spent_per_visit_date(
+            self, query=TRANSFORM_FACILITY_NAME_MIN_TIME_SPENT_PER_VISIT_DATE_SQL, params=None):
         """
         Transforms data for facility name minimum time spent per visit date and writes it to a Parquet file.
+
+        Parameters:
+        -----------
+        query : str, optional
+            The transform SQL, defaults to the full transform.
+        params : dict, optional
+            Parameters of the transform SQL.
         """
-        df = self.read_data(TRANSFORM_FACILITY_NAME_MIN_TIME_SPENT_PER_VISIT_DATE_SQL)
+        if self.streaming:
+            self.stream_to_parquet(
+                query=query,
+                schema=FACILITY_NAME_MIN_TIME_SPENT_PER_VISIT_DATE_SCHEMA,
+                storage_path=self.storage_path_facility_name_min_time_spent_per_visit_date,
+                partition_column='partition_date',
+                partition_values=partition_by_month,
+                params=params
+            )
+            return
+        df = self.read_data(query, params)
+        if df.empty and params is not None:
+            return
         df['visit_date'] = pd.to_datetime(df['visit_date'])
         df['partition_date'] = df['visit_date'].dt.to_period('M').astype(str)
         self.to_parquet(
@@ -139,10 +637,112 @@ class LoadParquet:
             partition_columns=['partition_date']
         )
 
+    def export_mart(self, mart):
+        """
+        Exports one mart, incrementally if configured and the mart has a windowed transform (see WINDOW_QUERIES).
+
+        Parameters:
+        -----------
+        mart : str
+            Name of the mart, one of MARTS.
+
+        Returns:
+        --------
+        float
+            Duration of the export in seconds.
+        """
+        started = time.perf_counter()
+        transform = getattr(self, f"transform_{mart}")
+        if self.incremental and mart in WINDOW_QUERIES:
+            self.export_incremental(
+                transform=transform,
+                window_query=WINDOW_QUERIES[mart],
+                storage_path=getattr(self, f"storage_path_{mart}")
+            )
+        else:
+            transform()
+        elapsed = time.perf_counter() - started
+        logging.info(f"Exported {mart} in {elapsed:.2f}s")
+        return elapsed
+
+    def load_parquet_concurrent(self):
+        """
+        Exports all marts concurrently, each on its own thread and pooled connection.
+
+        The transforms are independent read-only queries writing to separate directories, so the export takes as
+        long as the slowest one. A failed export does not stop the others; the first error is raised once all
+        exports finished.
+        """
+        def run(mart):
+            with PostgresConnectorContextManager(pool=pool) as connection_object:
+                return LoadParquet(connection_object, pool=pool).export_mart(mart)
+
+        num_workers = min(self.export_workers, len(MARTS))
+        pool = self.pool or PostgresConnectionPool(min_size=1, max_size=num_workers)
+        started = time.perf_counter()
+        durations = []
+        error = None
+        try:
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                futures = {executor.submit(run, mart): mart for mart in MARTS}
+                for future in as_completed(futures):
+                    try:
+                        durations.append(future.result())
+                    except Exception as e:
+                        logging.error(f"Export of {futures[future]} failed: {e}")
+                        error = error or e
+        finally:
+            if self.pool is None:
+                pool.close()
+        if error is not None:
+            raise error
+        logging.info(f"Exported {len(MARTS)} marts over {num_workers} connections in "
+                     f"{time.perf_counter() - started:.2f}s (sum of exports: {sum(durations):.2f}s)")
+
+    def load_parquet_single_scan(self):
+        """
+        Exports all marts from a single scan of the joined visit rows (SELECT_MART_VISITS_SQL).
+
+        The rows are streamed in record batches and reduced by a MartAggregator, which computes the three
+        aggregates of the TRANSFORM_* queries in the same pass. Every mart is rewritten in full; the export state
+        of the incremental mode is advanced as well, so the modes can be switched.
+        """
+        started = time.perf_counter()
+        max_visit_id = self.get_max_visit_id()
+        aggregator = MartAggregator()
+        num_rows = 0
+        for batch in self.iter_record_batches(SELECT_MART_VISITS_SQL, MART_VISITS_SCHEMA):
+            aggregator.update(batch)
+            num_rows += batch.num_rows
+        logging.info(f"Aggregated {num_rows:,} visits in {time.perf_counter() - started:.2f}s")
+
+        for mart in MARTS:
+            table = getattr(aggregator, mart)()
+            sort_columns = self.sort_columns(table.schema)
+            if sort_columns:
+                table = table.sort_by([(column, 'ascending') for column in sort_columns])
+            partition_column, partition_values = MART_PARTITIONING[mart]
+            storage_path = getattr(self, f"storage_path_{mart}")
+            self.write_batches(table.to_batches(max_chunksize=self.stream_batch_size), table.schema, storage_path,
+                               partition_column, partition_values)
+            if self.incremental and mart in WINDOW_QUERIES:
+                self.write_export_state(storage_path, max_visit_id)
+        logging.info(f"Exported {len(MARTS)} marts from a single scan in {time.perf_counter() - started:.2f}s")
+
     def load_parquet(self):
         """
         Executes all transformations and loads the results into Parquet files.
+
+        In incremental mode the monthly partitioned marts only rewrite the months that received new visits,
+        see export_incremental(). The patient mart aggregates over all visits and is always rebuilt in full.
+        With export_workers > 1 the marts are exported concurrently, see load_parquet_concurrent(). The
+        'single_scan' engine exports all marts from one scan instead, see load_parquet_single_scan().
         """
-        self.transform_facility_type_avg_time_spent_per_visit_date()
-        self.transform_patient_sum_treatment_cost_per_facility_type()
-        self.transform_facility_name_min_time_spent_per_visit_date()
+        if self.engine == 'single_scan':
+            self.load_parquet_single_scan()
+            return
+        if self.export_workers > 1:
+            self.load_parquet_concurrent()
+            return
+        for mart in MARTS:
+            self.export_mart(mart)
@@ -0,0 +1,89 @@
+from datetime import date
+
+from psycopg2 import sql
+
+from data_dev.queries import (CREATE_MONTHLY_PARTITION_QUERY,
+                              SELECT_IS_PARTITIONED_QUERY)
+
+
+def month_start(day):
+    """
+    Returns the first day of the month of a date.
+
+    Args:
+        day (date): Any day of the month.
+
+    Returns:
+        date: The first day of the month.
+    """
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    """
+    Shifts the first day of a month by a number of months.
+
+    Args:
+        day (date): The first day of a month.
+        months (int): The number of months to shift by.
+
+    Returns:
+        date: The first day of the shifted month.
+    """
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def is_partitioned(cursor, table_name):
+    """
+    Checks whether a table is a declaratively partitioned table.
+
+    Args:
+        cursor (object): A database cursor object.
+        table_name (str): The name of the table.
+
+    Returns:
+        bool: True if the table exists and is partitioned, False otherwise.
+    """
+    cursor.execute(SELECT_IS_PARTITIONED_QUERY, {'table_name': table_name})
+    return cursor.fetchone()[0]
+
+
+def ensure_monthly_partitions(cursor, table_name, first_day, last_day, premake_months=0):
+    """
+    Creates the monthly range partitions of a table covering a period, plus partitions for the following months.
+
+    Partitions are named <table_name>_pYYYYMM and cover [first day of the month, first day of the next month).
+    Existing partitions are left untouched. Tables that are not partitioned are skipped, so callers can maintain
+    partitions regardless of how the table was created.
+
+    Args:
+        cursor (object): A database cursor object.
+        table_name (str): The name of the partitioned table.
+        first_day (date): The first day that has to be covered.
+        last_day (date): The last day that has to be covered.
+        premake_months (int): The number of months after last_day to create partitions for in advance.
+                              Defaults to 0.
+
+    Returns:
+        Optional[int]: The number of partitions covering the period and the premade months,
+                       or None if the table is not partitioned.
+    """
+    if not is_partitioned(cursor, table_name):
+        return None
+
+    month = month_start(first_day)
+    end = add_months(month_start(last_day), premake_months + 1)
+    num_partitions = 0
+    while month < end:
+        next_month = add_months(month, 1)
+        cursor.execute(
+            sql.SQL(CREATE_MONTHLY_PARTITION_QUERY).format(
+                partition=sql.Identifier(f"{table_name}_p{month:%Y%m}"),
+                table=sql.Identifier(table_name)
+            ),
+            {'start': month, 'end': next_month}
+        )
+        month = next_month
+        num_partitions += 1
+    return num_partitions
@@ -0,0 +1,120 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from faker import Faker
+
+POOL_COLUMNS = {
+    "first_name": lambda fake: fake.first_name(),
+    "last_name": lambda fake: fake.last_name(),
+    "address": lambda fake: fake.address(),
+    "company": lambda fake: fake.company(),
+    "city": lambda fake: fake.city(),
+    "state": lambda fake: fake.state()
+}
+
+
+class FakerValuePool:
+    """
+    A cached vocabulary of Faker values that rows are assembled from by vectorized sampling.
+
+    Calling Faker once per attribute per row dominates generation time for large datasets. The pool calls Faker
+    pool_size times per attribute once, stores the values in a Parquet file and afterwards only loads that file.
+
+    Attributes:
+        pool_size (int): The number of values generated per attribute.
+        cache_dir (str): The directory the pool files are cached in.
+        seed (Optional[int]): The seed of the Faker instance building the pool.
+        path (str): The path of the cached pool file.
+    """
+
+    def __init__(self, pool_size, cache_dir, seed=None):
+        """
+        Initializes the FakerValuePool.
+
+        Args:
+            pool_size (int): The number of values generated per attribute.
+            cache_dir (str): The directory the pool files are cached in.
+            seed (Optional[int]): The seed of the Faker instance building the pool. Defaults to None.
+        """
+        self.pool_size = pool_size
+        self.cache_dir = cache_dir
+        self.seed = seed
+        self.path = os.path.join(
+            cache_dir,
+            f"faker_pool_{pool_size}_{'unseeded' if seed is None else seed}.parquet"
+        )
+
+    def build(self):
+        """
+        Generates the pool values with Faker.
+
+        Returns:
+            pa.Table: A table with one string column of pool_size values per attribute.
+        """
+        fake = Faker()
+        if self.seed is not None:
+            fake.seed_instance(self.seed)
+        return pa.table({
+            column: [generate(fake) for _ in range(self.pool_size)]
+            for column, generate in POOL_COLUMNS.items()
+        })
+
+    def ensure_cached(self):
+        """
+        Builds the pool and writes it to the cache unless a cached pool file already exists.
+
+        The file is written under a temporary name and renamed, so concurrent readers never see a partial file.
+
+        Returns:
+            str: The path of the cached pool file.
+        """
+        if not os.path.exists(self.path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            pq.write_table(self.build(), tmp_path)
+            os.replace(tmp_path, self.path)
+        return self.path
+
+    def load(self):
+        """
+        Loads the pool, building and caching it first if necessary.
+
+        Returns:
+            Dict[str, np.ndarray]: The pool values per attribute.
+        """
+        return load_pool(self.ensure_cached())
+
+
+@lru_cache(maxsize=None)
+def load_pool(path):
+    """
+    Loads a cached pool file. Pools are loaded once per process.
+
+    Args:
+        path (str): The path of the cached pool file.
+
+    Returns:
+        Dict[str, np.ndarray]: The pool values per attribute as object arrays.
+    """
+    table = pq.read_table(path)
+    return {column: np.array(table.column(column).to_pylist(), dtype=object) for column in table.column_names}
+
+
+def sample_pool(rng, pool, column, size):
+    """
+    Draws values of one attribute uniformly from the pool.
+
+    Args:
+        rng (np.random.Generator): The random generator to sample from.
+        pool (Dict[str, np.ndarray]): The pool values per attribute.
+        column (str): The attribute to sample.
+        size (int): The number of values to draw.
+
+    Returns:
+        np.ndarray: The sampled values.
+    """
+    values = pool[column]
+    return values[rng.integers(0, len(values), size=size)]
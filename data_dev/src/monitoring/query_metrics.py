@@ -0,0 +1,361 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2 import sql
+
+from data_dev import queries
+from data_dev.config import query_metrics_config
+
+EXPLAIN_QUERY_PREFIX = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+EXPLAIN_SAVEPOINT = "query_metrics_explain"
+
+# Statements EXPLAIN accepts. The query of a COPY (query) TO STDOUT is explained on its own.
+EXPLAINABLE_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'MERGE', 'WITH')
+COPY_TO_PATTERN = re.compile(r'^COPY \((.*)\) TO STDOUT', re.S | re.I)
+
+# COPY statements loading data from the client, whose bytes are sent rather than fetched
+COPY_FROM_STDIN_PATTERN = re.compile(r'^\s*COPY\s.*\sFROM\s+STDIN\b', re.S | re.I)
+
+# Parameter (%(name)s) and identifier ({name}) placeholders of the queries.py templates
+PLACEHOLDER_PATTERN = re.compile(r'%\(\w+\)s|\{\w*\}')
+
+# Only the head of an executed statement is matched against the templates, which keeps multi-row INSERTs cheap
+MAX_MATCHED_LENGTH = 20_000
+
+
+def normalize(text):
+    """
+    Collapses the whitespace of a SQL statement and strips its trailing semicolon.
+
+    Args:
+        text (str): The SQL statement.
+
+    Returns:
+        str: The normalized statement.
+    """
+    return ' '.join(text.split()).rstrip(';').rstrip()
+
+
+def template_pattern(template):
+    """
+    Builds the regular expression matching a queries.py template once its placeholders are filled in.
+
+    Args:
+        template (str): The SQL template.
+
+    Returns:
+        re.Pattern: The pattern, matching anywhere in a normalized statement.
+    """
+    parts = PLACEHOLDER_PATTERN.split(normalize(template))
+    return re.compile('.*?'.join(re.escape(part) for part in parts), re.S)
+
+
+# Patterns of the SQL constants in queries.py, longest first, so the most specific template wins
+QUERY_PATTERNS = sorted(
+    ((name, template_pattern(value)) for name, value in vars(queries).items()
+     if name.isupper() and isinstance(value, str)),
+    key=lambda item: len(item[1].pattern),
+    reverse=True
+)
+
+
+def query_name(text):
+    """
+    Names an executed SQL statement after the queries.py constant it was built from.
+
+    Statements wrapping a constant, like COPY (query) TO STDOUT, are named after the wrapped constant. Statements
+    not built from a constant are labelled with their first words.
+
+    Args:
+        text (str): The executed SQL statement, with or without its parameters filled in.
+
+    Returns:
+        str: The name of the constant, or a label starting with 'sql:'.
+    """
+    return match_query_name(text[:MAX_MATCHED_LENGTH])
+
+
+@lru_cache(maxsize=256)
+def match_query_name(text):
+    """
+    Matches the head of an executed SQL statement against the queries.py templates, see query_name().
+
+    Args:
+        text (str): The head of the executed SQL statement.
+
+    Returns:
+        str: The name of the constant, or a label starting with 'sql:'.
+    """
+    statement = normalize(text)
+    for name, pattern in QUERY_PATTERNS:
+        if pattern.search(statement):
+            return name
+    return f"sql:{' '.join(statement.split()[:6])[:60]}"
+
+
+def estimate_bytes(rows):
+    """
+    Estimates the size of fetched rows: the length of text and binary values, 8 bytes for any other value.
+
+    Args:
+        rows (List[tuple]): The fetched rows.
+
+    Returns:
+        int: The estimated number of bytes.
+    """
+    return sum(
+        len(value) if isinstance(value, (str, bytes, memoryview)) else 8
+        for row in rows for value in row if value is not None
+    )
+
+
+class QueryMetrics:
+    """
+    A thread-safe collector of per-query run metrics.
+
+    Attributes:
+        started_at (datetime): When the collection started.
+        queries (Dict[str, dict]): Calls, wall time, rows, fetched bytes and sent bytes per query name.
+        plans (Dict[str, object]): The captured EXPLAIN ANALYZE plan per query name.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty collector.
+        """
+        self.lock = threading.Lock()
+        self.started_at = datetime.now()
+        self.queries = {}
+        self.plans = {}
+
+    def record(self, name, elapsed, rows=0, num_bytes=0, calls=1, sent_bytes=0):
+        """
+        Adds the measurements of a query execution or fetch.
+
+        Args:
+            name (str): The query name.
+            elapsed (float): The wall time in seconds.
+            rows (int): The number of rows affected or returned. Defaults to 0.
+            num_bytes (int): The number of bytes fetched. Defaults to 0.
+            calls (int): The number of executions, 0 for fetches. Defaults to 1.
+            sent_bytes (int): The number of bytes sent, e.g. by COPY FROM STDIN. Defaults to 0.
+        """
+        with self.lock:
+            metrics = self.queries.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0,
+                                                     'sent_bytes': 0})
+            metrics['calls'] += calls
+            metrics['seconds'] += elapsed
+            metrics['rows'] += rows
+            metrics['bytes'] += num_bytes
+            metrics['sent_bytes'] += sent_bytes
+
+    def claim_plan(self, name):
+        """
+        Reserves the plan capture of a query, so every query is explained only once per run.
+
+        Args:
+            name (str): The query name.
+
+        Returns:
+            bool: True if the caller should capture the plan.
+        """
+        with self.lock:
+            if name in self.plans:
+                return False
+            self.plans[name] = None
+            return True
+
+    def add_plan(self, name, plan):
+        """
+        Stores the captured plan of a query.
+
+        Args:
+            name (str): The query name.
+            plan (object): The EXPLAIN (FORMAT JSON) output.
+        """
+        with self.lock:
+            self.plans[name] = plan
+
+    def summary(self):
+        """
+        Returns the metrics of all queries, slowest first.
+
+        Returns:
+            List[dict]: The name, calls, wall time, rows, fetched bytes and sent bytes of every query.
+        """
+        with self.lock:
+            return sorted(
+                ({'name': name, **metrics} for name, metrics in self.queries.items()),
+                key=lambda metrics: metrics['seconds'],
+                reverse=True
+            )
+
+    def log_summary(self, top=10):
+        """
+        Logs the slowest queries.
+
+        Args:
+            top (int): The number of queries logged. Defaults to 10.
+        """
+        for metrics in self.summary()[:top]:
+            logging.info(f"{metrics['name']}: {metrics['calls']} calls, {metrics['seconds']:.2f}s, "
+                         f"{metrics['rows']:,} rows, {metrics['bytes'] / 1024 ** 2:,.1f} MB fetched, "
+                         f"{metrics['sent_bytes'] / 1024 ** 2:,.1f} MB sent")
+
+    def write(self, output_dir=None):
+        """
+        Writes the run metrics and captured plans to run_metrics_<timestamp>.json.
+
+        Args:
+            output_dir (Optional[str]): The directory of the file. Defaults to the configured output_dir.
+
+        Returns:
+            str: The path of the written file.
+        """
+        output_dir = output_dir or query_metrics_config.output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f"run_metrics_{self.started_at:%Y%m%d_%H%M%S}.json")
+        with self.lock:
+            plans = {name: plan for name, plan in self.plans.items() if plan is not None}
+        with open(path, 'w') as metrics_file:
+            json.dump({
+                'started_at': self.started_at.isoformat(),
+                'finished_at': datetime.now().isoformat(),
+                'queries': self.summary(),
+                'plans': plans
+            }, metrics_file, indent=2)
+        logging.info(f"Wrote run metrics of {len(self.queries)} queries to {path}")
+        return path
+
+
+# Metrics of the current run, shared by all instrumented connections
+run_metrics = QueryMetrics()
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """
+    A cursor recording wall time, rows and fetched or sent bytes of every statement into run_metrics.
+
+    Executions are timed and counted under the name of the queries.py constant they were built from, fetches add
+    their time, bytes and (for server-side cursors, whose rowcount is unknown) rows to the same name. The bytes a
+    COPY FROM STDIN reads from its file are recorded as sent, those a COPY TO STDOUT writes as fetched. With
+    query_metrics_config.explain set, the first execution of every named statement is preceded by an
+    EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) inside a savepoint that is rolled back.
+    """
+
+    query_name = None
+
+    def execute(self, query, vars=None):
+        if isinstance(query, sql.Composable):
+            query = query.as_string(self)
+        text = query.decode() if isinstance(query, bytes) else query
+        self.query_name = query_name(text)
+        if query_metrics_config.explain:
+            self.explain(text, vars)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            run_metrics.record(self.query_name, time.perf_counter() - started, rows=max(self.rowcount, 0))
+
+    def copy_expert(self, sql_query, file, size=8192):
+        if isinstance(sql_query, sql.Composable):
+            sql_query = sql_query.as_string(self)
+        self.query_name = query_name(sql_query)
+        if query_metrics_config.explain:
+            self.explain(sql_query, None)
+        started = time.perf_counter()
+        position = file.tell()
+        try:
+            return super().copy_expert(sql_query, file, size)
+        finally:
+            num_bytes = file.tell() - position
+            if COPY_FROM_STDIN_PATTERN.match(sql_query):
+                run_metrics.record(self.query_name, time.perf_counter() - started, rows=max(self.rowcount, 0),
+                                   sent_bytes=num_bytes)
+            else:
+                run_metrics.record(self.query_name, time.perf_counter() - started, rows=max(self.rowcount, 0),
+                                   num_bytes=num_bytes)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self.record_fetch([row] if row is not None else [], started)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.record_fetch(rows, started)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self.record_fetch(rows, started)
+        return rows
+
+    def record_fetch(self, rows, started):
+        """
+        Adds the time, bytes and, for server-side cursors, rows of a fetch to the current query.
+
+        Args:
+            rows (List[tuple]): The fetched rows.
+            started (float): The perf_counter() value when the fetch started.
+        """
+        run_metrics.record(self.query_name, time.perf_counter() - started,
+                           rows=len(rows) if self.name is not None else 0,
+                           num_bytes=estimate_bytes(rows), calls=0)
+
+    def explain(self, text, vars):
+        """
+        Captures the EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) plan of a statement, once per query name.
+
+        The statement runs inside a savepoint that is rolled back, on a separate plain cursor of the same
+        connection, so its effects are undone and the plan capture itself is not recorded. Connections in
+        autocommit mode and statements EXPLAIN does not accept are skipped.
+
+        Args:
+            text (str): The SQL statement.
+            vars (Optional[dict]): The parameters of the statement.
+        """
+        statement = text.strip().rstrip(';')
+        copy_to = COPY_TO_PATTERN.match(statement)
+        if copy_to:
+            statement = copy_to.group(1)
+        if (self.connection.autocommit or not statement.lstrip().upper().startswith(EXPLAINABLE_STATEMENTS)
+                or not run_metrics.claim_plan(self.query_name)):
+            return
+        with psycopg2.extensions.cursor(self.connection) as cursor:
+            cursor.execute(f"SAVEPOINT {EXPLAIN_SAVEPOINT}")
+            try:
+                cursor.execute(EXPLAIN_QUERY_PREFIX + statement, vars)
+                run_metrics.add_plan(self.query_name, cursor.fetchone()[0])
+            except psycopg2.Error as e:
+                logging.warning(f"Could not capture the plan of {self.query_name}: {e}")
+            finally:
+                cursor.execute(f"ROLLBACK TO SAVEPOINT {EXPLAIN_SAVEPOINT}")
+                cursor.execute(f"RELEASE SAVEPOINT {EXPLAIN_SAVEPOINT}")
+
+
+def instrument(conn):
+    """
+    Makes a connection create InstrumentedCursor cursors, if query metrics are enabled.
+
+    Args:
+        conn (connection): A database connection.
+
+    Returns:
+        connection: The same connection.
+    """
+    if query_metrics_config.enabled:
+        conn.cursor_factory = InstrumentedCursor
+    return conn
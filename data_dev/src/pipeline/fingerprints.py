@@ -0,0 +1,73 @@
+import os
+
+import psycopg2
+import pyarrow.parquet as pq
+
+from data_dev.src.connectors.postgre_connector import PostgresConnectorContextManager
+from data_dev.src.data.parquet_compactor import is_data_file
+
+
+def query_fingerprint(query, pool=None):
+    """
+    Describes the state of database tables by the first row of a query, e.g. row counts and watermarks.
+
+    Args:
+        query (str): The query, returning a single row.
+        pool (Optional[PostgresConnectionPool]): The pool the connection is checked out from. Defaults to None,
+                                                 which opens a new connection.
+
+    Returns:
+        Optional[list]: The values of the row, or None if the query failed, e.g. because a table does not exist yet.
+    """
+    with PostgresConnectorContextManager(autocommit=True, pool=pool) as connection_object:
+        with connection_object.get_connection().cursor() as cursor:
+            try:
+                cursor.execute(query)
+                return list(cursor.fetchone())
+            except psycopg2.Error:
+                return None
+
+
+def files_fingerprint(path):
+    """
+    Describes the state of a Parquet dataset by the relative path, size and modification time of its data files.
+
+    Args:
+        path (str): The directory of the dataset.
+
+    Returns:
+        List[list]: The path, size in bytes and modification time in nanoseconds of every data file, sorted.
+                    Empty if the directory does not exist.
+    """
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [name for name in dirs if not name.startswith(('.', '_'))]
+        for name in names:
+            if is_data_file(name):
+                stat = os.stat(os.path.join(root, name))
+                files.append([os.path.relpath(os.path.join(root, name), path), stat.st_size, stat.st_mtime_ns])
+    return sorted(files)
+
+
+def rows_fingerprint(path):
+    """
+    Describes the contents of a Parquet dataset by the number of rows in every directory holding data files.
+
+    Unlike files_fingerprint(), this stays the same when the files of a partition are rewritten with the same rows,
+    e.g. by the compaction, but changes when data files are deleted or partitions are added or removed.
+
+    Args:
+        path (str): The directory of the dataset.
+
+    Returns:
+        List[list]: The relative path and the number of rows of every directory holding data files, sorted.
+                    Empty if the directory does not exist.
+    """
+    rows = {}
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [name for name in dirs if not name.startswith(('.', '_'))]
+        for name in names:
+            if is_data_file(name):
+                partition = os.path.relpath(root, path)
+                rows[partition] = rows.get(partition, 0) + pq.read_metadata(os.path.join(root, name)).num_rows
+    return sorted([partition, num_rows] for partition, num_rows in rows.items())
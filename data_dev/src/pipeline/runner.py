@@ -0,0 +1,285 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from data_dev.config import pipeline_config
+
+# Outcomes of a stage
+SUCCEEDED = 'succeeded'
+UNCHANGED = 'unchanged'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+@dataclass
+class Stage:
+    """
+    A step of the pipeline and the datasets it reads and writes.
+
+    Attributes:
+        name (str): The unique name of the stage.
+        run (Callable[[], object]): Executes the stage. A stage fails by raising an exception.
+        inputs (List[str]): The datasets the stage reads. The stage runs after the stages producing them; inputs
+                            no stage produces are external.
+        outputs (List[str]): The datasets the stage writes. Every dataset is produced by one stage at most.
+        fingerprint (Optional[Callable[[], object]]): Returns a JSON-serializable description of the inputs, e.g.
+                                                      row counts or file sizes, or None if it cannot be determined.
+                                                      Stages without a fingerprint always run.
+    """
+    name: str
+    run: Callable[[], object]
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    fingerprint: Optional[Callable[[], object]] = None
+
+
+@dataclass
+class StageResult:
+    """
+    The outcome of a stage in a pipeline run.
+
+    Attributes:
+        name (str): The name of the stage.
+        status (str): SUCCEEDED, UNCHANGED (inputs unchanged since the last successful run), FAILED, or SKIPPED
+                      (an upstream stage did not complete).
+        seconds (float): The wall time of the stage, including its fingerprints.
+        message (str): The error of a failed stage or the reason a stage was skipped.
+    """
+    name: str
+    status: str
+    seconds: float = 0.0
+    message: str = ''
+
+
+class PipelineRunner:
+    """
+    Runs stages in the order their inputs and outputs imply, independent stages concurrently.
+
+    A stage starts once all stages producing its inputs completed. If one of them failed or was skipped, the stage
+    is skipped too, so it never runs on stale data. With skip_unchanged, a stage is not run if its fingerprint equals
+    the one recorded after its last successful run. The fingerprint is taken again after a successful run and
+    recorded in the state file, so a fingerprint may cover the stage's own outputs as well. The record is dropped
+    before a stage runs, so a stage that fails halfway runs again next time.
+
+    Attributes:
+        stages (Dict[str, Stage]): The stages by name, in declaration order.
+        dependencies (Dict[str, List[str]]): The names of the stages every stage waits for.
+        max_workers (int): The number of stages run concurrently.
+        skip_unchanged (bool): Whether stages with unchanged fingerprints are skipped.
+        state_path (str): The JSON file the fingerprints of successful stages are recorded in.
+    """
+
+    def __init__(self, stages, max_workers=None, skip_unchanged=None, state_path=None):
+        """
+        Initializes the PipelineRunner.
+
+        Args:
+            stages (List[Stage]): The stages of the pipeline.
+            max_workers (Optional[int]): The number of stages run concurrently. Defaults to the configured
+                                         max_workers.
+            skip_unchanged (Optional[bool]): Skip stages with unchanged fingerprints. Defaults to the configured
+                                             skip_unchanged.
+            state_path (Optional[str]): The state file. Defaults to the configured state_path.
+
+        Raises:
+            ValueError: If stage names are not unique, a dataset is produced by several stages, or the
+                        dependencies form a cycle.
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError("Stage names must be unique")
+        self.dependencies = self.resolve_dependencies(stages)
+        self.max_workers = max_workers or pipeline_config.max_workers
+        self.skip_unchanged = pipeline_config.skip_unchanged if skip_unchanged is None else skip_unchanged
+        self.state_path = state_path or pipeline_config.state_path
+        self.state = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def resolve_dependencies(stages):
+        """
+        Derives the stages every stage waits for from their inputs and outputs.
+
+        Args:
+            stages (List[Stage]): The stages of the pipeline.
+
+        Returns:
+            Dict[str, List[str]]: The names of the stages producing the inputs of every stage.
+
+        Raises:
+            ValueError: If a dataset is produced by several stages or the dependencies form a cycle.
+        """
+        producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"{output} is produced by both {producers[output]} and {stage.name}")
+                producers[output] = stage.name
+        dependencies = {
+            stage.name: sorted({producers[name] for name in stage.inputs if name in producers} - {stage.name})
+            for stage in stages
+        }
+
+        remaining = dict(dependencies)
+        while remaining:
+            ready = [name for name, names in remaining.items() if not remaining.keys() & set(names)]
+            if not ready:
+                raise ValueError(f"The dependencies of the stages {sorted(remaining)} form a cycle")
+            for name in ready:
+                del remaining[name]
+        return dependencies
+
+    @staticmethod
+    def digest(value):
+        """
+        Hashes a fingerprint.
+
+        Args:
+            value (object): The JSON-serializable fingerprint.
+
+        Returns:
+            str: The SHA-256 hex digest of its JSON representation.
+        """
+        return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+    def read_state(self):
+        """
+        Reads the fingerprints recorded after the last successful run of every stage.
+
+        Returns:
+            Dict[str, dict]: The fingerprint digest and completion time by stage name, empty if there is no state.
+        """
+        try:
+            with open(self.state_path) as state_file:
+                return json.load(state_file)
+        except FileNotFoundError:
+            return {}
+
+    def write_state(self):
+        """
+        Writes the recorded fingerprints. The state file is replaced atomically. The caller holds the lock.
+        """
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w') as state_file:
+            json.dump(self.state, state_file, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def record(self, name, fingerprint):
+        """
+        Records or, if fingerprint is None, drops the fingerprint of a stage.
+
+        Args:
+            name (str): The name of the stage.
+            fingerprint (Optional[str]): The fingerprint digest.
+        """
+        with self.lock:
+            if fingerprint is None:
+                if self.state.pop(name, None) is None:
+                    return
+            else:
+                self.state[name] = {'fingerprint': fingerprint, 'succeeded_at': datetime.now().isoformat()}
+            self.write_state()
+
+    def take_fingerprint(self, stage):
+        """
+        Takes the fingerprint of a stage.
+
+        Args:
+            stage (Stage): The stage.
+
+        Returns:
+            Optional[str]: The fingerprint digest, or None if the stage has no fingerprint or it cannot be determined.
+        """
+        if stage.fingerprint is None:
+            return None
+        value = stage.fingerprint()
+        return None if value is None else self.digest(value)
+
+    def execute(self, stage):
+        """
+        Runs a stage unless its fingerprint is unchanged, and records its fingerprint after a successful run.
+
+        Args:
+            stage (Stage): The stage.
+
+        Returns:
+            StageResult: The outcome of the stage. Exceptions are logged and reported as FAILED.
+        """
+        started = time.perf_counter()
+        try:
+            fingerprint = self.take_fingerprint(stage)
+            previous = self.state.get(stage.name, {})
+            if self.skip_unchanged and fingerprint is not None and fingerprint == previous.get('fingerprint'):
+                logging.info(f"Skipping {stage.name}: inputs unchanged since {previous['succeeded_at']}")
+                return StageResult(stage.name, UNCHANGED, time.perf_counter() - started)
+
+            logging.info(f"Starting {stage.name}...")
+            self.record(stage.name, None)
+            stage.run()
+            self.record(stage.name, self.take_fingerprint(stage))
+        except Exception as e:
+            logging.exception(f"{stage.name} FAILED: {e}")
+            return StageResult(stage.name, FAILED, time.perf_counter() - started, str(e))
+        elapsed = time.perf_counter() - started
+        logging.info(f"{stage.name} completed in {elapsed:.2f}s")
+        return StageResult(stage.name, SUCCEEDED, elapsed)
+
+    def run(self):
+        """
+        Runs all stages, each as soon as the stages it depends on completed.
+
+        Returns:
+            List[StageResult]: The outcome of every stage, in declaration order.
+        """
+        self.state = self.read_state()
+        started = time.perf_counter()
+        results = {}
+        pending = dict(self.dependencies)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name, dependencies in list(pending.items()):
+                    incomplete = [dependency for dependency in dependencies
+                                  if dependency in results and results[dependency].status in (FAILED, SKIPPED)]
+                    if incomplete:
+                        message = f"upstream stage {incomplete[0]} did not complete"
+                        logging.warning(f"Skipping {name}: {message}")
+                        results[name] = StageResult(name, SKIPPED, message=message)
+                    elif all(dependency in results for dependency in dependencies):
+                        running[executor.submit(self.execute, self.stages[name])] = name
+                    else:
+                        continue
+                    del pending[name]
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+        ordered = [results[name] for name in self.stages]
+        self.log_summary(ordered, time.perf_counter() - started)
+        return ordered
+
+    @staticmethod
+    def log_summary(results, elapsed):
+        """
+        Logs the status and wall time of every stage and the wall time of the run.
+
+        Args:
+            results (List[StageResult]): The outcomes of the stages.
+            elapsed (float): The wall time of the run in seconds.
+        """
+        width = max((len(result.name) for result in results), default=0)
+        for result in results:
+            message = f" ({result.message})" if result.message else ''
+            logging.info(f"{result.name:<{width}}  {result.status:<9}  {result.seconds:8.2f}s{message}")
+        logging.info(f"{'pipeline':<{width}}  {'':<9}  {elapsed:8.2f}s "
+                     f"(sum of stages: {sum(result.seconds for result in results):.2f}s)")
@@ -0,0 +1,127 @@
+import os
+import sys
+import uuid
+from dataclasses import replace
+
+import psycopg2
+import pytest
+
+# The data_dev modules import each other through the data_dev package, so the repository root must be importable
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from data_dev.config import (data_generator_config, load_config, postgres_config,  # noqa: E402
+                             postgres_pool_config, src_loader_config)
+from data_dev.src.data.inject_generated_data_to_src import GeneratedDataLoader  # noqa: E402
+from data_dev.src.data.nf3_loader import NF3Loader  # noqa: E402
+
+# A few hundred visits over five months, so the 3NF tests cover several monthly partitions and merge windows
+SRC_GENERATOR_CONFIG = replace(
+    data_generator_config,
+    num_patients=8,
+    start_date='2023-11-01',
+    end_date='2024-03-15',
+    visits_per_day=(2, 4),
+    columnar=True,
+    batch_size=None,
+    seed=3,
+    shard_days=30,
+    num_workers=1,
+    value_pool_size=None
+)
+
+
+def pytest_addoption(parser):
+    parser.addoption("--db_host", action="store", default=postgres_config.host)
+    parser.addoption("--db_port", action="store", default=str(postgres_config.port))
+    parser.addoption("--db_name", action="store", default=postgres_config.db)
+    parser.addoption("--db_user", action="store", default=postgres_config.user)
+    parser.addoption("--db_password", action="store", default=postgres_config.password)
+
+
+@pytest.fixture(scope="session")
+def db_credentials(request):
+    return {
+        "host": request.config.getoption("--db_host"),
+        "port": request.config.getoption("--db_port"),
+        "dbname": request.config.getoption("--db_name"),
+        "user": request.config.getoption("--db_user"),
+        "password": request.config.getoption("--db_password")
+    }
+
+
+@pytest.fixture
+def db_connection(db_credentials):
+    """
+    A connection to the test database, skipping the test if it is not reachable. Tests create TEMP tables only,
+    and the transaction is rolled back afterwards.
+    """
+    try:
+        conn = psycopg2.connect(connect_timeout=3, **db_credentials)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Postgres is not reachable: {e}".strip())
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+@pytest.fixture
+def db_schema(db_credentials, monkeypatch):
+    """
+    A scratch schema for the loaders, which create their tables unqualified. Yields a connection whose search_path
+    is the schema; postgres_config and the session settings of pooled connections are pointed at the test database
+    and the schema as well. The schema is dropped afterwards.
+    """
+    schema = f"data_dev_test_{uuid.uuid4().hex[:12]}"
+    try:
+        conn = psycopg2.connect(connect_timeout=3, options=f"-c search_path={schema}", **db_credentials)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Postgres is not reachable: {e}".strip())
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"CREATE SCHEMA {schema}")
+    conn.autocommit = False
+
+    monkeypatch.setattr(postgres_config, 'host', db_credentials['host'])
+    monkeypatch.setattr(postgres_config, 'port', db_credentials['port'])
+    monkeypatch.setattr(postgres_config, 'db', db_credentials['dbname'])
+    monkeypatch.setattr(postgres_config, 'user', db_credentials['user'])
+    monkeypatch.setattr(postgres_config, 'password', db_credentials['password'])
+    monkeypatch.setattr(postgres_pool_config, 'session_settings', {'search_path': schema})
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.close()
+
+
+@pytest.fixture
+def src_schema(db_schema, monkeypatch):
+    """
+    db_schema with the src_generated_* tables loaded from SRC_GENERATOR_CONFIG. load_config.date_scope is set to
+    the last generated day.
+    """
+    settings = {'method': 'copy', 'incremental': False, 'parallel_workers': 1, 'two_phase_commit': False,
+                'partition_visits': False}
+    for name, value in settings.items():
+        monkeypatch.setattr(src_loader_config, name, value)
+    monkeypatch.setattr(load_config, 'date_scope', SRC_GENERATOR_CONFIG.end_date)
+    GeneratedDataLoader(db_schema, generator_config=SRC_GENERATOR_CONFIG).inject_data()
+    return db_schema
+
+
+@pytest.fixture
+def nf3_schema(src_schema, monkeypatch):
+    """
+    src_schema with the source data merged into the 3NF tables in one transaction.
+    """
+    settings = {'incremental_merge': True, 'partition_visits': False, 'merge_window_months': None,
+                'merge_workers': 1}
+    for name, value in settings.items():
+        monkeypatch.setattr(load_config, name, value)
+    NF3Loader(src_schema).load_data()
+    return src_schema
@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from data_dev.src.data.copy_loader import CopyLoader
+
+COLUMNS = ['patient_id', 'visit_timestamp', 'treatment_cost']
+
+ROWS = [
+    {'treatment_cost': 10.5, 'patient_id': 1, 'visit_timestamp': '2024-01-01 08:00:00'},
+    {'treatment_cost': 99.99, 'patient_id': 2, 'visit_timestamp': '2024-01-02 17:30:15'}
+]
+
+CREATE_TEMP_VISITS_QUERY = """
+CREATE TEMP TABLE copy_loader_visits (
+    patient_id INT NOT NULL,
+    visit_timestamp TIMESTAMP NOT NULL,
+    treatment_cost NUMERIC(10, 2) NOT NULL
+)
+"""
+
+
+def test_rows_and_columns_convert_to_the_target_column_order():
+    from_rows = CopyLoader.to_arrow(ROWS, COLUMNS)
+    from_columns = CopyLoader.to_arrow({
+        'treatment_cost': np.array([10.5, 99.99]),
+        'visit_timestamp': np.array(['2024-01-01T08:00:00', '2024-01-02T17:30:15'], dtype='datetime64[s]'),
+        'patient_id': np.array([1, 2])
+    }, COLUMNS)
+    assert from_rows.column_names == COLUMNS
+    assert from_columns.column_names == COLUMNS
+    assert from_rows.column('patient_id').to_pylist() == from_columns.column('patient_id').to_pylist()
+
+
+def test_csv_buffer_has_a_header_line():
+    lines = CopyLoader.to_csv_buffer(CopyLoader.to_arrow(ROWS, COLUMNS)).read().decode().splitlines()
+    assert lines[0] == '"patient_id","visit_timestamp","treatment_cost"'
+    assert len(lines) == 3
+
+
+@pytest.mark.postgres
+@pytest.mark.parametrize('copy_supported', [True, False])
+def test_copy_and_insert_load_the_same_rows(db_connection, copy_supported):
+    loader = CopyLoader(page_size=1)
+    loader.copy_supported = copy_supported
+    with db_connection.cursor() as cursor:
+        cursor.execute(CREATE_TEMP_VISITS_QUERY)
+        assert loader.load(cursor, 'copy_loader_visits', COLUMNS, ROWS) == 2
+        cursor.execute("SELECT patient_id, visit_timestamp, treatment_cost::FLOAT FROM copy_loader_visits "
+                       "ORDER BY patient_id")
+        assert cursor.fetchall() == [
+            (1, datetime(2024, 1, 1, 8, 0), 10.5),
+            (2, datetime(2024, 1, 2, 17, 30, 15), 99.99)
+        ]
@@ -0,0 +1,99 @@
+from dataclasses import replace
+from datetime import date
+
+import numpy as np
+
+from data_dev.config import data_generator_config
+from data_dev.src.data.data_generator import DataGenerator, sample_visit_columns
+
+VISIT_DTYPES = {
+    name: column.dtype
+    for name, column in sample_visit_columns(
+        np.random.default_rng(0), np.array(['2024-01-01'], dtype='datetime64[D]'), (1, 1), 1, 1
+    ).items()
+}
+
+
+def make_generator(**overrides):
+    settings = {
+        'num_patients': 20,
+        'start_date': '2024-01-01',
+        'end_date': '2024-03-31',
+        'columnar': True,
+        'batch_size': None,
+        'seed': 7,
+        'shard_days': 10,
+        'patients_per_shard': 8,
+        'num_workers': 1,
+        'value_pool_size': None
+    }
+    settings.update(overrides)
+    return DataGenerator(generator_config=replace(data_generator_config, **settings))
+
+
+def test_columnar_visits_cover_the_period():
+    visits = make_generator().generate_visits_columnar()
+    visit_dates = visits['visit_timestamp'].astype('datetime64[D]')
+    assert visit_dates.min() == np.datetime64('2024-01-01')
+    assert visit_dates.max() == np.datetime64('2024-03-31')
+    assert {name: column.dtype for name, column in visits.items()} == VISIT_DTYPES
+    assert len({len(column) for column in visits.values()}) == 1
+
+
+def test_columnar_visits_of_an_empty_period_are_empty_typed_columns():
+    visits = make_generator(start_date='2024-02-01', end_date='2024-01-31').generate_visits_columnar()
+    assert {name: column.dtype for name, column in visits.items()} == VISIT_DTYPES
+    assert all(len(column) == 0 for column in visits.values())
+
+
+def test_empty_incremental_window_yields_no_batches():
+    generator = make_generator()
+    assert list(generator.iter_visit_batches(100, date(2024, 3, 2), date(2024, 3, 1))) == []
+    assert list(generator.iter_visit_shards(date(2024, 3, 2), date(2024, 3, 1))) == []
+
+
+def test_pooled_patients_without_patients_are_empty_typed_columns(tmp_path):
+    generator = make_generator(num_patients=0, value_pool_size=5, value_pool_cache_dir=str(tmp_path))
+    empty = generator.generate_patients()
+    reference = make_generator(num_patients=3, value_pool_size=5, value_pool_cache_dir=str(tmp_path))
+    patients = reference.generate_patients()
+    assert set(empty) == set(patients)
+    assert all(len(column) == 0 for column in empty.values())
+    assert {name: column.dtype for name, column in empty.items()} == {
+        name: column.dtype for name, column in patients.items()
+    }
+
+
+def test_visit_batches_concatenate_to_the_columnar_visits():
+    generator = make_generator()
+    batches = list(generator.iter_visit_batches(97))
+    assert all(len(batch['visit_timestamp']) == 97 for batch in batches[:-1])
+    assert 0 < len(batches[-1]['visit_timestamp']) <= 97
+    visits = generator.generate_visits_columnar()
+    for name, column in visits.items():
+        np.testing.assert_array_equal(np.concatenate([batch[name] for batch in batches]), column)
+
+
+def test_visit_batches_of_a_window_match_the_same_days_of_the_full_period():
+    generator = make_generator()
+    window = np.concatenate([batch['visit_timestamp']
+                             for batch in generator.iter_visit_batches(50, date(2024, 2, 5), date(2024, 2, 20))])
+    visits = generator.generate_visits_columnar()['visit_timestamp']
+    visit_dates = visits.astype('datetime64[D]')
+    in_window = (visit_dates >= np.datetime64('2024-02-05')) & (visit_dates <= np.datetime64('2024-02-20'))
+    np.testing.assert_array_equal(window, visits[in_window])
+
+
+def test_sharded_generation_does_not_depend_on_the_number_of_workers():
+    sequential = make_generator(num_workers=1)
+    parallel = make_generator(num_workers=2)
+    parallel_visits = parallel.generate_visits_columnar()
+    for name, column in sequential.generate_visits_columnar().items():
+        np.testing.assert_array_equal(parallel_visits[name], column)
+    assert parallel.generate_patients() == sequential.generate_patients()
+
+
+def test_different_seeds_generate_different_visits():
+    visits = make_generator(seed=1).generate_visits_columnar()
+    other = make_generator(seed=2).generate_visits_columnar()
+    assert not np.array_equal(visits['treatment_cost'][:50], other['treatment_cost'][:50])
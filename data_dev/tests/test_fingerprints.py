@@ -0,0 +1,61 @@
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from data_dev.config import ParquetWriterProfile
+from data_dev.queries import SELECT_NF3_FINGERPRINT_QUERY
+from data_dev.src.connectors.postgre_connector import PostgresConnectionPool
+from data_dev.src.data.parquet_compactor import ParquetCompactor
+from data_dev.src.pipeline.fingerprints import files_fingerprint, query_fingerprint, rows_fingerprint
+
+
+def write_files(path, num_files, rows_per_file=10):
+    path.mkdir(parents=True, exist_ok=True)
+    for i in range(num_files):
+        pq.write_table(pa.table({'value': list(range(rows_per_file))}), path / f"part-{i}.parquet")
+
+
+def test_rows_fingerprint_counts_the_rows_of_every_partition(tmp_path):
+    write_files(tmp_path / 'mart' / 'partition_date=2024-01', 3)
+    write_files(tmp_path / 'mart' / 'partition_date=2024-02', 1, rows_per_file=4)
+    (tmp_path / 'mart' / '_export_state.json').write_text('{}')
+    assert rows_fingerprint(str(tmp_path / 'mart')) == [['partition_date=2024-01', 30], ['partition_date=2024-02', 4]]
+    assert rows_fingerprint(str(tmp_path / 'missing')) == []
+
+
+def test_rows_fingerprint_survives_the_compaction_but_not_deleted_files(tmp_path):
+    partition = tmp_path / 'mart' / 'partition_date=2024-01'
+    write_files(partition, 5)
+    files, rows = files_fingerprint(str(tmp_path / 'mart')), rows_fingerprint(str(tmp_path / 'mart'))
+
+    ParquetCompactor(ParquetWriterProfile(), target_file_mb=1).compact_dataset(str(tmp_path / 'mart'))
+    assert files_fingerprint(str(tmp_path / 'mart')) != files
+    assert rows_fingerprint(str(tmp_path / 'mart')) == rows
+
+    os.remove(ParquetCompactor.list_files(str(partition))[0])
+    assert rows_fingerprint(str(tmp_path / 'mart')) == []
+
+
+@pytest.mark.postgres
+def test_nf3_fingerprint_changes_with_updated_and_deleted_visits(nf3_schema):
+    def fingerprint():
+        with PostgresConnectionPool(max_size=1) as pool:
+            return query_fingerprint(SELECT_NF3_FINGERPRINT_QUERY, pool)
+
+    def change(statement):
+        with nf3_schema.cursor() as cursor:
+            cursor.execute(statement)
+            # Publish the statistics of this connection on commit rather than up to seconds later
+            cursor.execute("SELECT pg_stat_force_next_flush()")
+        nf3_schema.commit()
+
+    loaded = fingerprint()
+    change("UPDATE visits SET duration_minutes = duration_minutes + 1 WHERE id = (SELECT MIN(id) FROM visits)")
+    updated = fingerprint()
+    assert updated[:3] == loaded[:3] and updated != loaded
+
+    change("DELETE FROM visits WHERE id = (SELECT MIN(id) FROM visits)")
+    deleted = fingerprint()
+    assert deleted[:3] == loaded[:3] and deleted != updated
@@ -0,0 +1,27 @@
+import sys
+
+from data_dev import generate_dataset
+from data_dev.config import data_generator_config, scale_factor_profile, scale_factor_profiles
+
+
+def test_scale_factor_profiles_grow_linearly():
+    sf1, sf10 = scale_factor_profile(1), scale_factor_profile(10)
+    assert sf10.num_patients == 10 * sf1.num_patients
+    assert sf10.num_facilities == 10 * sf1.num_facilities
+    assert sf10.visits_per_day == tuple(10 * value for value in sf1.visits_per_day)
+    assert sf1.start_date == data_generator_config.start_date
+    assert sf1 is not data_generator_config
+
+
+def test_command_line_overrides_do_not_modify_the_shared_profile(monkeypatch, tmp_path):
+    written = []
+    monkeypatch.setattr(generate_dataset, 'write_parquet', lambda profile, output_dir: written.append(profile))
+    monkeypatch.setattr(sys, 'argv', ['generate_dataset.py', 'SF1', '--output', str(tmp_path),
+                                      '--workers', '3', '--seed', '99'])
+    shared = scale_factor_profiles['SF1']
+    num_workers, seed = shared.num_workers, shared.seed
+
+    generate_dataset.main()
+
+    assert (written[0].num_workers, written[0].seed) == (3, 99)
+    assert (shared.num_workers, shared.seed) == (num_workers, seed)
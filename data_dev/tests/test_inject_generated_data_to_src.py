@@ -0,0 +1,247 @@
+from dataclasses import replace
+from datetime import datetime
+
+import psycopg2
+import pytest
+
+from data_dev.config import data_generator_config, postgres_pool_config, src_loader_config
+from data_dev.src.data.inject_generated_data_to_src import PARALLEL_LOAD_GTRID_PREFIX, GeneratedDataLoader
+
+GENERATOR_CONFIG = replace(
+    data_generator_config,
+    num_patients=5,
+    start_date='2024-01-01',
+    end_date='2024-01-10',
+    visits_per_day=(2, 4),
+    columnar=True,
+    batch_size=7,
+    seed=1,
+    shard_days=3,
+    num_workers=1,
+    value_pool_size=None
+)
+
+
+def configure_loader(monkeypatch, **settings):
+    settings = {'method': 'copy', 'incremental': False, 'incremental_days': 2, 'parallel_workers': 1,
+                'two_phase_commit': False, 'partition_visits': False, **settings}
+    for name, value in settings.items():
+        monkeypatch.setattr(src_loader_config, name, value)
+
+
+def fetch(conn, query):
+    with conn.cursor() as cursor:
+        cursor.execute(query)
+        return cursor.fetchall()
+
+
+def visit_summary(conn):
+    return fetch(conn, "SELECT COUNT(*), MIN(visit_timestamp)::DATE, MAX(visit_timestamp)::DATE "
+                       "FROM src_generated_visits")[0]
+
+
+def watermark(conn):
+    return fetch(conn, "SELECT last_visit_timestamp FROM src_generated_load_state")
+
+
+class TwoPhaseConnection:
+    """A stand-in for a pooled psycopg2 connection recording its two-phase commit calls."""
+
+    def __init__(self, index, failing_commit):
+        self.index = index
+        self.failing_commit = failing_commit
+        self.calls = []
+
+    def xid(self, format_id, gtrid, bqual):
+        return gtrid
+
+    def tpc_begin(self, xid):
+        self.calls.append('begin')
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        pass
+
+    def tpc_prepare(self):
+        self.calls.append('prepare')
+
+    def tpc_commit(self):
+        self.calls.append('commit')
+        if self.index == self.failing_commit:
+            raise RuntimeError('connection lost')
+
+    def tpc_rollback(self):
+        self.calls.append('rollback')
+
+
+class TwoPhasePool:
+    """A stand-in for a PostgresConnectionPool handing out TwoPhaseConnections."""
+
+    def __init__(self, failing_commit=None, failing_checkout=None):
+        self.failing_commit = failing_commit
+        self.failing_checkout = failing_checkout
+        self.connections = []
+        self.returned = []
+
+    def getconn(self):
+        if len(self.connections) == self.failing_checkout:
+            raise RuntimeError('pool exhausted')
+        self.connections.append(TwoPhaseConnection(len(self.connections), self.failing_commit))
+        return self.connections[-1]
+
+    def putconn(self, conn):
+        self.returned.append(conn)
+
+
+@pytest.mark.postgres
+def test_full_load_records_the_watermark_and_reruns_do_nothing(db_schema, monkeypatch):
+    configure_loader(monkeypatch)
+    GeneratedDataLoader(db_schema, generator_config=GENERATOR_CONFIG).inject_data()
+    count, first, last = visit_summary(db_schema)
+    assert (first.isoformat(), last.isoformat()) == ('2024-01-01', '2024-01-10')
+    assert fetch(db_schema, "SELECT COUNT(*) FROM src_generated_patients") == [(5,)]
+    assert watermark(db_schema) == fetch(db_schema, "SELECT MAX(visit_timestamp) FROM src_generated_visits")
+
+    GeneratedDataLoader(db_schema, generator_config=GENERATOR_CONFIG).inject_data()
+    assert visit_summary(db_schema)[0] == count
+
+
+@pytest.mark.postgres
+def test_incremental_load_appends_the_days_after_the_watermark(db_schema, monkeypatch):
+    configure_loader(monkeypatch)
+    GeneratedDataLoader(db_schema, generator_config=GENERATOR_CONFIG).inject_data()
+    count = visit_summary(db_schema)[0]
+
+    configure_loader(monkeypatch, incremental=True)
+    GeneratedDataLoader(db_schema, generator_config=GENERATOR_CONFIG).inject_data()
+
+    new_count, _, last = visit_summary(db_schema)
+    assert last.isoformat() == '2024-01-12'
+    expected = GeneratedDataLoader(None, generator_config=GENERATOR_CONFIG).dg.iter_visit_batches(
+        100, datetime(2024, 1, 11).date(), datetime(2024, 1, 12).date())
+    assert new_count - count == sum(len(batch['visit_timestamp']) for batch in expected)
+    assert watermark(db_schema)[0][0].date().isoformat() == '2024-01-12'
+
+
+def test_split_dates_covers_the_period_with_contiguous_slices(monkeypatch):
+    configure_loader(monkeypatch, parallel_workers=3, two_phase_commit=True)
+    loader = GeneratedDataLoader(None, generator_config=GENERATOR_CONFIG)
+    start, end = datetime(2024, 1, 1).date(), datetime(2024, 1, 10).date()
+    slices = loader.split_dates(start, end)
+    assert len(slices) == 3
+    assert slices[0][0] == start and slices[-1][1] == end
+    for (_, previous_last), (first, _) in zip(slices, slices[1:]):
+        assert (first - previous_last).days == 1
+    assert loader.split_dates(start, start) == [(start, start)]
+
+
+def test_parallel_loading_requires_two_phase_commit(monkeypatch):
+    configure_loader(monkeypatch, parallel_workers=2, two_phase_commit=False)
+    with pytest.raises(ValueError, match='two_phase_commit'):
+        GeneratedDataLoader(None, generator_config=GENERATOR_CONFIG)
+
+
+@pytest.mark.postgres
+@pytest.mark.parametrize('method', ['copy', 'insert'])
+def test_parallel_load_commits_data_and_watermark_together(db_schema, monkeypatch, method):
+    configure_loader(monkeypatch, method=method, parallel_workers=3, two_phase_commit=True)
+    GeneratedDataLoader(db_schema, generator_config=GENERATOR_CONFIG).inject_data()
+
+    visits = GeneratedDataLoader(None, generator_config=GENERATOR_CONFIG).dg.generate_visits_columnar()
+    assert visit_summary(db_schema)[0] == len(visits['visit_timestamp'])
+    assert fetch(db_schema, "SELECT COUNT(*) FROM src_generated_patients") == [(5,)]
+    assert watermark(db_schema) == fetch(db_schema, "SELECT MAX(visit_timestamp) FROM src_generated_visits")
+    assert fetch(db_schema, "SELECT COUNT(*) FROM pg_prepared_xacts WHERE database = current_database()") == [(0,)]
+
+
+@pytest.mark.postgres
+def test_parallel_load_method_insert_does_not_use_copy(db_schema, monkeypatch):
+    configure_loader(monkeypatch, method='insert', parallel_workers=2, two_phase_commit=True)
+    monkeypatch.setattr('data_dev.src.data.copy_loader.CopyLoader.load', lambda *args: pytest.fail('COPY used'))
+    GeneratedDataLoader(db_schema, generator_config=GENERATOR_CONFIG).inject_data()
+    assert visit_summary(db_schema)[0] > 0
+
+
+@pytest.mark.postgres
+def test_failed_parallel_load_commits_nothing(db_schema, monkeypatch):
+    configure_loader(monkeypatch, parallel_workers=3, two_phase_commit=True)
+    loader = GeneratedDataLoader(db_schema, generator_config=GENERATOR_CONFIG)
+
+    def fail():
+        raise RuntimeError('patients failed')
+
+    monkeypatch.setattr(loader.dg, 'generate_patients', fail)
+    with pytest.raises(RuntimeError, match='patients failed'):
+        loader.inject_data()
+
+    assert visit_summary(db_schema)[0] == 0
+    assert fetch(db_schema, "SELECT COUNT(*) FROM src_generated_facilities") == [(0,)]
+    assert watermark(db_schema) == []
+    assert fetch(db_schema, "SELECT COUNT(*) FROM pg_prepared_xacts WHERE database = current_database()") == [(0,)]
+
+
+def test_failed_commit_still_commits_the_other_connections(monkeypatch):
+    configure_loader(monkeypatch, parallel_workers=3, two_phase_commit=True)
+    pool = TwoPhasePool(failing_commit=1)
+    tasks = [(str(i), lambda cursor, loader: None) for i in range(3)]
+    with pytest.raises(RuntimeError, match='connection lost'):
+        GeneratedDataLoader(None, generator_config=GENERATOR_CONFIG).run_parallel_tasks(pool, tasks)
+    assert [conn.calls for conn in pool.connections] == [['begin', 'prepare', 'commit']] * 3
+    assert pool.returned == pool.connections
+
+
+def test_failed_checkout_returns_the_connections_checked_out(monkeypatch):
+    configure_loader(monkeypatch, parallel_workers=3, two_phase_commit=True)
+    pool = TwoPhasePool(failing_checkout=1)
+    tasks = [(str(i), lambda cursor, loader: None) for i in range(3)]
+    with pytest.raises(RuntimeError, match='pool exhausted'):
+        GeneratedDataLoader(None, generator_config=GENERATOR_CONFIG).run_parallel_tasks(pool, tasks)
+    assert pool.returned == pool.connections and len(pool.connections) == 1
+
+
+@pytest.mark.postgres
+def test_interrupted_parallel_load_is_committed_by_the_next_one(db_schema, db_credentials, monkeypatch):
+    configure_loader(monkeypatch, parallel_workers=3, two_phase_commit=True)
+    GeneratedDataLoader(db_schema, generator_config=GENERATOR_CONFIG).inject_data()
+    count = visit_summary(db_schema)[0]
+
+    # A worker transaction left prepared by a load killed between its commits
+    schema = postgres_pool_config.session_settings['search_path']
+    interrupted = psycopg2.connect(options=f"-c search_path={schema}", **db_credentials)
+    interrupted.tpc_begin(interrupted.xid(0, f"{PARALLEL_LOAD_GTRID_PREFIX}test", 'worker-1'))
+    with interrupted.cursor() as cursor:
+        cursor.execute("INSERT INTO src_generated_visits SELECT * FROM src_generated_visits LIMIT 1")
+    interrupted.tpc_prepare()
+    interrupted.close()
+    assert visit_summary(db_schema)[0] == count
+    db_schema.commit()
+
+    try:
+        GeneratedDataLoader(db_schema, generator_config=GENERATOR_CONFIG).inject_data()
+    finally:
+        # Never leave the transaction prepared: it would block dropping the schema
+        db_schema.rollback()
+        for xid in db_schema.tpc_recover():
+            if xid.gtrid == f"{PARALLEL_LOAD_GTRID_PREFIX}test":
+                db_schema.tpc_rollback(xid)
+    assert visit_summary(db_schema)[0] == count + 1
+    assert fetch(db_schema, "SELECT COUNT(*) FROM pg_prepared_xacts WHERE database = current_database()") == [(0,)]
+
+
+@pytest.mark.postgres
+def test_partitioned_load_creates_the_months_of_the_loaded_days(db_schema, monkeypatch):
+    configure_loader(monkeypatch, partition_visits=True, partition_premake_months=1)
+    GeneratedDataLoader(db_schema, generator_config=GENERATOR_CONFIG).inject_data()
+    assert fetch(db_schema, "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                            "WHERE i.inhparent = to_regclass('src_generated_visits') ORDER BY 1") == [
+        ('src_generated_visits_p202401',), ('src_generated_visits_p202402',)
+    ]
+    assert visit_summary(db_schema)[0] == fetch(db_schema, "SELECT COUNT(*) FROM src_generated_visits_p202401")[0][0]
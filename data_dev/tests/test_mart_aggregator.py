@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pyarrow as pa
+
+from data_dev.src.data.mart_aggregator import COMBINE_PARTS, MART_VISITS_SCHEMA, MartAggregator, round_half_up_ratio
+
+MARTS = [
+    'facility_type_avg_time_spent_per_visit_date',
+    'patient_sum_treatment_cost_per_facility_type',
+    'facility_name_min_time_spent_per_visit_date'
+]
+
+
+def make_visits(num_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    facilities = [('Hospital', 'North'), ('Clinic', 'East'), ('Specialty Center', 'South'), ('Lab', 'West')]
+    facility = rng.integers(0, len(facilities), num_rows)
+    return pa.table({
+        'facility_type': [facilities[i][0] for i in facility],
+        'facility_name': [facilities[i][1] for i in facility],
+        'full_name': [f"Patient {i}" for i in rng.integers(0, 10, num_rows)],
+        'visit_timestamp': [datetime(2024, 1, 1) + timedelta(minutes=int(m)) for m in rng.integers(0, 60 * 24 * 20,
+                                                                                                    num_rows)],
+        'treatment_cost_cents': rng.integers(100, 100_000, num_rows),
+        'duration_minutes': rng.integers(5, 240, num_rows)
+    }, schema=MART_VISITS_SCHEMA)
+
+
+def aggregate(batches):
+    aggregator = MartAggregator()
+    for batch in batches:
+        aggregator.update(batch)
+        assert len(aggregator.avg_parts) < COMBINE_PARTS
+        assert len(aggregator.min_parts) == len(aggregator.sum_parts) == len(aggregator.avg_parts)
+    return {mart: sorted(getattr(aggregator, mart)().to_pylist(), key=str) for mart in MARTS}
+
+
+def test_round_half_up_ratio_rounds_like_postgres():
+    numerator = np.array([1, 2, 5, -5, 1001, 0])
+    denominator = np.array([8, 3, 1000, 1000, 2000, 7])
+    np.testing.assert_array_equal(round_half_up_ratio(numerator, denominator), [0.13, 0.67, 0.01, -0.01, 0.5, 0.0])
+
+
+def test_marts_do_not_depend_on_the_batching():
+    visits = make_visits(5_000)
+    expected = aggregate(visits.to_batches())
+    assert aggregate(visits.to_batches(max_chunksize=37)) == expected
+    assert aggregate(visits.to_batches(max_chunksize=1_000)) == expected
+
+
+def test_marts_replicate_the_transform_mistakes():
+    visits = pa.table({
+        'facility_type': ['Clinic', 'Clinic', 'Lab', 'Hospital'],
+        'facility_name': ['East', 'East', 'West', 'North'],
+        'full_name': ['Ann Lee', 'Ann Lee', 'Ann Lee', None],
+        'visit_timestamp': [datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 9), datetime(2024, 1, 1, 10),
+                            datetime(2000, 10, 31)],
+        'treatment_cost_cents': [1050, 250, 999, 100],
+        'duration_minutes': [10, 15, 20, 30]
+    }, schema=MART_VISITS_SCHEMA)
+    marts = aggregate(visits.to_batches(max_chunksize=1))
+
+    assert [(row['facility_type'], row['avg_time_spent']) for row in marts[MARTS[0]]] == [('Clinic', 12.5)]
+    assert sorted((row['facility_type'], row['full_name'], row['sum_treatment_cost'])
+                  for row in marts[MARTS[1]] if row['full_name']) == [('Clinic', 'Ann Lee', -13.0),
+                                                                      ('Lab', 'Ann Lee', 9.99)]
+    assert sorted((row['facility_name'], row['min_time_spent']) for row in marts[MARTS[2]]) == [
+        ('East', 10), ('East', 10), ('North', 30), ('West', 20)
+    ]
+
+
+def test_marts_of_an_empty_stream_are_empty():
+    assert aggregate([]) == {mart: [] for mart in MARTS}
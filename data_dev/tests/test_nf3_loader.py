@@ -0,0 +1,236 @@
+from datetime import datetime
+
+import pytest
+
+from data_dev.config import load_config
+from data_dev.queries import NF3_INDEXES
+from data_dev.src.data.nf3_loader import NF3Loader
+
+# Merging windows of this size over SRC_GENERATOR_CONFIG (2023-11-01 - 2024-03-15) gives two windows
+WINDOWS = [(datetime(2023, 10, 1), datetime(2024, 1, 1)), (datetime(2024, 1, 1), datetime(2024, 3, 16))]
+
+
+class RecordingConnection:
+    """A stand-in for a psycopg2 connection recording the statements executed over it."""
+
+    def __init__(self):
+        self.statements = []
+        self.commits = 0
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        self.statements.append(params)
+
+    def commit(self):
+        self.commits += 1
+
+
+def configure_nf3(monkeypatch, **settings):
+    settings = {'incremental_merge': True, 'partition_visits': False, 'partition_premake_months': 0,
+                'merge_window_months': None, 'merge_workers': 1, **settings}
+    for name, value in settings.items():
+        monkeypatch.setattr(load_config, name, value)
+
+
+def fetch(conn, query, params=None):
+    with conn.cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def visits(conn):
+    return fetch(conn, "SELECT f.external_id, p.external_id, v.visit_timestamp, v.treatment_cost, v.duration_minutes "
+                       "FROM visits v JOIN facilities f ON f.id = v.facility_id JOIN patients p ON p.id = v.patient_id "
+                       "ORDER BY 1, 2, 3")
+
+
+def src_visits(conn):
+    return fetch(conn, "SELECT DISTINCT facility_id, patient_id, visit_timestamp, treatment_cost, duration_minutes "
+                       "FROM src_generated_visits WHERE visit_timestamp < %(date_scope)s::DATE + 1 ORDER BY 1, 2, 3",
+                 {'date_scope': load_config.date_scope})
+
+
+def watermark(conn):
+    return fetch(conn, "SELECT last_visit_timestamp FROM nf3_load_state")
+
+
+def add_src_visit(conn, visit_timestamp):
+    with conn.cursor() as cursor:
+        cursor.execute("INSERT INTO src_generated_visits "
+                       "SELECT patient_id, facility_id, %(visit_timestamp)s, treatment_cost, duration_minutes "
+                       "FROM src_generated_visits LIMIT 1", {'visit_timestamp': visit_timestamp})
+    conn.commit()
+
+
+@pytest.mark.postgres
+def test_full_merge_loads_the_source_visits_in_scope(src_schema, monkeypatch):
+    configure_nf3(monkeypatch, incremental_merge=False)
+    NF3Loader(src_schema).load_data()
+    assert visits(src_schema) == src_visits(src_schema)
+    assert watermark(src_schema) == []
+
+    NF3Loader(src_schema).load_data()
+    assert visits(src_schema) == src_visits(src_schema)
+
+
+@pytest.mark.postgres
+def test_incremental_merge_only_merges_visits_after_the_watermark(src_schema, monkeypatch):
+    configure_nf3(monkeypatch)
+    NF3Loader(src_schema).load_data()
+    merged = visits(src_schema)
+    assert merged == src_visits(src_schema)
+    assert watermark(src_schema) == fetch(src_schema, "SELECT MAX(visit_timestamp) FROM src_generated_visits")
+
+    add_src_visit(src_schema, '2024-03-15 23:59:59.5')
+    add_src_visit(src_schema, '2024-01-05 12:00:00.5')  # late arrival at or before the watermark
+    add_src_visit(src_schema, '2024-03-16 10:00:00')  # after date_scope
+    NF3Loader(src_schema).load_data()
+
+    new_visits = sorted(set(visits(src_schema)) - set(merged))
+    assert [visit[2].isoformat() for visit in new_visits] == ['2024-03-15T23:59:59.500000']
+    assert watermark(src_schema)[0][0].isoformat() == '2024-03-15T23:59:59.500000'
+
+
+@pytest.mark.postgres
+def test_load_creates_the_indexes_valid(src_schema, monkeypatch):
+    configure_nf3(monkeypatch)
+    NF3Loader(src_schema).load_data()
+    with src_schema.cursor() as cursor:
+        for index_name, _, _, unique in NF3_INDEXES:
+            assert NF3Loader.get_index_state(cursor, index_name) == (True, unique)
+
+
+@pytest.mark.postgres
+def test_unique_index_over_duplicate_keys_falls_back_to_a_plain_index(db_schema):
+    with db_schema.cursor() as cursor:
+        cursor.execute("CREATE TABLE keys (key INT)")
+        cursor.execute("INSERT INTO keys VALUES (1), (1), (2)")
+        NF3Loader(db_schema).ensure_index(cursor, 'keys_key_key', 'keys', ['key'], unique=True)
+        assert NF3Loader.get_index_state(cursor, 'keys_key_key') == (True, False)
+        NF3Loader(db_schema).ensure_index(cursor, 'keys_key_idx', 'keys', ['key'], unique=False)
+        assert NF3Loader.get_index_state(cursor, 'keys_key_idx') == (True, False)
+        assert NF3Loader.get_index_state(cursor, 'missing_idx') is None
+
+
+@pytest.mark.postgres
+def test_partitioned_visits_get_the_months_of_the_merged_visits(src_schema, monkeypatch):
+    configure_nf3(monkeypatch, partition_visits=True, partition_premake_months=1)
+    NF3Loader(src_schema).load_data()
+    assert visits(src_schema) == src_visits(src_schema)
+    assert fetch(src_schema, "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                             "WHERE i.inhparent = to_regclass('visits') ORDER BY 1") == [
+        ('visits_p202311',), ('visits_p202312',), ('visits_p202401',), ('visits_p202402',), ('visits_p202403',),
+        ('visits_p202404',)
+    ]
+
+
+@pytest.mark.parametrize('months, first_visit, last_visit, expected', [
+    (3, datetime(2023, 11, 5, 8), datetime(2024, 3, 15, 10), WINDOWS),
+    (1, datetime(2024, 1, 31, 23), datetime(2024, 3, 1), [
+        (datetime(2024, 1, 1), datetime(2024, 2, 1)),
+        (datetime(2024, 2, 1), datetime(2024, 3, 1)),
+        (datetime(2024, 3, 1), datetime(2024, 3, 16)),
+    ]),
+    (12, datetime(2024, 3, 15), datetime(2024, 3, 15, 23, 59), [(datetime(2024, 1, 1), datetime(2024, 3, 16))]),
+])
+def test_windows_are_aligned_to_the_calendar_and_end_with_the_date_scope(monkeypatch, months, first_visit,
+                                                                          last_visit, expected):
+    configure_nf3(monkeypatch, merge_window_months=months)
+    monkeypatch.setattr(load_config, 'date_scope', '2024-03-15')
+    assert NF3Loader(None).split_windows(first_visit, last_visit) == expected
+
+
+def test_windows_do_not_depend_on_the_first_merged_visit(monkeypatch):
+    configure_nf3(monkeypatch, merge_window_months=3)
+    monkeypatch.setattr(load_config, 'date_scope', '2024-03-15')
+    loader = NF3Loader(None)
+    resumed = loader.split_windows(datetime(2024, 2, 10), datetime(2024, 3, 15))
+    assert resumed == loader.split_windows(datetime(2023, 11, 5), datetime(2024, 3, 15))[1:]
+
+
+@pytest.mark.parametrize('completed, expected', [
+    ({}, []),
+    ({WINDOWS[1]: datetime(2024, 3, 15)}, []),
+    ({WINDOWS[0]: datetime(2023, 12, 31)}, [datetime(2023, 12, 31)]),
+    ({WINDOWS[0]: None, WINDOWS[1]: datetime(2024, 3, 15)}, [datetime(2024, 3, 15)]),
+    ({WINDOWS[0]: datetime(2023, 12, 31), WINDOWS[1]: None}, [datetime(2023, 12, 31)]),
+])
+def test_watermark_advances_over_the_contiguous_completed_windows_only(monkeypatch, completed, expected):
+    configure_nf3(monkeypatch, merge_window_months=3)
+    conn = RecordingConnection()
+    NF3Loader(conn).advance_watermark(WINDOWS, completed)
+    assert [params['last_visit_timestamp'] for params in conn.statements] == expected
+    assert conn.commits == len(expected)
+
+
+def test_watermark_is_not_kept_without_incremental_merging(monkeypatch):
+    configure_nf3(monkeypatch, incremental_merge=False, merge_window_months=3)
+    conn = RecordingConnection()
+    NF3Loader(conn).advance_watermark(WINDOWS, {WINDOWS[0]: datetime(2023, 12, 31)})
+    assert conn.statements == [] and conn.commits == 0
+
+
+@pytest.mark.postgres
+def test_interrupted_windowed_merge_resumes_at_the_unfinished_window(src_schema, monkeypatch):
+    configure_nf3(monkeypatch, merge_window_months=3)
+    merge_visits_window = NF3Loader.merge_visits_window
+    merged_windows = []
+
+    def fail_second_window(conn, watermark, window_start, window_end):
+        if window_start == WINDOWS[1][0]:
+            raise RuntimeError("interrupted")
+        merged_windows.append((window_start, window_end))
+        return merge_visits_window(conn, watermark, window_start, window_end)
+
+    monkeypatch.setattr(NF3Loader, 'merge_visits_window', staticmethod(fail_second_window))
+    with pytest.raises(RuntimeError):
+        NF3Loader(src_schema).load_data()
+    assert merged_windows == WINDOWS[:1]
+    assert watermark(src_schema) == fetch(src_schema, "SELECT MAX(visit_timestamp) FROM src_generated_visits "
+                                                      "WHERE visit_timestamp < '2024-01-01'")
+    assert fetch(src_schema, "SELECT window_start, window_end FROM nf3_merge_windows") == WINDOWS[:1]
+
+    monkeypatch.setattr(NF3Loader, 'merge_visits_window', staticmethod(merge_visits_window))
+    NF3Loader(src_schema).load_data()
+    assert visits(src_schema) == src_visits(src_schema)
+    assert watermark(src_schema) == fetch(src_schema, "SELECT MAX(visit_timestamp) FROM src_generated_visits")
+    assert fetch(src_schema, "SELECT COUNT(*) FROM nf3_merge_windows") == [(0,)]
+
+
+@pytest.mark.postgres
+def test_parallel_windowed_merge_matches_the_source(src_schema, monkeypatch):
+    configure_nf3(monkeypatch, merge_window_months=1, merge_workers=3)
+    NF3Loader(src_schema).load_data()
+    assert visits(src_schema) == src_visits(src_schema)
+    assert watermark(src_schema) == fetch(src_schema, "SELECT MAX(visit_timestamp) FROM src_generated_visits")
+
+
+@pytest.mark.postgres
+def test_failed_parallel_window_keeps_the_others_and_the_watermark_before_it(src_schema, monkeypatch):
+    configure_nf3(monkeypatch, merge_window_months=1, merge_workers=3)
+    merge_visits_window = NF3Loader.merge_visits_window
+
+    def fail_january(conn, watermark, window_start, window_end):
+        if window_start == datetime(2024, 1, 1):
+            raise RuntimeError("interrupted")
+        return merge_visits_window(conn, watermark, window_start, window_end)
+
+    monkeypatch.setattr(NF3Loader, 'merge_visits_window', staticmethod(fail_january))
+    with pytest.raises(RuntimeError):
+        NF3Loader(src_schema).load_data()
+    assert [start.month for start, _ in fetch(src_schema, "SELECT window_start, window_end FROM nf3_merge_windows "
+                                                          "ORDER BY 1")] == [11, 12, 2, 3]
+    assert watermark(src_schema) == fetch(src_schema, "SELECT MAX(visit_timestamp) FROM src_generated_visits "
+                                                      "WHERE visit_timestamp < '2024-01-01'")
+
+    monkeypatch.setattr(NF3Loader, 'merge_visits_window', staticmethod(merge_visits_window))
+    NF3Loader(src_schema).load_data()
+    assert visits(src_schema) == src_visits(src_schema)
@@ -0,0 +1,69 @@
+import os
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from data_dev.config import ParquetWriterProfile
+from data_dev.src.data.parquet_compactor import BACKUP_PREFIX, STAGING_PREFIX, ParquetCompactor
+
+
+def write_files(path, num_files, rows_per_file=10):
+    path.mkdir(parents=True, exist_ok=True)
+    for i in range(num_files):
+        values = list(range(i, num_files * rows_per_file, num_files))
+        pq.write_table(pa.table({'visit_date': values, 'value': [str(value) for value in values]}),
+                       path / f"part-{i}.parquet")
+
+
+def read_rows(path):
+    return ds.dataset(str(path), format='parquet').to_table().to_pylist()
+
+
+def test_small_files_of_a_partition_are_merged_in_sort_order(tmp_path):
+    partition = tmp_path / 'mart' / 'partition_date=2024-01'
+    write_files(partition, 5)
+    (tmp_path / 'mart' / '_export_state.json').write_text('{}')
+    expected = sorted(read_rows(partition), key=lambda row: row['visit_date'])
+
+    compactor = ParquetCompactor(ParquetWriterProfile(sort_by=['visit_date']), target_file_mb=1)
+    stats = compactor.compact_dataset(str(tmp_path / 'mart'))
+
+    assert (stats['partitions'], stats['files_rewritten'], stats['files_written']) == (1, 5, 1)
+    assert len(ParquetCompactor.list_files(str(partition))) == 1
+    assert read_rows(partition) == expected
+    assert sorted(os.listdir(tmp_path / 'mart')) == ['_export_state.json', 'partition_date=2024-01']
+
+
+def test_partitions_in_few_enough_files_are_left_untouched(tmp_path):
+    partition = tmp_path / 'mart' / 'partition_date=2024-01'
+    write_files(partition, 1)
+    files = ParquetCompactor.list_files(str(partition))
+
+    stats = ParquetCompactor(ParquetWriterProfile(), target_file_mb=1).compact_dataset(str(tmp_path / 'mart'))
+    assert stats['partitions'] == 0
+    assert ParquetCompactor.list_files(str(partition)) == files
+    assert ParquetCompactor(target_file_mb=1).compact_dataset(str(tmp_path / 'missing'))['partitions'] == 0
+
+
+def test_recover_restores_partitions_missing_after_an_interrupted_swap(tmp_path):
+    mart = tmp_path / 'mart'
+    write_files(mart / f"{BACKUP_PREFIX}a1-partition_date=2024-01", 2)
+    write_files(mart / f"{STAGING_PREFIX}a1-partition_date=2024-01", 1)
+    write_files(mart / 'partition_date=2024-02', 1)
+    write_files(mart / f"{BACKUP_PREFIX}b2-partition_date=2024-02", 2)
+    write_files(mart / f"{STAGING_PREFIX}c3-partition_date=2024-03", 1)
+
+    ParquetCompactor.recover(str(mart))
+
+    assert sorted(os.listdir(mart)) == ['partition_date=2024-01', 'partition_date=2024-02']
+    assert len(ParquetCompactor.list_files(str(mart / 'partition_date=2024-01'))) == 2
+    assert len(ParquetCompactor.list_files(str(mart / 'partition_date=2024-02'))) == 1
+
+
+def test_hidden_directories_are_not_partitions(tmp_path):
+    mart = tmp_path / 'mart'
+    write_files(mart / 'facility_type_partition=Clinic', 2)
+    write_files(mart / f"{STAGING_PREFIX}a1-facility_type_partition=Clinic", 2)
+    write_files(mart / '_tmp', 2)
+    assert ParquetCompactor.list_partitions(str(mart)) == [str(mart / 'facility_type_partition=Clinic')]
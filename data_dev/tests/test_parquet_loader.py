@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+
+from data_dev.benchmark_parquet_writer import benchmark_profile
+from data_dev.config import ParquetWriterProfile, parquet_storage_config, parquet_writer_profiles
+from data_dev.src.connectors.postgre_connector import PostgresConnectionPool, PostgresConnectorContextManager
+from data_dev.src.data.parquet_loader import (FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_SCHEMA, MARTS,
+                                              LoadParquet)
+
+# A month of average time spent rows for two facility types, reaching into the previous month, in reverse order
+AVG_TIME_SPENT = pa.table({
+    'facility_type': ['Clinic', 'Hospital'] * 30,
+    'visit_date': [datetime(2024, 2, 29) - timedelta(days=day // 2) for day in range(60)],
+    'avg_time_spent': [float(day) for day in range(60)]
+}, schema=FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_SCHEMA)
+
+
+def configure_export(monkeypatch, storage_path, **settings):
+    settings = {'streaming': False, 'stream_batch_size': 50_000, 'incremental': False, 'export_workers': 1,
+                'engine': 'sql', 'writer_profile': ParquetWriterProfile(), 'extraction': 'cursor',
+                'compaction': False, **settings}
+    settings.update({f"storage_path_{mart}": str(storage_path / mart) for mart in MARTS})
+    for name, value in settings.items():
+        monkeypatch.setattr(parquet_storage_config, name, value)
+
+
+def export():
+    with PostgresConnectionPool(min_size=1, max_size=3) as pool:
+        with PostgresConnectorContextManager(pool=pool) as connection_object:
+            LoadParquet(connection_object, pool=pool).load_parquet()
+
+
+def read_mart(path):
+    """The rows of a mart, sorted, with timestamps as ISO strings, since their unit depends on the writing path."""
+    rows = ds.dataset(path, format='parquet', partitioning='hive').to_table().to_pylist()
+    return sorted((tuple(value.isoformat() if hasattr(value, 'isoformat') else value for value in row.values())
+                   for row in rows), key=str)
+
+
+def file_layouts(path):
+    """The codec, row group sizes and visit_date values of every Parquet file of a dataset."""
+    layouts = []
+    for file in sorted(path.rglob('*.parquet')):
+        metadata = pq.ParquetFile(file).metadata
+        layouts.append((
+            metadata.row_group(0).column(0).compression,
+            [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)],
+            pq.read_table(file).column('visit_date').to_pylist()
+        ))
+    return layouts
+
+
+def export_marts(monkeypatch, storage_path, **settings):
+    configure_export(monkeypatch, storage_path, **settings)
+    export()
+    return {mart: read_mart(storage_path / mart) for mart in MARTS}
+
+
+@pytest.mark.postgres
+def test_streamed_marts_match_the_data_frame_export(nf3_schema, monkeypatch, tmp_path):
+    expected = export_marts(monkeypatch, tmp_path / 'frames')
+    assert all(expected.values())
+    assert export_marts(monkeypatch, tmp_path / 'streamed', streaming=True, stream_batch_size=7) == expected
+
+
+def partition_files(path):
+    return {partition.name: sorted(file.name for file in partition.iterdir()) for partition in path.iterdir()
+            if partition.is_dir()}
+
+
+@pytest.mark.postgres
+@pytest.mark.parametrize('streaming', [False, True])
+def test_incremental_export_rewrites_the_months_of_new_visits_only(nf3_schema, monkeypatch, tmp_path, streaming):
+    configure_export(monkeypatch, tmp_path / 'incremental', incremental=True, streaming=streaming)
+    export()
+    mart = 'facility_type_avg_time_spent_per_visit_date'
+    before = partition_files(tmp_path / 'incremental' / mart)
+    with nf3_schema.cursor() as cursor:
+        cursor.execute("INSERT INTO visits (patient_id, facility_id, visit_timestamp, treatment_cost, "
+                       "duration_minutes) SELECT patient_id, facility_id, '2024-02-10 12:00:00.5', treatment_cost, 1 FROM visits "
+                       "JOIN facilities f ON f.id = facility_id WHERE f.facility_type = 'Clinic' LIMIT 1")
+    nf3_schema.commit()
+    export()
+
+    after = partition_files(tmp_path / 'incremental' / mart)
+    assert after.keys() == before.keys()
+    assert [month for month in after if after[month] != before[month]] == ['partition_date=2024-02']
+    full = export_marts(monkeypatch, tmp_path / 'full', streaming=streaming)
+    assert {mart: read_mart(tmp_path / 'incremental' / mart) for mart in MARTS} == full
+
+
+@pytest.mark.postgres
+def test_concurrent_export_matches_the_sequential_export(nf3_schema, monkeypatch, tmp_path):
+    expected = export_marts(monkeypatch, tmp_path / 'sequential', streaming=True)
+    assert export_marts(monkeypatch, tmp_path / 'concurrent', streaming=True, export_workers=3) == expected
+
+
+@pytest.mark.postgres
+def test_failed_concurrent_export_raises_after_the_other_marts(nf3_schema, monkeypatch, tmp_path):
+    configure_export(monkeypatch, tmp_path, streaming=True, export_workers=3)
+
+    def fail(self):
+        raise RuntimeError("export failed")
+
+    monkeypatch.setattr(LoadParquet, 'transform_patient_sum_treatment_cost_per_facility_type', fail)
+    with pytest.raises(RuntimeError, match="export failed"):
+        export()
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        'facility_name_min_time_spent_per_visit_date', 'facility_type_avg_time_spent_per_visit_date'
+    ]
+
+
+@pytest.mark.postgres
+def test_single_scan_marts_match_the_sql_marts(nf3_schema, monkeypatch, tmp_path):
+    expected = export_marts(monkeypatch, tmp_path / 'sql', streaming=True)
+    assert export_marts(monkeypatch, tmp_path / 'single_scan', engine='single_scan', stream_batch_size=7) == expected
+
+
+@pytest.mark.parametrize('profile_name', sorted(parquet_writer_profiles))
+def test_written_files_follow_the_writer_profile(monkeypatch, tmp_path, profile_name):
+    profile = parquet_writer_profiles[profile_name]
+    monkeypatch.setattr(profile, 'row_group_size', 8)
+    configure_export(monkeypatch, tmp_path, writer_profile=profile)
+    loader = LoadParquet(connection_object=None)
+    result = benchmark_profile(loader, MARTS[0], AVG_TIME_SPENT, str(tmp_path / 'streamed'), repeat=1)
+    assert result['rows_read'] == 14
+    df = AVG_TIME_SPENT.to_pandas()
+    df['partition_date'] = df['visit_date'].dt.strftime('%Y-%m')
+    loader.to_parquet(df, str(tmp_path / 'frames'), ['partition_date'])
+
+    for path in (tmp_path / 'streamed', tmp_path / 'frames'):
+        layouts = file_layouts(path)
+        assert [len(layout[2]) for layout in layouts] == [2, 58]
+        for compression, row_groups, visit_dates in layouts:
+            assert compression == profile.compression.upper().replace('NONE', 'UNCOMPRESSED')
+            assert max(row_groups) <= 8
+            if profile.sort_by:
+                assert visit_dates == sorted(visit_dates)
+
+
+@pytest.mark.postgres
+def test_copy_extraction_matches_the_cursor_extraction(nf3_schema, monkeypatch, tmp_path):
+    expected = export_marts(monkeypatch, tmp_path / 'cursor', streaming=True)
+    assert export_marts(monkeypatch, tmp_path / 'copy', streaming=True, extraction='copy') == expected
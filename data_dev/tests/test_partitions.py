@@ -0,0 +1,58 @@
+from datetime import date
+
+import pytest
+
+from data_dev.src.data.partitions import add_months, ensure_monthly_partitions, is_partitioned, month_start
+
+
+def partitions(cursor, table_name):
+    cursor.execute("SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+                   "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s) ORDER BY 1",
+                   (table_name,))
+    return cursor.fetchall()
+
+
+def test_month_start():
+    assert month_start(date(2024, 2, 29)) == date(2024, 2, 1)
+    assert month_start(date(2024, 1, 1)) == date(2024, 1, 1)
+
+
+@pytest.mark.parametrize('day, months, expected', [
+    (date(2024, 1, 1), 0, date(2024, 1, 1)),
+    (date(2024, 1, 1), 1, date(2024, 2, 1)),
+    (date(2024, 11, 1), 2, date(2025, 1, 1)),
+    (date(2024, 12, 1), 25, date(2027, 1, 1)),
+    (date(2024, 1, 1), -1, date(2023, 12, 1)),
+    (date(2024, 3, 1), -15, date(2022, 12, 1)),
+])
+def test_add_months(day, months, expected):
+    assert add_months(day, months) == expected
+
+
+@pytest.mark.postgres
+def test_monthly_partitions_cover_the_period_and_the_premade_months(db_schema):
+    with db_schema.cursor() as cursor:
+        cursor.execute("CREATE TABLE events (event_timestamp TIMESTAMP) PARTITION BY RANGE (event_timestamp)")
+        assert is_partitioned(cursor, 'events')
+        assert ensure_monthly_partitions(cursor, 'events', date(2023, 12, 15), date(2024, 1, 3), 1) == 3
+        assert partitions(cursor, 'events') == [
+            ('events_p202312', "FOR VALUES FROM ('2023-12-01 00:00:00') TO ('2024-01-01 00:00:00')"),
+            ('events_p202401', "FOR VALUES FROM ('2024-01-01 00:00:00') TO ('2024-02-01 00:00:00')"),
+            ('events_p202402', "FOR VALUES FROM ('2024-02-01 00:00:00') TO ('2024-03-01 00:00:00')"),
+        ]
+
+        assert ensure_monthly_partitions(cursor, 'events', date(2024, 1, 31), date(2024, 3, 1)) == 3
+        assert [name for name, _ in partitions(cursor, 'events')] == [
+            'events_p202312', 'events_p202401', 'events_p202402', 'events_p202403'
+        ]
+        cursor.execute("INSERT INTO events VALUES ('2023-12-01'), ('2024-03-31 23:59:59')")
+
+
+@pytest.mark.postgres
+def test_unpartitioned_tables_are_skipped(db_schema):
+    with db_schema.cursor() as cursor:
+        cursor.execute("CREATE TABLE events (event_timestamp TIMESTAMP)")
+        assert not is_partitioned(cursor, 'events')
+        assert not is_partitioned(cursor, 'missing')
+        assert ensure_monthly_partitions(cursor, 'events', date(2024, 1, 1), date(2024, 3, 1)) is None
+        assert partitions(cursor, 'events') == []
@@ -0,0 +1,125 @@
+import threading
+
+import pytest
+
+from data_dev.src.pipeline.runner import FAILED, SKIPPED, SUCCEEDED, UNCHANGED, PipelineRunner, Stage
+
+
+class Fingerprint:
+    """A stage fingerprint whose value the test changes between runs."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self):
+        return self.value
+
+
+def make_runner(stages, tmp_path, **settings):
+    settings = {'max_workers': 1, 'skip_unchanged': True, 'state_path': str(tmp_path / 'state' / 'state.json'),
+                **settings}
+    return PipelineRunner(stages, **settings)
+
+
+def statuses(results):
+    return {result.name: result.status for result in results}
+
+
+def fail():
+    raise RuntimeError("broken")
+
+
+def test_dependencies_follow_the_datasets():
+    stages = [
+        Stage('report', lambda: None, inputs=['marts', 'nf3']),
+        Stage('export', lambda: None, inputs=['nf3', 'external'], outputs=['marts']),
+        Stage('load', lambda: None, inputs=['src'], outputs=['nf3'])
+    ]
+    assert PipelineRunner.resolve_dependencies(stages) == {'report': ['export', 'load'], 'export': ['load'],
+                                                           'load': []}
+
+
+@pytest.mark.parametrize('stages, message', [
+    ([Stage('a', lambda: None, outputs=['x']), Stage('b', lambda: None, outputs=['x'])], 'produced by both'),
+    ([Stage('a', lambda: None, inputs=['y'], outputs=['x']), Stage('b', lambda: None, inputs=['x'], outputs=['y'])],
+     'form a cycle'),
+    ([Stage('a', lambda: None), Stage('a', lambda: None)], 'must be unique'),
+])
+def test_invalid_pipelines_are_rejected(tmp_path, stages, message):
+    with pytest.raises(ValueError, match=message):
+        make_runner(stages, tmp_path)
+
+
+def test_stages_run_after_the_stages_they_depend_on(tmp_path):
+    order = []
+    stages = [
+        Stage('report', lambda: order.append('report'), inputs=['marts']),
+        Stage('export', lambda: order.append('export'), inputs=['nf3'], outputs=['marts']),
+        Stage('load', lambda: order.append('load'), outputs=['nf3'])
+    ]
+    results = make_runner(stages, tmp_path, max_workers=3).run()
+    assert order == ['load', 'export', 'report']
+    assert [result.name for result in results] == ['report', 'export', 'load']
+    assert set(statuses(results).values()) == {SUCCEEDED}
+
+
+def test_independent_stages_run_concurrently(tmp_path):
+    barrier = threading.Barrier(2, timeout=5)
+    stages = [Stage('a', barrier.wait), Stage('b', barrier.wait)]
+    assert statuses(make_runner(stages, tmp_path, max_workers=2).run()) == {'a': SUCCEEDED, 'b': SUCCEEDED}
+
+
+def test_failure_skips_the_downstream_stages_only(tmp_path):
+    stages = [
+        Stage('load', fail, outputs=['nf3']),
+        Stage('export', lambda: None, inputs=['nf3'], outputs=['marts']),
+        Stage('report', lambda: None, inputs=['marts']),
+        Stage('other', lambda: None)
+    ]
+    results = make_runner(stages, tmp_path).run()
+    assert statuses(results) == {'load': FAILED, 'export': SKIPPED, 'report': SKIPPED, 'other': SUCCEEDED}
+    assert results[0].message == 'broken'
+    assert results[2].message == 'upstream stage export did not complete'
+
+
+def test_unchanged_stages_are_skipped_until_their_fingerprint_changes(tmp_path):
+    runs = []
+    fingerprint = Fingerprint({'rows': 1})
+    stages = [Stage('load', lambda: runs.append('load'), outputs=['nf3'], fingerprint=fingerprint),
+              Stage('export', lambda: runs.append('export'), inputs=['nf3'])]
+
+    assert statuses(make_runner(stages, tmp_path).run()) == {'load': SUCCEEDED, 'export': SUCCEEDED}
+    assert statuses(make_runner(stages, tmp_path).run()) == {'load': UNCHANGED, 'export': SUCCEEDED}
+    fingerprint.value = {'rows': 2}
+    assert statuses(make_runner(stages, tmp_path).run()) == {'load': SUCCEEDED, 'export': SUCCEEDED}
+    assert statuses(make_runner(stages, tmp_path, skip_unchanged=False).run()) == {'load': SUCCEEDED,
+                                                                                   'export': SUCCEEDED}
+    assert runs == ['load', 'export', 'export', 'load', 'export', 'load', 'export']
+
+
+def test_stages_without_a_determinable_fingerprint_always_run(tmp_path):
+    stages = [Stage('load', lambda: None, fingerprint=Fingerprint(None))]
+    make_runner(stages, tmp_path).run()
+    assert statuses(make_runner(stages, tmp_path).run()) == {'load': SUCCEEDED}
+
+
+def test_fingerprint_is_taken_after_the_run(tmp_path):
+    fingerprint = Fingerprint('before')
+    stages = [Stage('export', lambda: setattr(fingerprint, 'value', 'after'), fingerprint=fingerprint)]
+    make_runner(stages, tmp_path).run()
+    assert statuses(make_runner(stages, tmp_path).run()) == {'export': UNCHANGED}
+
+
+def test_failed_stage_runs_again_next_time(tmp_path):
+    outcome = {'run': lambda: None}
+    stages = [Stage('load', lambda: outcome['run'](), fingerprint=Fingerprint('same'))]
+    make_runner(stages, tmp_path).run()
+
+    outcome['run'] = fail
+    failed = make_runner(stages, tmp_path, skip_unchanged=False)
+    assert statuses(failed.run()) == {'load': FAILED}
+    assert failed.read_state() == {}
+    outcome['run'] = lambda: None
+    runner = make_runner(stages, tmp_path)
+    assert statuses(runner.run()) == {'load': SUCCEEDED}
+    assert set(runner.read_state()) == {'load'}
@@ -0,0 +1,72 @@
+import pytest
+
+from data_dev.plan_regression import capture_plans, compare_plans, named_queries, plan_relations, plan_structure
+
+PLAN = {
+    'Node Type': 'Hash Join', 'Join Type': 'Inner', 'Total Cost': 100.0, 'Plan Rows': 10,
+    'Plans': [
+        {'Node Type': 'Seq Scan', 'Relation Name': 'visits', 'Parent Relationship': 'Outer'},
+        {'Node Type': 'Hash', 'Parent Relationship': 'Inner', 'Plans': [
+            {'Node Type': 'Index Scan', 'Relation Name': 'facilities', 'Index Name': 'facilities_pkey',
+             'Parent Relationship': 'Outer'}
+        ]}
+    ]
+}
+
+PARAMS = {'date_scope': None, 'watermark': None, 'window_start': None, 'window_end': None, 'last_visit_id': 0,
+          'max_visit_id': 0, 'table_name': 'visits', 'index_name': 'visits_natural_key'}
+
+
+def summary(structure, total_cost, relation_rows):
+    return {'structure': structure, 'total_cost': total_cost, 'relation_rows': relation_rows}
+
+
+def test_plan_structure_and_relations():
+    assert plan_structure(PLAN) == [
+        'Hash Join (Inner)',
+        '  Seq Scan (visits, Outer)',
+        '  Hash (Inner)',
+        '    Index Scan (facilities, facilities_pkey, Outer)'
+    ]
+    assert plan_relations(PLAN) == {'visits', 'facilities'}
+
+
+def test_named_queries_are_the_explainable_constants_with_known_parameters():
+    names = named_queries(PARAMS)
+    assert {'MERGE_VISITS_QUERY', 'MERGE_VISITS_INCREMENTAL_QUERY', 'SELECT_NF3_WATERMARK_QUERY',
+            'TRANSFORM_FACILITY_TYPE_AVG_TIME_SPENT_PER_VISIT_DATE_SQL'} <= names.keys()
+    # DDL, identifier templates and statements with other parameters
+    assert not {'CREATE_VISITS_TABLE_QUERY', 'ORDER_RESULT_QUERY', 'UPSERT_NF3_WATERMARK_QUERY'} & names.keys()
+    assert 'MERGE_VISITS_QUERY' not in named_queries({})
+
+
+def test_compare_plans():
+    structure = plan_structure(PLAN)
+    baseline = {'A': summary(structure, 100.0, 1000), 'B': summary(structure, 100.0, 1000),
+                'C': summary(structure, 100.0, 1000), 'D': summary(structure, 100.0, 1000)}
+    current = {'A': summary(structure, 290.0, 2000), 'B': summary(structure, 310.0, 2000),
+               'C': summary(structure[:1], 100.0, 1000), 'E': summary(structure, 1.0, 1)}
+
+    regressions = compare_plans(baseline, current, cost_tolerance=0.5)
+    assert [regression.split(':')[0] for regression in regressions] == ['B', 'C', 'D']
+    assert regressions[0] == "B: cost grew 3.10x (100 -> 310) while rows grew 2.00x"
+    assert regressions[1].startswith("C: plan changed\n    baseline:\n      Hash Join (Inner)\n")
+    assert regressions[2] == "D: no longer explained"
+    assert compare_plans(baseline, baseline, cost_tolerance=0.0) == []
+
+
+@pytest.mark.postgres
+def test_captured_plans_are_rolled_back(nf3_schema):
+    with nf3_schema.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM visits")
+        visits = cursor.fetchone()[0]
+        nf3_schema.rollback()
+        plans = capture_plans(cursor)
+        cursor.execute("SELECT COUNT(*) FROM visits")
+        assert cursor.fetchone()[0] == visits
+
+    merge = plans['MERGE_VISITS_INCREMENTAL_QUERY']
+    assert merge['structure'][0].startswith('ModifyTable')
+    assert {'visits', 'src_generated_visits'} <= set(merge['relations'])
+    assert merge['total_cost'] > 0
+    assert plans['SELECT_NF3_WATERMARK_QUERY']['relations'] == ['nf3_load_state']
@@ -0,0 +1,154 @@
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from data_dev.config import postgres_pool_config, query_metrics_config
+from data_dev.src.connectors.postgre_connector import (PostgresConnectionPool, PostgresConnectorContextManager,
+                                                       session_options)
+from data_dev.src.monitoring import query_metrics
+from data_dev.src.monitoring.query_metrics import QueryMetrics
+
+TYPED_VALUES_QUERY = """
+SELECT *
+FROM (VALUES
+    (1, 10.25::NUMERIC(10, 2), 'a'::TEXT, '2024-01-02 03:04:05'::TIMESTAMP, '2024-01-02'::DATE, TRUE),
+    (2, NULL, '', NULL, NULL, FALSE),
+    (3, 0.5, NULL, '2024-12-31 23:59:59.5', '2024-12-31', NULL)
+) AS v (id, cost, label, visited_at, visit_date, flag)
+WHERE id >= %(min_id)s
+"""
+
+
+@pytest.fixture
+def connector(db_schema):
+    with PostgresConnectionPool(min_size=1, max_size=2) as pool:
+        with PostgresConnectorContextManager(pool=pool) as connection_object:
+            yield connection_object
+
+
+@pytest.mark.postgres
+def test_arrow_sql_derives_the_schema_from_the_column_types(connector):
+    table = connector.get_arrow_sql(TYPED_VALUES_QUERY, params={'min_id': 1})
+    assert table.schema == pa.schema([
+        ('id', pa.int32()), ('cost', pa.float64()), ('label', pa.string()), ('visited_at', pa.timestamp('us')),
+        ('visit_date', pa.date32()), ('flag', pa.bool_())
+    ])
+    assert table.to_pylist() == [
+        {'id': 1, 'cost': 10.25, 'label': 'a', 'visited_at': datetime(2024, 1, 2, 3, 4, 5),
+         'visit_date': date(2024, 1, 2), 'flag': True},
+        {'id': 2, 'cost': None, 'label': '', 'visited_at': None, 'visit_date': None, 'flag': False},
+        {'id': 3, 'cost': 0.5, 'label': None, 'visited_at': datetime(2024, 12, 31, 23, 59, 59, 500000),
+         'visit_date': date(2024, 12, 31), 'flag': None}
+    ]
+
+
+@pytest.mark.postgres
+def test_arrow_sql_casts_to_the_declared_schema(connector):
+    schema = pa.schema([('id', pa.int64()), ('cost', pa.float64()), ('label', pa.string()),
+                        ('visited_at', pa.timestamp('ns')), ('visit_date', pa.timestamp('ns')), ('flag', pa.bool_())])
+    table = connector.get_arrow_sql(TYPED_VALUES_QUERY, schema, {'min_id': 3})
+    assert table.schema == schema
+    assert table.column('visit_date').to_pylist()[0].isoformat() == '2024-12-31T00:00:00'
+    assert table.num_rows == 1
+
+
+
+def test_session_options_escape_spaces_and_backslashes():
+    assert session_options({}) == ''
+    assert session_options({'work_mem': '64MB', 'statement_timeout': 3600}) == \
+        '-c work_mem=64MB -c statement_timeout=3600'
+    assert session_options({'application_name': 'data dev\\x'}) == '-c application_name=data\\ dev\\\\x'
+
+
+def show(conn, setting):
+    with conn.cursor() as cursor:
+        cursor.execute(f"SHOW {setting}")
+        return cursor.fetchone()[0]
+
+
+@pytest.mark.postgres
+def test_pooled_connections_get_the_session_settings(db_schema):
+    settings = {**postgres_pool_config.session_settings, 'work_mem': '7MB', 'application_name': 'data dev'}
+    with PostgresConnectionPool(min_size=1, max_size=2, session_settings=settings) as pool:
+        with pool.connection() as conn:
+            assert (show(conn, 'work_mem'), show(conn, 'application_name')) == ('7MB', 'data dev')
+
+
+@pytest.mark.postgres
+def test_broken_connections_are_replaced_on_checkout(db_schema):
+    with PostgresConnectionPool(min_size=1, max_size=1, health_check=True) as pool:
+        with pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_backend_pid()")
+                pid = cursor.fetchone()[0]
+            conn.rollback()
+        with db_schema.cursor() as cursor:
+            cursor.execute("SELECT pg_terminate_backend(%s)", (pid,))
+        db_schema.rollback()
+        with pool.connection() as conn:
+            assert show(conn, 'work_mem')
+
+
+@pytest.mark.postgres
+def test_health_checks_are_not_recorded_in_the_query_metrics(db_schema, monkeypatch):
+    monkeypatch.setattr(query_metrics_config, 'enabled', True)
+    monkeypatch.setattr(query_metrics_config, 'explain', False)
+    metrics = QueryMetrics()
+    monkeypatch.setattr(query_metrics, 'run_metrics', metrics)
+    with PostgresConnectionPool(min_size=1, max_size=1, health_check=True) as pool:
+        for _ in range(3):
+            with pool.connection() as conn:
+                show(conn, 'work_mem')
+    assert [row['calls'] for row in metrics.summary()] == [3]
+    assert 'sql:SELECT 1' not in metrics.queries
+
+
+@pytest.mark.postgres
+def test_checkout_waits_for_a_returned_connection(db_schema):
+    with PostgresConnectionPool(min_size=1, max_size=1) as pool:
+        conn = pool.getconn()
+        checked_out = threading.Event()
+
+        def checkout():
+            with pool.connection():
+                checked_out.set()
+
+        thread = threading.Thread(target=checkout)
+        thread.start()
+        assert not checked_out.wait(0.2)
+        pool.putconn(conn)
+        assert checked_out.wait(5)
+        thread.join()
+
+
+def test_data_frames_coerce_decimals_to_floats_unless_a_decimal_dtype_is_given():
+    rows = [(1, Decimal('10.25'), 'Clinic'), (2, Decimal('0.10'), 'Hospital'), (3, None, 'Clinic')]
+    columns = ['id', 'cost', 'facility_type']
+    df = PostgresConnectorContextManager.to_data_frame(rows, columns)
+    assert df['cost'].dtype == 'float64'
+    assert df['cost'].tolist()[:2] == [10.25, 0.1]
+
+    decimal = pd.ArrowDtype(pa.decimal128(10, 2))
+    df = PostgresConnectorContextManager.to_data_frame(rows, columns, {'id': 'int32', 'cost': decimal,
+                                                                       'facility_type': 'category'})
+    assert df.dtypes.to_dict() == {'id': 'int32', 'cost': decimal, 'facility_type': 'category'}
+    assert df['cost'].tolist()[:2] == [Decimal('10.25'), Decimal('0.10')]
+    assert df['cost'].isna().tolist() == [False, False, True]
+
+
+@pytest.mark.postgres
+@pytest.mark.parametrize('arrow', [False, True])
+def test_data_is_fetched_in_chunks(connector, arrow):
+    query = "SELECT i AS id, i * 0.5 AS cost FROM generate_series(1, %(rows)s) AS i ORDER BY i"
+    chunks = list(connector.iter_data_sql(query, {'rows': 25}, chunk_size=10, dtypes={'id': 'int32'}, arrow=arrow))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    if arrow:
+        assert chunks[0].schema.field('id').type == pa.int32()
+        chunks = [chunk.to_pandas() for chunk in chunks]
+    df = pd.concat(chunks, ignore_index=True)
+    assert df.equals(connector.get_data_sql(query, {'rows': 25}, dtypes={'id': 'int32'}))
+    assert df['cost'].iloc[-1] == 12.5
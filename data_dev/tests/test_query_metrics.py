@@ -0,0 +1,91 @@
+import io
+import json
+
+import pytest
+
+from data_dev import queries
+from data_dev.config import query_metrics_config
+from data_dev.src.connectors.postgre_connector import PostgresConnectionPool
+from data_dev.src.monitoring import query_metrics
+from data_dev.src.monitoring.query_metrics import QueryMetrics, estimate_bytes, normalize, query_name
+
+
+def test_statements_are_named_after_their_template():
+    assert query_name(queries.SELECT_NF3_WATERMARK_QUERY) == 'SELECT_NF3_WATERMARK_QUERY'
+    rendered = queries.MERGE_VISITS_INCREMENTAL_QUERY.replace('%(watermark)s', "'2024-01-01'::TIMESTAMP").replace(
+        '%(date_scope)s', "'2024-03-15'")
+    assert query_name(f"  {rendered}\n") == 'MERGE_VISITS_INCREMENTAL_QUERY'
+    transform = queries.TRANSFORM_PATIENT_SUM_TREATMENT_COST_PER_FACILITY_TYPE_SQL.strip().rstrip(';')
+    copy_to = f"COPY ({transform}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+    assert query_name(copy_to) == 'TRANSFORM_PATIENT_SUM_TREATMENT_COST_PER_FACILITY_TYPE_SQL'
+    assert query_name("SELECT  1 AS one,\n 2 AS two FROM somewhere WHERE x;") == 'sql:SELECT 1 AS one, 2 AS'
+
+
+def test_normalize_and_estimate_bytes():
+    assert normalize(" SELECT\n\t1 ;  ") == 'SELECT 1'
+    assert estimate_bytes([('abc', 1, None, b'12'), ('', 2.5, True, None)]) == 3 + 8 + 2 + 0 + 8 + 8
+
+
+def test_metrics_are_summed_per_query_and_written_slowest_first(tmp_path):
+    metrics = QueryMetrics()
+    metrics.record('A', 0.5, rows=10)
+    metrics.record('A', 0.25, rows=5, num_bytes=100, calls=0)
+    metrics.record('B', 1.0, rows=1)
+    assert metrics.claim_plan('B') and not metrics.claim_plan('B')
+    metrics.add_plan('B', [{'Plan': {}}])
+
+    assert metrics.summary() == [
+        {'name': 'B', 'calls': 1, 'seconds': 1.0, 'rows': 1, 'bytes': 0, 'sent_bytes': 0},
+        {'name': 'A', 'calls': 1, 'seconds': 0.75, 'rows': 15, 'bytes': 100, 'sent_bytes': 0}
+    ]
+    with open(metrics.write(str(tmp_path))) as metrics_file:
+        written = json.load(metrics_file)
+    assert written['queries'] == metrics.summary()
+    assert written['plans'] == {'B': [{'Plan': {}}]}
+
+
+@pytest.mark.postgres
+def test_instrumented_connections_record_queries_and_explain_them_once(db_schema, monkeypatch):
+    monkeypatch.setattr(query_metrics_config, 'enabled', True)
+    monkeypatch.setattr(query_metrics_config, 'explain', True)
+    metrics = QueryMetrics()
+    monkeypatch.setattr(query_metrics, 'run_metrics', metrics)
+
+    with PostgresConnectionPool(min_size=1, max_size=1, health_check=False) as pool:
+        with pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(queries.CREATE_NF3_LOAD_STATE_TABLE_QUERY)
+                for day in ('2024-01-01', '2024-01-02'):
+                    cursor.execute(queries.UPSERT_NF3_WATERMARK_QUERY, {'last_visit_timestamp': day})
+                cursor.execute(queries.SELECT_NF3_WATERMARK_QUERY)
+                assert str(cursor.fetchone()[0]) == '2024-01-02 00:00:00'
+            conn.commit()
+
+    summary = {row['name']: row for row in metrics.summary()}
+    assert summary['UPSERT_NF3_WATERMARK_QUERY']['calls'] == 2
+    assert summary['UPSERT_NF3_WATERMARK_QUERY']['rows'] == 2
+    assert summary['SELECT_NF3_WATERMARK_QUERY']['bytes'] == 8
+    assert sorted(name for name, plan in metrics.plans.items() if plan is not None) == [
+        'SELECT_NF3_WATERMARK_QUERY', 'UPSERT_NF3_WATERMARK_QUERY'
+    ]
+
+
+@pytest.mark.postgres
+def test_copy_records_loaded_bytes_as_sent_and_exported_bytes_as_fetched(db_schema, monkeypatch):
+    monkeypatch.setattr(query_metrics_config, 'enabled', True)
+    monkeypatch.setattr(query_metrics_config, 'explain', False)
+    metrics = QueryMetrics()
+    monkeypatch.setattr(query_metrics, 'run_metrics', metrics)
+
+    with PostgresConnectionPool(min_size=1, max_size=1, health_check=False) as pool:
+        with pool.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("CREATE TABLE copied (value TEXT)")
+                cursor.copy_expert("COPY copied FROM STDIN", io.StringIO("abc\ndef\n"))
+                cursor.copy_expert("COPY (SELECT value FROM copied) TO STDOUT", io.StringIO())
+            conn.rollback()
+
+    loaded = metrics.queries['sql:COPY copied FROM STDIN']
+    exported = metrics.queries['sql:COPY (SELECT value FROM copied) TO']
+    assert (loaded['rows'], loaded['bytes'], loaded['sent_bytes']) == (2, 0, 8)
+    assert (exported['rows'], exported['bytes'], exported['sent_bytes']) == (2, 8, 0)
@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+
+from data_dev.src.data.value_pool import POOL_COLUMNS, FakerValuePool, load_pool, sample_pool
+
+
+def test_pool_is_built_once_and_cached(tmp_path):
+    pool = FakerValuePool(pool_size=4, cache_dir=str(tmp_path / 'cache'), seed=3)
+    path = pool.ensure_cached()
+    modified = os.stat(path).st_mtime_ns
+    assert pool.ensure_cached() == path
+    assert os.stat(path).st_mtime_ns == modified
+    values = pool.load()
+    assert set(values) == set(POOL_COLUMNS)
+    assert all(len(column) == 4 for column in values.values())
+
+
+def test_seeded_pools_are_identical(tmp_path):
+    first = FakerValuePool(pool_size=5, cache_dir=str(tmp_path / 'first'), seed=11).load()
+    second = FakerValuePool(pool_size=5, cache_dir=str(tmp_path / 'second'), seed=11).load()
+    for column, values in first.items():
+        assert list(values) == list(second[column])
+
+
+def test_samples_are_drawn_from_the_pool(tmp_path):
+    pool = load_pool(FakerValuePool(pool_size=3, cache_dir=str(tmp_path), seed=5).ensure_cached())
+    sampled = sample_pool(np.random.default_rng(0), pool, 'last_name', 100)
+    assert len(sampled) == 100
+    assert set(sampled) <= set(pool['last_name'])